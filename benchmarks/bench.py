@@ -0,0 +1,281 @@
+"""
+Benchmarks of the environment step, data loading, logging overhead, PPO training throughput and import times.
+
+All benchmarks run on a synthetic dataset (see synthetic_data.py) in a temporary directory, so they
+neither need nor touch the data folder. Usage from the repository root:
+
+    python -m benchmarks.bench                       # run and compare with benchmarks/baseline.json
+    python -m benchmarks.bench --output results.json
+    python -m benchmarks.bench --save-baseline       # store the results as new baseline
+    python -m benchmarks.bench --imports-only        # only check the import time budget
+
+The exit code is 1 if any result is worse than the baseline by more than the tolerance, an import exceeds its
+budget or loads one of the heavy dependencies.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_data import create_synthetic_data
+
+repo_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+baseline_path = os.path.join(repo_path, "benchmarks", "baseline.json")
+# Modules used by the command line entry point (python -m src) and for serving, with their import time budget in
+# seconds. They must not import the heavy dependencies, these are only loaded by the commands that need them
+import_budgets = {"src.main": 0.1, "src.get_data": 0.5, "src.simulate": 0.5, "src.numpy_policy": 0.5,
+                  "src.fleet": 0.5}
+heavy_modules = ("gym", "gymnasium", "pandas", "stable_baselines3", "torch")
+action_spaces = {"solar": {"wind": False, "wind_generator": False},
+                 "wind": {"wind": True, "wind_generator": False},
+                 "wind_generator": {"wind": False, "wind_generator": True}}
+
+
+def best_time(func, repeat=5):
+    """Shortest wall time of repeat calls of func, in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def result(value, unit, higher_is_better):
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+
+def bench_env_step(data_dict, n_steps=8_000):
+    from src.microgrid_env import MicrogridEnv
+
+    results = {}
+    for name, kwargs in action_spaces.items():
+        env = MicrogridEnv(data_dict, **kwargs)
+        env.action_space.seed(0)
+        actions = [env.action_space.sample() for _ in range(n_steps)]
+
+        def run():
+            env.reset()
+            for action in actions:
+                if env.step(action)[2]:
+                    env.reset()
+
+        results[f"env_step_{name}"] = result(n_steps / best_time(run), "steps/s", True)
+    return results
+
+
+def bench_data_loading(k=10, region="CA"):
+    """
+    Loading time of get_data_dict without any cache ("cold"), from the demand cache and memo files on disk as in
+    a new process ("warm") and from the in-process memo ("lru")
+    """
+    from src.get_data import get_data_dict, cache_path, clear_memo
+
+    def cold():
+        shutil.rmtree(cache_path, ignore_errors=True)
+        clear_memo()
+        get_data_dict(k, region)
+
+    def warm():
+        clear_memo()
+        get_data_dict(k, region)
+
+    cold_time = best_time(cold)
+    warm_time = best_time(warm)
+    get_data_dict(k, region)
+    lru_time = best_time(lambda: get_data_dict(k, region))
+    return {"get_data_dict_cold": result(cold_time, "s", False),
+            "get_data_dict_warm": result(warm_time, "s", False),
+            "get_data_dict_lru": result(lru_time, "s", False)}
+
+
+def bench_logging(data_dict, n_steps=8_000, interval=100):
+    """Time per step of rendering the step (as RenderCallback) and of the telemetry recorder"""
+    from src.microgrid_env import MicrogridEnv
+    from src.telemetry import TelemetryRecorder
+
+    env = MicrogridEnv(data_dict)
+    env.action_space.seed(0)
+    actions = [env.action_space.sample() for _ in range(n_steps)]
+
+    def step_only():
+        env.reset()
+        for action in actions:
+            if env.step(action)[2]:
+                env.reset()
+
+    def step_render():
+        env.reset()
+        info = []
+        for i, action in enumerate(actions):
+            if env.step(action)[2]:
+                env.reset()
+            if i % interval == 0:
+                info.append(env.render())
+
+    def render_every_step():
+        env.reset()
+        for action in actions:
+            if env.step(action)[2]:
+                env.reset()
+            env.render()
+
+    step_time = best_time(step_only)
+    render_time = best_time(step_render)
+    render_call_time = (best_time(render_every_step) - step_time) / n_steps
+
+    env.telemetry = TelemetryRecorder(sample_interval=interval)
+    telemetry_time = best_time(step_only)
+    env.telemetry = None
+    return {"render_call": result(render_call_time * 1e6, "us", False),
+            "render_callback_overhead": result((render_time - step_time) / n_steps * 1e6, "us/step", False),
+            "telemetry_overhead": result((telemetry_time - step_time) / n_steps * 1e6, "us/step", False)}
+
+
+def bench_ppo(data_dict, total_timesteps=2_048):
+    from stable_baselines3 import PPO
+    from src.microgrid_env import MicrogridEnv
+
+    env = MicrogridEnv(data_dict, wind=False, wind_generator=True)
+    model = PPO("MlpPolicy", env, n_steps=512, batch_size=64, n_epochs=2, device="cpu")
+    seconds = best_time(lambda: model.learn(total_timesteps=total_timesteps), repeat=1)
+    return {"ppo_learn": result(total_timesteps / seconds, "timesteps/s", True)}
+
+
+def bench_import_time(repeat=5, modules=None):
+    """Import time of the modules of import_budgets in a fresh interpreter and the number of heavy modules they load"""
+    results = {}
+    for module in modules or import_budgets:
+        code = (f"import sys, time; start = time.perf_counter(); import {module}; "
+                f"print(time.perf_counter() - start, sum(name in sys.modules for name in {heavy_modules!r}))")
+        times = []
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, "-c", code], cwd=repo_path, capture_output=True, text=True,
+                                    check=True).stdout.split()
+            times.append(float(output[0]))
+        name = module.replace(".", "_")
+        results[f"import_{name}"] = result(min(times), "s", False)
+        results[f"import_{name}_heavy_modules"] = result(int(output[1]), "modules", False)
+    return results
+
+
+def check_import_budgets(results):
+    """Names of the import results above their budget or with heavy modules"""
+    violations = []
+    for module, budget in import_budgets.items():
+        name = module.replace(".", "_")
+        if f"import_{name}" not in results:
+            continue
+        if results[f"import_{name}"]["value"] > budget:
+            print(f"import {module} took {results[f'import_{name}']['value']:.3f} s, budget {budget} s")
+            violations.append(f"import_{name}")
+        if results[f"import_{name}_heavy_modules"]["value"] > 0:
+            print(f"import {module} loads one of {', '.join(heavy_modules)}")
+            violations.append(f"import_{name}_heavy_modules")
+    return violations
+
+
+def run_benchmarks(quick=False):
+    from src.get_data import get_data_dict
+
+    results = bench_import_time()
+    results.update(bench_data_loading())
+    data_dict = get_data_dict(k=10, region="CA")
+    n_steps = 2_000 if quick else 8_000
+    results.update(bench_env_step(data_dict, n_steps=n_steps))
+    results.update(bench_logging(data_dict, n_steps=n_steps))
+    results.update(bench_ppo(data_dict, total_timesteps=1_024 if quick else 2_048))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Names of the results that are worse than in the baseline by more than tolerance (relative)"""
+    regressions = []
+    for name, entry in results.items():
+        if name not in baseline:
+            continue
+        reference = baseline[name]["value"]
+        value = entry["value"]
+        if entry["higher_is_better"]:
+            regressed = value < reference * (1 - tolerance)
+        else:
+            # Overheads close to zero are dominated by noise, only flag them if they grew by more than 1 us
+            noise_floor = 1 if entry["unit"].startswith("us") else 0
+            regressed = value > reference * (1 + tolerance) and value - reference > noise_floor
+        change = (value - reference) / abs(reference) if reference else float("inf") if value != reference else 0.
+        print(f"{name:34s} {value:14.2f} {entry['unit']:12s} baseline {reference:14.2f} ({change:+.1%})"
+              f"{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the microgrid environment on synthetic data")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", default=baseline_path, help="baseline JSON to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed relative slowdown")
+    parser.add_argument("--quick", action="store_true", help="fewer steps, for a quick check")
+    parser.add_argument("--imports-only", action="store_true", help="only measure the import times")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_file = os.path.abspath(args.baseline)
+    sys.path.insert(0, repo_path)
+
+    # The data paths in src.get_data are relative, so the benchmarks run in the synthetic data directory
+    cwd = os.getcwd()
+    if args.imports_only:
+        results = bench_import_time()
+    else:
+        with tempfile.TemporaryDirectory() as root:
+            create_synthetic_data(root)
+            os.chdir(root)
+            try:
+                results = run_benchmarks(quick=args.quick)
+            finally:
+                os.chdir(cwd)
+
+    report = {"meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                       "numpy": np.__version__, "platform": platform.platform(), "cpus": os.cpu_count(),
+                       "quick": args.quick},
+              "results": results}
+    violations = check_import_budgets(results)
+    if output:
+        with open(output, "w") as file:
+            json.dump(report, file, indent=4)
+    if args.save_baseline:
+        if args.imports_only and os.path.exists(baseline_file):
+            # Only replace the import times in the baseline
+            with open(baseline_file, "r") as file:
+                report["results"] = dict(json.load(file)["results"], **results)
+        with open(baseline_file, "w") as file:
+            json.dump(report, file, indent=4)
+        print(f"Saved baseline to {baseline_file}")
+        return 0
+
+    if not os.path.exists(baseline_file):
+        print(json.dumps(results, indent=4))
+        print(f"No baseline found at {baseline_file}, run with --save-baseline to create one")
+        return 1 if violations else 0
+    with open(baseline_file, "r") as file:
+        baseline = json.load(file)["results"]
+    regressions = compare(results, baseline, args.tolerance)
+    regressions += [name for name in violations if name not in regressions]
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
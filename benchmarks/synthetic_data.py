@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+
+# Hours of a household profile, the environment data is 120 hours shorter (see get_energy_demand_data)
+household_hours = 8760
+environment_hours = household_hours - 120
+
+household_columns = ["Electricity:Facility [kW](Hourly)", "Gas:Facility [kW](Hourly)",
+                     "Heating:Electricity [kW](Hourly)"]
+regions = {"CA": 30, "AZ": 12, "NV": 12, "TX": 12, "NM": 12, "FL": 12, "LA": 12, "IA": 12}
+
+
+def write_csv(path, header, columns):
+    """Write columns with a leading index column, like the original data files"""
+    index = np.arange(len(columns[0]))
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(",".join(header) + "\n")
+        np.savetxt(file, np.column_stack([index] + list(columns)), delimiter=",",
+                   fmt=["%d"] + ["%.6f"] * len(columns))
+
+
+def create_synthetic_data(root, n_short_households=2, seed=0):
+    """
+    Write a synthetic dataset with the schema of the data folder (see README) to root/data.
+
+    Every region of regions gets that many household profiles with a daily and seasonal
+    demand pattern, plus n_short_households profiles in CA with less than a year of data,
+    which get_energy_demand_data has to skip.
+    """
+    rng = np.random.default_rng(seed)
+    data_path = os.path.join(root, "data")
+    household_path = os.path.join(data_path, "residential_load_data_base")
+    os.makedirs(household_path, exist_ok=True)
+
+    hours = np.arange(environment_hours)
+    daily = np.clip(np.sin((hours % 24 - 6) / 12 * np.pi), 0, None)
+    seasonal = 1 + 0.3 * np.sin(hours / environment_hours * 2 * np.pi)
+    solar_irradiance = 900 * daily * seasonal * rng.uniform(0.5, 1, environment_hours)
+    wind_speed = np.abs(4 + np.cumsum(rng.normal(scale=0.3, size=environment_hours + 2)) % 8)
+    price = np.where((hours % 24 >= 8) & (hours % 24 < 20), 0.08, 0.04)
+    write_csv(os.path.join(data_path, "SolarIrradiance.csv"), ["Date", "Avg Global Horizontal [W/m^2]"],
+              [solar_irradiance])
+    write_csv(os.path.join(data_path, "WindSpeed.csv"), ["Date", "Wind Speed  "], [wind_speed])
+    write_csv(os.path.join(data_path, "rate_consumption_charge.csv"), ["Date", "Grid Elecricity Price（$/kWh）"],
+              [price])
+
+    household_hours_of_day = np.arange(household_hours) % 24
+    profile = 1 + np.sin((household_hours_of_day - 12) / 24 * 2 * np.pi) ** 2
+    files = [(region, i, household_hours) for region, n in regions.items() for i in range(n)]
+    files += [("CA", regions["CA"] + i, household_hours - 760) for i in range(n_short_households)]
+    for region, i, n_hours in files:
+        demand = profile[:n_hours] * rng.uniform(0.5, 2) * rng.lognormal(sigma=0.3, size=n_hours)
+        write_csv(os.path.join(household_path, f"USA_{region}_Site{i}.{720000 + i}_TMY3_BASE.csv"),
+                  ["Date/Time"] + household_columns, [demand, 0.3 * demand, 0.1 * demand])
+    return data_path
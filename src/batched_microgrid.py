@@ -0,0 +1,246 @@
+from src.params import *
+# Column indices of the (n_envs, 3) working status / adjusting status and (n_envs, 2) purchased actions arrays
+from src.microgrid import SOLAR, WIND, GENERATOR, LOAD, BATTERY
+from src.microgrid import potential_energy_solar, potential_energy_wind, potential_energy_generator
+
+
+def get_batched_action_dict(actions, wind=False, wind_generator=False):
+    """
+    Batched counterpart of MicrogridEnv.get_action_dict.
+
+    Params:
+        actions: integer array of shape (n_envs, n_actions) with one MultiDiscrete
+            action of the MicrogridEnv action space per row
+        wind: actions follow the solar + wind layout (question 2)
+        wind_generator: actions follow the solar + wind + generator layout (question 3)
+    """
+    actions = np.asarray(actions)
+    n_envs = actions.shape[0]
+    zeros = np.zeros(n_envs, dtype=actions.dtype)
+
+    # actions = [2, 2, 2, 3, 2]
+    action_dict = {
+        "purchased": actions[:, 0:2],
+        "discharged": actions[:, 2],
+        "solar": actions[:, 3],
+        "wind": zeros,
+        "generator": zeros,
+        "adjusting_status": np.column_stack([actions[:, 4], zeros, zeros]),  # wind and generator are always off
+    }
+
+    if wind and not wind_generator:
+        # actions = [2, 2, 2, 3, 3, 2, 2]
+        action_dict.update({"wind": actions[:, 4],
+                            "adjusting_status": np.column_stack([actions[:, 5:7], zeros])})  # generator always off
+    elif wind_generator:
+        # actions = [2, 2, 2, 3, 3, 3, 2, 2, 2]
+        action_dict.update({"wind": actions[:, 4], "generator": actions[:, 5],
+                            "adjusting_status": actions[:, 6:9]})
+
+    return action_dict
+
+
+class BatchedMicrogrid(object):
+    """
+    Vectorized version of Microgrid that advances n_envs independent grids at once.
+
+    All state (SOC, working status, actions, ...) is kept as NumPy arrays with the
+    grid index as first axis. Every method mirrors the method of the same name in
+    Microgrid and returns one value per grid, e.g. cost_of_epoch() returns an array
+    of shape (n_envs,) whose entries equal the costs of n_envs scalar Microgrids
+    given the same actions and data.
+    """
+
+    def __init__(self, n_envs=1, alternative_cost=False, generation_tables=None):
+        self.n_envs = n_envs
+        self.alternative_cost = alternative_cost
+        self.generation_tables = generation_tables  # precomputed potential energy per hour, see get_generation_tables
+
+        # Environment
+        self.energy_for_battery_bought = np.zeros(n_envs)
+        self.energy_for_load_bought = np.zeros(n_envs)
+        self.energy_total = np.zeros(n_envs)
+        self.working_status = np.zeros((n_envs, 3), dtype=np.int64)
+        self.energy_demand = np.zeros(n_envs)
+        self.soc = np.zeros(n_envs)
+        self.solar_irradiance = np.zeros(n_envs)
+        self.wind_speed = np.zeros(n_envs)
+        self.energy_price_utility_grid = np.zeros(n_envs)
+        self.operational_cost_battery = np.zeros(n_envs)
+        self.energy_purchased = np.zeros(n_envs)
+        self.energy_solar = np.zeros(n_envs)
+        self.energy_wind = np.zeros(n_envs)
+        self.energy_generator = np.zeros(n_envs)
+
+        # Actions
+        self.actions_adjusting_status = np.zeros((n_envs, 3), dtype=np.int64)
+        self.actions_solar = np.zeros(n_envs, dtype=np.int64)
+        self.actions_wind = np.zeros(n_envs, dtype=np.int64)
+        self.actions_generator = np.zeros(n_envs, dtype=np.int64)
+        self.actions_purchased = np.zeros((n_envs, 2), dtype=np.int64)
+        self.actions_discharged = np.zeros(n_envs, dtype=np.int64)
+
+        self.reset()
+
+    def reset(self, mask=None, soc=soc_min):
+        """
+        Reset all grids, or only the grids selected by a boolean mask, to the default Microgrid state.
+        soc is the initial SOC, a scalar or one value per reset grid.
+        """
+        idx = slice(None) if mask is None else mask
+
+        self.energy_for_battery_bought[idx] = 0
+        self.energy_for_load_bought[idx] = 0
+        self.energy_total[idx] = 0
+        self.working_status[idx] = [1, 0, 0]
+        self.energy_demand[idx] = 34
+        self.soc[idx] = soc
+        self.solar_irradiance[idx] = 0.1
+        self.wind_speed[idx] = 40
+        self.energy_price_utility_grid[idx] = 0.6
+        self.operational_cost_battery[idx] = 0
+        self.energy_purchased[idx] = 0
+
+        self.actions_adjusting_status[idx] = 0
+        self.actions_solar[idx] = 0
+        self.actions_wind[idx] = 0
+        self.actions_generator[idx] = 0
+        self.actions_purchased[idx] = 0
+        self.actions_discharged[idx] = 0
+
+        # Generated energy of the default state (only solar is working)
+        self.energy_solar[idx] = potential_energy_solar(self.solar_irradiance[idx])
+        self.energy_wind[idx] = 0
+        self.energy_generator[idx] = 0
+
+    def update_actions(self, action):
+        self.actions_adjusting_status[:] = action["adjusting_status"]
+        self.actions_solar[:] = action["solar"]
+        self.actions_wind[:] = action["wind"]
+        self.actions_generator[:] = action["generator"]
+        self.actions_purchased[:] = action["purchased"]
+        self.actions_discharged[:] = action["discharged"]
+
+    def update_working_status(self):
+        self.working_status[:, SOLAR] = self.actions_adjusting_status[:, SOLAR]
+        self.working_status[:, GENERATOR] = self.actions_adjusting_status[:, GENERATOR]
+
+        # Uses the wind speed of the previous epoch, exactly like Microgrid
+        wind_off = (self.wind_speed > cutoff_windspeed) | (self.wind_speed < cutin_windspeed)
+        self.working_status[:, WIND] = np.where(wind_off, 0, self.actions_adjusting_status[:, WIND])
+
+    def update_environment(self, data_dict, step_count):
+        """
+        Params:
+            data_dict: hourly environment data, see MicrogridEnv
+            step_count: index into data_dict, either shared by all grids (int) or
+                one index per grid (integer array of shape (n_envs,))
+        """
+        self.energy_demand[:] = data_dict["energy_demand"][step_count]
+        self.solar_irradiance[:] = data_dict["solar_irradiance"][step_count]
+        self.wind_speed[:] = data_dict["wind_speed"][step_count]
+        self.energy_price_utility_grid[:] = data_dict["rate_consumption_charge"][step_count]
+        self.update_generation(step_count)
+
+        energy_solar = self.energy_solar
+        energy_wind = self.energy_wind
+        energy_generator = self.energy_generator
+
+        # Production (adding 0 where a branch of Microgrid is not taken keeps the results identical)
+        energy_total = np.zeros(self.n_envs)
+        energy_total += np.where(self.actions_solar == 0, energy_solar, 0)
+        energy_total += np.where(self.actions_wind == 0, energy_wind, 0)
+        energy_total += np.where(self.actions_generator == 0, energy_generator, 0)
+
+        discharged = self.actions_discharged == 1
+        energy_total += np.where(discharged, self.soc - soc_min, 0)
+        soc = np.where(discharged, soc_min, self.soc)
+
+        # Buy energy from grid to meet demand (assumption to reduce action complexity)
+        buy_load = (self.actions_purchased[:, LOAD] != 0) & (self.energy_demand > energy_total)
+        self.energy_for_load_bought = np.where(buy_load, self.energy_demand - energy_total,
+                                               self.energy_for_load_bought)
+        energy_total += np.where(buy_load, self.energy_for_load_bought, 0)
+
+        # Battery
+        operational_cost_battery = np.zeros(self.n_envs)
+        for energy, actions in ((energy_solar, self.actions_solar),
+                                (energy_wind, self.actions_wind),
+                                (energy_generator, self.actions_generator)):
+            charging = actions == 1
+            soc += np.where(charging, energy * charging_discharging_efficiency, 0)
+            operational_cost_battery += np.where(charging, energy, 0)
+
+        soc = np.where(soc > soc_max, soc_max, soc)
+
+        # Buy energy from grid to fully load battery (assumption to reduce action complexity)
+        buy_battery = self.actions_purchased[:, BATTERY] == 1
+        self.energy_for_battery_bought = np.where(buy_battery, soc_max - soc, self.energy_for_battery_bought)
+        soc = np.where(buy_battery, soc_max, soc)
+        operational_cost_battery += np.where(buy_battery, self.energy_for_battery_bought, 0)
+
+        self.energy_total = energy_total
+        self.soc = soc
+        self.operational_cost_battery = operational_cost_battery
+
+    def transition(self, action, data_dict, step_count):
+        self.update_actions(action)
+        self.update_working_status()
+        self.update_environment(data_dict, step_count)
+
+    def update_generation(self, step_count):
+        # Look up the potential energy of the current epoch if the tables are available, compute it otherwise
+        if self.generation_tables is not None:
+            solar = self.generation_tables["solar"][step_count]
+            wind = self.generation_tables["wind"][step_count]
+            generator = self.generation_tables["generator"][step_count]
+        else:
+            solar = potential_energy_solar(self.solar_irradiance)
+            wind = potential_energy_wind(self.wind_speed)
+            generator = potential_energy_generator()
+
+        working_status = self.working_status
+        self.energy_solar = np.where(working_status[:, SOLAR] > 0, working_status[:, SOLAR] * solar, 0)
+        self.energy_wind = np.where(working_status[:, WIND] > 0, working_status[:, WIND] * wind, 0)
+        self.energy_generator = np.where(working_status[:, GENERATOR] > 0, working_status[:, GENERATOR] * generator,
+                                         0)
+
+    def energy_generated_solar(self):
+        return self.energy_solar
+
+    def energy_generated_wind(self):
+        return self.energy_wind
+
+    def energy_generated_generator(self):
+        return self.energy_generator
+
+    def check_blackout(self):
+        return np.where(self.energy_total < self.energy_demand, blackout_cost, 0)
+
+    def operational_cost(self):
+        # Cost of operating solar, wind and generator production
+        operational_cost = self.energy_solar * unit_operational_cost_solar + \
+                           self.energy_wind * unit_operational_cost_wind + \
+                           self.energy_generator * unit_operational_cost_generator
+        # Cost of battery usage
+        operational_cost += self.operational_cost_battery * delta_t * unit_operational_cost_battery / \
+                            (2 * capacity_battery_storage * (soc_max - soc_min))
+        return operational_cost
+
+    def sell_back_reward(self):
+        sell_back_energy = np.zeros(self.n_envs)
+        sell_back_energy += np.where(self.actions_solar == 2, self.energy_solar * sell_back_energy_price, 0)
+        sell_back_energy += np.where(self.actions_wind == 2, self.energy_wind * sell_back_energy_price, 0)
+        sell_back_energy += np.where(self.actions_generator == 2, self.energy_generator * sell_back_energy_price, 0)
+        return sell_back_energy
+
+    def cost_of_epoch(self):
+        energy_purchased = self.energy_for_battery_bought + self.energy_for_load_bought
+        if self.alternative_cost:
+            self.energy_purchased = 0.25 * energy_purchased * energy_purchased * self.energy_price_utility_grid + \
+                                    0.5 * energy_purchased * self.energy_price_utility_grid
+        else:
+            self.energy_purchased = energy_purchased * self.energy_price_utility_grid
+
+        punishment_costs = self.check_blackout()
+        return self.energy_purchased + punishment_costs + self.operational_cost() - self.sell_back_reward()
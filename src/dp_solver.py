@@ -0,0 +1,272 @@
+import itertools
+
+from src.params import *
+from src.microgrid import Microgrid, get_generation_tables
+from src.batched_microgrid import get_batched_action_dict
+from src.env_layout import get_action_dims, get_action_layout
+
+
+def get_action_table(wind=False, wind_generator=True):
+    """
+    Enumerate the MultiDiscrete action space of MicrogridEnv without redundant actions.
+
+    The allocation (load, battery, sell) of a source that is switched off does not
+    change anything, so only one of these actions is kept. Returns an integer array
+    with one MicrogridEnv action per row and its decoded action dict.
+    """
+    dims = get_action_dims(wind, wind_generator)
+    actions = np.array(list(itertools.product(*[range(n) for n in dims])), dtype=np.int64)
+    action_dict = get_batched_action_dict(actions, wind=wind and not wind_generator, wind_generator=wind_generator)
+
+    allocation = np.column_stack([action_dict["solar"], action_dict["wind"], action_dict["generator"]])
+    status = action_dict["adjusting_status"]
+    keys = np.column_stack([action_dict["purchased"], action_dict["discharged"], status, allocation * status])
+    _, unique_index = np.unique(keys, axis=0, return_index=True)
+
+    actions = actions[np.sort(unique_index)]
+    return actions, get_batched_action_dict(actions, wind=wind and not wind_generator, wind_generator=wind_generator)
+
+
+def grid_position(grid, x):
+    """Index of the grid interval containing x and the weight of its upper end, for linear interpolation"""
+    index = np.clip(np.searchsorted(grid, x, side="right") - 1, 0, len(grid) - 2)
+    weight = np.clip((x - grid[index]) / (grid[index + 1] - grid[index]), 0, 1)
+    return index, weight
+
+
+def interpolate(value, grids, points):
+    """Multilinear interpolation of value, given on the product of grids, at the (broadcast) points"""
+    positions = [grid_position(grid, point) for grid, point in zip(grids, points)]
+    strides = np.cumprod((1,) + value.shape[:0:-1])[::-1]
+    flat_value = value.ravel()
+    result = 0
+    for corner in itertools.product((0, 1), repeat=len(grids)):
+        # Flat indices and weights are combined from the (smaller) per-axis arrays
+        index, weight = 0, 1
+        for (position, position_weight), stride, c in zip(positions, strides, corner):
+            index = index + (position + c) * stride
+            weight = weight * (position_weight if c else 1 - position_weight)
+        result = result + weight * flat_value[index]
+    return result
+
+
+class EpochModel(object):
+    """Vectorized cost and state transition of one decision epoch for all actions and a set of states"""
+
+    def __init__(self, data_dict, wind=False, wind_generator=True, alternative_cost=False):
+        self.data_dict = {key: np.asarray(value, dtype=np.float64) for key, value in data_dict.items()}
+        self.alternative_cost = alternative_cost
+        self.generation_tables = get_generation_tables(self.data_dict)
+        self.actions, action_dict = get_action_table(wind, wind_generator)
+
+        # Microgrid switches the wind turbine off based on the wind speed of the previous epoch (initially 40 km/h)
+        previous_wind_speed = np.concatenate([[40.], self.data_dict["wind_speed"][:-1]])
+        self.wind_available = ~((previous_wind_speed > cutoff_windspeed) | (previous_wind_speed < cutin_windspeed))
+
+        self.purchased_load = action_dict["purchased"][:, 0] != 0
+        self.purchased_battery = action_dict["purchased"][:, 1] == 1
+        self.discharged = action_dict["discharged"] == 1
+        self.status = action_dict["adjusting_status"] > 0
+        self.allocation = np.column_stack([action_dict["solar"], action_dict["wind"], action_dict["generator"]])
+
+    def epoch(self, t, soc, actions=slice(None)):
+        """
+        Transition of one epoch for a set of SOC values, without the cost of the energy
+        bought from the utility grid. The arithmetic follows Microgrid step by step.
+
+        Params:
+            t: hour of data_dict
+            soc: array of SOC values at the beginning of the epoch
+            actions: index of the evaluated rows of the action table
+        Returns:
+            arrays of shape (n_actions,) + soc.shape: the costs without the purchases,
+            the SOC at the end of the epoch, if and how much energy is bought for the
+            load and the amount bought for the battery, and if energy is bought for
+            the battery, of shape (n_actions,) + (1,) * soc.ndim
+        """
+        state_ndim = np.ndim(soc)
+
+        def per_action(x):
+            return x.reshape(x.shape[:1] + (1,) * state_ndim)
+
+        tables = self.generation_tables
+        status = self.status[actions]
+        allocation = self.allocation[actions]
+        energy = status * [tables["solar"][t], tables["wind"][t] * self.wind_available[t], tables["generator"][t]]
+        energy_demand = self.data_dict["energy_demand"][t]
+
+        # Production and discharging the battery
+        energy_total = 0
+        for source in range(3):
+            energy_total = energy_total + np.where(allocation[:, source] == 0, energy[:, source], 0)
+        discharged = per_action(self.discharged[actions])
+        energy_total = per_action(energy_total) + np.where(discharged, soc - soc_min, 0)
+        soc = np.where(discharged, soc_min, soc)
+        missing = energy_demand - energy_total
+        buy_load = per_action(self.purchased_load[actions]) & (missing > 0)
+        energy_total = np.where(buy_load, energy_total + missing, energy_total)
+        blackout = np.where(energy_total < energy_demand, blackout_cost, 0)
+
+        # Charging the battery
+        operational_cost_battery = 0
+        for source in range(3):
+            charge = per_action(np.where(allocation[:, source] == 1, energy[:, source], 0))
+            soc = soc + charge * charging_discharging_efficiency
+            operational_cost_battery = operational_cost_battery + charge
+        soc = np.minimum(soc, soc_max)
+        buy_battery = per_action(self.purchased_battery[actions])
+        battery_bought = soc_max - soc
+        operational_cost_battery = operational_cost_battery + np.where(buy_battery, battery_bought, 0)
+        soc = np.where(buy_battery, soc_max, soc)
+
+        operational_cost = per_action(energy @ [unit_operational_cost_solar, unit_operational_cost_wind,
+                                                unit_operational_cost_generator])
+        operational_cost = operational_cost + operational_cost_battery * delta_t * unit_operational_cost_battery / \
+            (2 * capacity_battery_storage * (soc_max - soc_min))
+        energy_sold = per_action(np.where(allocation == 2, energy, 0).sum(axis=1))
+        costs = blackout + operational_cost - energy_sold * sell_back_energy_price
+        return costs, soc, buy_load, missing, battery_bought, buy_battery
+
+    def purchase_cost(self, t, energy_purchased):
+        # Cost of the energy charged for the purchases in cost_of_epoch
+        price = self.data_dict["rate_consumption_charge"][t]
+        if self.alternative_cost:
+            return 0.25 * energy_purchased * energy_purchased * price + 0.5 * energy_purchased * price
+        return energy_purchased * price
+
+    def __call__(self, t, soc, load_bought=0., battery_bought=0., actions=slice(None)):
+        """
+        Cost and state transition of one epoch. The state of the Microgrid is its SOC
+        and the energy last bought for the load and for the battery, which Microgrid
+        charges again in every epoch until the next purchase overwrites it.
+
+        Params:
+            t: hour of data_dict
+            soc, load_bought, battery_bought: state at the beginning of the epoch,
+                arrays of the same shape
+            actions: index of the evaluated rows of the action table
+        Returns:
+            costs and the SOC, load_bought and battery_bought at the end of the
+            epoch, each of shape (n_actions,) + the shape of the state
+        """
+        costs, soc, buy_load, missing, new_battery_bought, buy_battery = self.epoch(t, soc, actions)
+        load_bought = np.where(buy_load, missing, load_bought)
+        battery_bought = np.where(buy_battery, new_battery_bought, battery_bought)
+        return self.purchase_cost(t, battery_bought + load_bought) + costs, soc, load_bought, battery_bought
+
+
+def get_action_values(model, t, next_value, grids, actions=slice(None)):
+    """
+    Cost of the actions in every grid state plus the value of the state they lead to.
+
+    A purchase that is not overwritten keeps its grid point, so the value function
+    is interpolated along the SOC axis for all states and along the purchase axes only
+    where an action buys energy.
+
+    Params:
+        model: EpochModel
+        t: hour of data_dict
+        next_value: value function of hour t + 1 on the grid, shape (n_soc, n_load, n_battery)
+        grids: SOC, load purchase and battery purchase grid
+        actions: index of the evaluated rows of the action table
+    Returns:
+        array of shape (n_actions, n_soc, n_load, n_battery)
+    """
+    soc_grid, load_grid, battery_grid = grids
+    costs, soc, buy_load, missing, battery_bought, buy_battery = model.epoch(t, soc_grid, actions)
+
+    index, weight = grid_position(soc_grid, soc)
+    weight = weight[..., None, None]
+    value = next_value[index] * (1 - weight) + next_value[index + 1] * weight
+
+    def interpolate_axis(values, grid, x, axis):
+        # Interpolate values along axis at x of shape (n_actions, n_soc)
+        index, weight = grid_position(grid, x)
+        index, weight = index[..., None, None], weight[..., None, None]
+        return np.take_along_axis(values, index, axis=axis) * (1 - weight) + \
+            np.take_along_axis(values, index + 1, axis=axis) * weight
+
+    value_load = interpolate_axis(value, load_grid, missing, axis=2)
+    value_battery = interpolate_axis(value, battery_grid, battery_bought, axis=3)
+    value_both = interpolate_axis(value_load, battery_grid, battery_bought, axis=3)
+    buy_load, buy_battery = buy_load[..., None, None], buy_battery[..., None, None]
+    value = np.where(buy_load, np.where(buy_battery, value_both, value_load),
+                     np.where(buy_battery, value_battery, value))
+
+    load_bought = np.where(buy_load, missing[..., None, None], load_grid[:, None])
+    battery_bought = np.where(buy_battery, battery_bought[..., None, None], battery_grid)
+    return model.purchase_cost(t, battery_bought + load_bought) + costs[..., None, None] + value
+
+
+def solve_optimal_cost(data_dict, wind=False, wind_generator=True, alternative_cost=False, n_soc=51, n_load=11,
+                       n_battery=6, action_chunk_size=64):
+    """
+    Minimum-cost trajectory of the Microgrid over all hours of data_dict by backward induction.
+
+    The state of an epoch is the SOC and the energy last bought from the utility grid
+    for the load and for the battery, which Microgrid charges again in every later
+    epoch until the next purchase overwrites it (see EpochModel). The state space is
+    discretized into n_soc SOC grid points between soc_min and soc_max, n_load
+    purchase grid points up to the highest demand and n_battery purchase grid points
+    up to soc_max - soc_min, the value function is interpolated multilinearly between
+    them. All (non-redundant) actions of the MicrogridEnv action space are evaluated
+    at once for every grid point, in chunks of action_chunk_size actions.
+
+    The forward pass starts from the initial state of Microgrid and follows the exact
+    (not discretized) states, so the returned cost is the cost of the returned actions
+    in MicrogridEnv. It is optimal up to the discretization of the value function,
+    finer grids bring it closer to the optimum.
+
+    Params:
+        data_dict: hourly environment data, see MicrogridEnv
+        wind, wind_generator, alternative_cost: see MicrogridEnv
+        n_soc, n_load, n_battery: number of grid points of the state, at least 2
+        action_chunk_size: number of actions evaluated at once, bounds the memory use
+    Returns:
+        dict with the "cost" of the forward pass, the approximate "value" of the
+        initial state, the per-hour "costs", "soc" and MicrogridEnv "actions" of the
+        trajectory and "env_cost"/"env_costs" of the actions replayed in Microgrid
+    """
+    if wind and wind_generator:
+        wind = False
+    if min(n_soc, n_load, n_battery) < 2:
+        raise Exception(f"At least 2 grid points per state variable are needed, got {n_soc}, {n_load}, {n_battery}")
+    model = EpochModel(data_dict, wind=wind, wind_generator=wind_generator, alternative_cost=alternative_cost)
+    n_hours = len(model.data_dict["wind_speed"])
+    n_actions = len(model.actions)
+    grids = (np.linspace(soc_min, soc_max, n_soc),
+             np.linspace(0, max(model.data_dict["energy_demand"].max(), 1e-9), n_load),
+             np.linspace(0, soc_max - soc_min, n_battery))
+
+    # Backward induction
+    value = np.zeros((n_hours + 1, n_soc, n_load, n_battery))
+    for t in reversed(range(n_hours)):
+        best = np.full((n_soc, n_load, n_battery), np.inf)
+        for start in range(0, n_actions, action_chunk_size):
+            action_values = get_action_values(model, t, value[t + 1], grids, slice(start, start + action_chunk_size))
+            best = np.minimum(best, action_values.min(axis=0))
+        value[t] = best
+
+    # Forward pass from the initial state of Microgrid with the exact (not discretized) state
+    actions = np.zeros((n_hours, model.actions.shape[1]), dtype=np.int64)
+    hourly_costs, hourly_soc = np.zeros(n_hours), np.zeros(n_hours)
+    state = (soc_min, 0., 0.)
+    for t in range(n_hours):
+        costs, *next_states = model(t, *state)
+        best = np.argmin(costs + interpolate(value[t + 1], grids, next_states))
+        actions[t] = model.actions[best]
+        hourly_costs[t] = costs[best]
+        state = tuple(float(next_state[best]) for next_state in next_states)
+        hourly_soc[t] = state[0]
+
+    # Replay the actions in Microgrid
+    microgrid = Microgrid(alternative_cost=alternative_cost, generation_tables=model.generation_tables)
+    action_layout = get_action_layout(wind, wind_generator)
+    env_costs = np.zeros(n_hours)
+    for t in range(n_hours):
+        microgrid.transition(actions[t], model.data_dict, t, action_layout=action_layout)
+        env_costs[t] = microgrid.cost_of_epoch()
+
+    initial_value = interpolate(value[0], grids, (soc_min, 0., 0.))
+    return {"cost": hourly_costs.sum(), "value": float(initial_value), "costs": hourly_costs, "soc": hourly_soc,
+            "actions": actions, "env_cost": env_costs.sum(), "env_costs": env_costs}
@@ -0,0 +1,31 @@
+from src.params import *
+
+# Action and observation layout of MicrogridEnv, kept free of gym so that it can be imported without it
+
+# Bounds of the observation space
+observation_low = np.array([0] * 4 + [soc_min])
+observation_high = np.array([10_000,  # solar irradiance
+                             100,  # wind speed
+                             10,  # electricity price to sell for
+                             10_000,  # energy demand in kWh
+                             soc_max,  # battery status
+                             ])
+
+
+def get_action_dims(wind=False, wind_generator=False):
+    # Get correct action space dimensions
+    if wind_generator:
+        return [2, 2, 2, 3, 3, 3, 2, 2, 2]
+    if wind:
+        return [2, 2, 2, 3, 3, 2, 2]
+    return [2, 2, 2, 3, 2]  # action space for solar only
+
+
+def get_action_layout(wind=False, wind_generator=False):
+    # Position of (purchased load, purchased battery, discharged, solar, wind, generator, adjusting status solar,
+    # wind, generator) in the flat action, -1 for actions that are always 0. See Microgrid.update_actions_from_array
+    if wind_generator:
+        return 0, 1, 2, 3, 4, 5, 6, 7, 8
+    if wind:
+        return 0, 1, 2, 3, 4, -1, 5, 6, -1
+    return 0, 1, 2, 3, -1, -1, 4, -1, -1
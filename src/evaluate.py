@@ -0,0 +1,121 @@
+import glob
+import json
+import os
+
+import pandas as pd
+from stable_baselines3 import PPO
+
+from src.params import *
+from src.get_data import get_data_dict, get_test_dict
+from src.scenarios import ScenarioGenerator
+from src.utils import RunningMeanStd, get_obs_rms_path
+from src.microgrid_vec_env import MicrogridVecEnv
+
+config_path = "output/configs"
+model_path = "output/models"
+recorded_keys = ["reward", "blackout", "energy_generated_solar", "energy_generated_wind", "energy_generated_generator",
+                 "soc", "energy_demand", "energy_load"]
+
+
+def evaluate_policy(policy, test_dicts, wind=False, wind_generator=True, alternative_cost=False, deterministic=False,
+                    obs_rms=None):
+    """
+    Run a policy over several test data dicts at once.
+
+    The test dicts are concatenated and every dict is simulated by one environment of
+    a MicrogridVecEnv, so the policy predicts the actions of all of them in one call.
+
+    Params:
+        policy: object with a stable-baselines3 style predict(obs, deterministic=...)
+            method, e.g. a loaded PPO model
+        test_dicts: list of hourly environment data dicts of equal length, see
+            MicrogridEnv
+        wind, wind_generator, alternative_cost: see MicrogridEnv
+        deterministic: passed on to policy.predict
+        obs_rms: RunningMeanStd the observations are normalized with before they
+            are passed to the policy, if the policy was trained on normalized
+            observations. The statistics are not updated
+    Returns:
+        dict with arrays of shape (len(test_dicts), n_hours) for every key in
+        recorded_keys and the aggregates "blackout_rate", "mean_cost" (per hour)
+        and "total_cost" (per test dict, averaged over the test dicts)
+    """
+    n_scenarios = len(test_dicts)
+    n_hours = len(test_dicts[0]["wind_speed"])
+    if any(len(test_dict["wind_speed"]) != n_hours for test_dict in test_dicts):
+        raise Exception("All test dicts must have the same number of hours")
+
+    data_dict = {key: np.concatenate([np.asarray(test_dict[key]) for test_dict in test_dicts])
+                 for key in test_dicts[0]}
+    env = MicrogridVecEnv(data_dict, n_envs=n_scenarios, wind=wind, wind_generator=wind_generator,
+                          alternative_cost=alternative_cost, start_offsets=np.arange(n_scenarios) * n_hours,
+                          episode_length=n_hours, auto_reset=False)
+    mg = env.microgrid
+
+    results = {key: np.zeros((n_scenarios, n_hours)) for key in recorded_keys}
+    obs = env.reset()
+    for t in range(n_hours):
+        if obs_rms is not None:
+            obs = obs_rms.normalize(obs)
+        actions, _ = policy.predict(obs, deterministic=deterministic)
+        obs, rewards, _, _ = env.step(actions)
+
+        results["reward"][:, t] = rewards
+        results["blackout"][:, t] = mg.energy_total < mg.energy_demand
+        results["energy_generated_solar"][:, t] = mg.energy_solar
+        results["energy_generated_wind"][:, t] = mg.energy_wind
+        results["energy_generated_generator"][:, t] = mg.energy_generator
+        results["soc"][:, t] = mg.soc
+        results["energy_demand"][:, t] = mg.energy_demand
+        results["energy_load"][:, t] = mg.energy_total
+
+    results["blackout_rate"] = results["blackout"].mean()
+    results["mean_cost"] = -results["reward"].mean()
+    results["total_cost"] = -results["reward"].sum(axis=1).mean()
+    return results
+
+
+def evaluate_config(save_name, seeds=(123,), sample_size=800, deterministic=False, scenarios=False):
+    """
+    Evaluate the saved model of a config in output/configs on the test data of several seeds.
+
+    Params:
+        save_name: name of the run, e.g. "ppo_q1.1"
+        seeds: seeds of the test data, see get_test_dict
+        sample_size: number of hours of each test data dict
+        deterministic: use deterministic actions of the model
+        scenarios: use temporally coherent scenarios of a ScenarioGenerator as
+            test data instead of the i.i.d. samples of get_test_dict
+    """
+    with open(os.path.join(config_path, f"config_{save_name}.json"), "r") as json_file:
+        parameters = json.load(json_file)
+
+    if scenarios:
+        generator = ScenarioGenerator(get_data_dict(parameters["nr_households"], parameters["region"]))
+        test_dicts = generator.get_scenarios(seeds, sample_size)
+    else:
+        test_dicts = [get_test_dict(parameters["nr_households"], parameters["region"], sample_size=sample_size,
+                                    seed=seed) for seed in seeds]
+    model = PPO.load(os.path.join(model_path, f"model_{save_name}"))
+
+    # Use the observation statistics saved next to the model, if the model was trained on normalized observations
+    obs_rms_path = get_obs_rms_path(save_name, model_path)
+    obs_rms = RunningMeanStd.load(obs_rms_path) if os.path.exists(obs_rms_path) else None
+    return evaluate_policy(model, test_dicts, wind=parameters["wind"], wind_generator=parameters["wind_generator"],
+                           alternative_cost=parameters["alternative_cost"], deterministic=deterministic,
+                           obs_rms=obs_rms)
+
+
+def evaluate_all(save_names=None, seeds=(123,), sample_size=800, deterministic=False, scenarios=False):
+    """Evaluate the models of all (or the given) configs, returns a DataFrame with one row of aggregates per run"""
+    if save_names is None:
+        save_names = sorted(os.path.basename(path)[len("config_"):-len(".json")]
+                            for path in glob.glob(os.path.join(config_path, "config_*.json")))
+
+    summary = []
+    for save_name in save_names:
+        results = evaluate_config(save_name, seeds=seeds, sample_size=sample_size, deterministic=deterministic,
+                                  scenarios=scenarios)
+        summary.append({"save_name": save_name, "blackout_rate": results["blackout_rate"],
+                        "mean_cost": results["mean_cost"], "total_cost": results["total_cost"]})
+    return pd.DataFrame(summary)
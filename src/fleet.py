@@ -0,0 +1,217 @@
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from src.params import *
+from src.get_data import load_energy_demand_cache, get_environment_data, get_region_prefix, min_household_hours, \
+    cache_path, file_lock, atomic_file
+from src.microgrid import get_generation_tables
+from src.batched_microgrid import BatchedMicrogrid, get_batched_action_dict
+
+summary_keys = ["total_cost", "mean_cost", "blackout_hours", "blackout_rate", "total_demand", "energy_purchased"]
+
+
+def get_default_action(wind=False, wind_generator=True):
+    """Action that works solar and wind for the load and buys the missing energy, without battery and generator"""
+    n_sources = 3 if wind_generator else 2 if wind else 1
+    # [purchased load, purchased battery, discharged] + allocation of every source + working status of every source
+    working_status = [1, 1, 0][:n_sources]
+    return np.array([1, 0, 0] + [0] * n_sources + working_status, dtype=np.int64)
+
+
+def get_fleet_demand(level="household", n_hours=None, cache_dir=cache_path, chunk_size=1024):
+    """
+    Hourly demand of every site of a fleet as float32 matrix of shape (sites, hours).
+
+    The sites are all households with at least min_household_hours hours
+    ("household") or the sum of all of them per region prefix ("region"). The
+    matrix is built from the household demand cache (see ingest_energy_demand_data)
+    in chunks of chunk_size households and stored as .npy file in cache_dir, which
+    is rebuilt when a household CSV changes. Concurrent calls build it only once.
+    Hours are aligned with the environment data like in get_energy_demand_data.
+
+    Params:
+        level: "household" or "region"
+        n_hours: number of hours, defaults to the length of the environment data
+        cache_dir: directory of the household demand cache and the fleet matrix
+    Returns:
+        memory-mapped demand matrix, the path of its file and the site names
+        (household file names or region prefixes)
+    """
+    if level not in ("household", "region"):
+        raise Exception(f"Unknown level {level}, use 'household' or 'region'")
+    matrix, index = load_energy_demand_cache(cache_dir=cache_dir)
+    if n_hours is None:
+        n_hours = len(get_environment_data()[1])
+    rows = [i for i, length in enumerate(index["lengths"]) if length >= max(min_household_hours, n_hours)]
+    if level == "household":
+        names = [index["files"][i] for i in rows]
+    else:
+        regions = sorted({index["regions"][i] for i in rows})
+        names = [get_region_prefix(region) for region in regions]
+
+    key = hashlib.sha1(json.dumps([level, n_hours, sorted(index["fingerprints"])]).encode()).hexdigest()[:16]
+    fleet_file = os.path.join(cache_dir, f"fleet_{level}_{key}.npy")
+    with file_lock(fleet_file + ".lock"):
+        if not os.path.exists(fleet_file):
+            with atomic_file(fleet_file) as tmp_file:
+                # Written chunk by chunk into a memory-mapped file, so memory stays bounded for any number of sites
+                fleet = np.lib.format.open_memmap(tmp_file, mode="w+", dtype=np.float32, shape=(len(names), n_hours))
+                if level == "household":
+                    for start in range(0, len(rows), chunk_size):
+                        fleet[start:start + chunk_size] = matrix[rows[start:start + chunk_size], :n_hours]
+                else:
+                    row_regions = np.array([index["regions"][i] for i in rows])
+                    for i, region in enumerate(regions):
+                        region_rows = np.array(rows)[row_regions == region]
+                        region_demand = np.zeros(n_hours)
+                        for start in range(0, len(region_rows), chunk_size):
+                            region_demand += matrix[region_rows[start:start + chunk_size], :n_hours].sum(
+                                axis=0, dtype=np.float64)
+                        fleet[i] = region_demand
+                fleet.flush()
+                del fleet
+    return np.load(fleet_file, mmap_mode="r"), fleet_file, names
+
+
+def simulate_sites(demand, environment, actions=None, policy=None, wind=False, wind_generator=True,
+                   alternative_cost=False, initial_soc=soc_min):
+    """
+    Run the Microgrid of every site over all hours with one BatchedMicrogrid.
+
+    Params:
+        demand: demand of the sites, array of shape (sites, hours)
+        environment: dict with the hourly "solar_irradiance", "wind_speed" and
+            "rate_consumption_charge" shared by all sites
+        actions: one MicrogridEnv action for all sites and hours or a schedule of
+            shape (hours, n_actions), see get_default_action
+        policy: object with a predict method like NumpyPolicy, called every hour
+            with the observations of all sites. Used instead of actions if given
+        wind, wind_generator, alternative_cost, initial_soc: see MicrogridEnv
+    Returns:
+        dict with an array of shape (sites,) for every key of summary_keys
+    """
+    n_sites, n_hours = demand.shape
+    grid = BatchedMicrogrid(n_envs=n_sites, alternative_cost=alternative_cost)
+    grid.reset(soc=initial_soc)
+    generation_tables = get_generation_tables(environment)
+    site_index = np.arange(n_sites)
+    if policy is None:
+        actions = np.asarray(get_default_action(wind, wind_generator) if actions is None else actions)
+        schedule = actions if actions.ndim == 2 else None
+        if schedule is None:
+            action_dict = get_batched_action_dict(np.broadcast_to(actions, (n_sites, len(actions))), wind=wind,
+                                                  wind_generator=wind_generator)
+
+    total_cost = np.zeros(n_sites)
+    blackout_hours = np.zeros(n_sites, dtype=np.int64)
+    energy_purchased = np.zeros(n_sites)
+    observation = np.empty((n_sites, 5))
+    for t in range(n_hours):
+        if policy is not None:
+            # Observation of MicrogridEnv, the state after the previous hour
+            observation[:] = np.column_stack([grid.solar_irradiance, grid.wind_speed, grid.energy_price_utility_grid,
+                                              grid.energy_demand, grid.soc])
+            action_dict = get_batched_action_dict(policy.predict(observation, deterministic=True)[0], wind=wind,
+                                                  wind_generator=wind_generator)
+        elif schedule is not None:
+            action_dict = get_batched_action_dict(np.broadcast_to(schedule[t], (n_sites, schedule.shape[1])),
+                                                  wind=wind, wind_generator=wind_generator)
+
+        # Data of the hour, shared by all sites except the demand
+        hour_data = {key: np.broadcast_to(environment[key][t], n_sites)
+                     for key in ["solar_irradiance", "wind_speed", "rate_consumption_charge"]}
+        hour_data["energy_demand"] = demand[:, t]
+        grid.generation_tables = {key: np.broadcast_to(table[t], n_sites) for key, table in generation_tables.items()}
+        grid.transition(action_dict, hour_data, site_index)
+
+        total_cost += grid.cost_of_epoch()
+        blackout_hours += grid.energy_total < grid.energy_demand
+        energy_purchased += grid.energy_purchased
+
+    return {"total_cost": total_cost, "mean_cost": total_cost / n_hours, "blackout_hours": blackout_hours,
+            "blackout_rate": blackout_hours / n_hours, "total_demand": demand.sum(axis=1, dtype=np.float64),
+            "energy_purchased": energy_purchased}
+
+
+def _simulate_chunk(demand_file, start, stop, environment, actions, policy_file, wind, wind_generator,
+                    alternative_cost, initial_soc):
+    # Worker of simulate_fleet, reads only its sites from the memory-mapped demand matrix
+    policy = None
+    if policy_file is not None:
+        from src.numpy_policy import NumpyPolicy
+        policy = NumpyPolicy.load(policy_file)
+    demand = np.load(demand_file, mmap_mode="r")
+    n_hours = len(environment["wind_speed"])
+    return start, simulate_sites(np.array(demand[start:stop, :n_hours]), environment, actions=actions, policy=policy,
+                                 wind=wind, wind_generator=wind_generator, alternative_cost=alternative_cost,
+                                 initial_soc=initial_soc)
+
+
+def simulate_fleet(demand, environment=None, actions=None, policy_file=None, wind=False, wind_generator=True,
+                   alternative_cost=False, initial_soc=soc_min, chunk_size=2048, n_workers=None):
+    """
+    Simulate the Microgrids of many sites over all hours, see simulate_sites.
+
+    The sites are split into chunks of chunk_size sites that are simulated by a
+    pool of n_workers processes. Every worker memory-maps the demand matrix and
+    only loads the rows of its chunk, so the memory per worker is bounded by the
+    chunk size, not by the number of sites.
+
+    Params:
+        demand: demand matrix of shape (sites, hours), as .npy file (see
+            get_fleet_demand) or array
+        environment: dict with the hourly "solar_irradiance", "wind_speed" and
+            "rate_consumption_charge", defaults to the environment data of
+            get_data_dict. Determines the number of simulated hours
+        actions: see simulate_sites
+        policy_file: exported NumpyPolicy (see export_policy) used instead of actions
+        wind, wind_generator, alternative_cost, initial_soc: see MicrogridEnv
+        chunk_size: number of sites simulated at once by a worker
+        n_workers: number of processes, defaults to the number of available CPUs.
+            With 1 the chunks run in this process
+    Returns:
+        dict with an array of shape (sites,) for every key of summary_keys
+    """
+    if wind and wind_generator:
+        print("WARNING parameter wind=True was set to False as wind_generator is already True")
+        wind = False
+    if environment is None:
+        solar_irradiance, wind_speed, rate_consumption_charge = get_environment_data()
+        environment = {"solar_irradiance": solar_irradiance, "wind_speed": wind_speed,
+                       "rate_consumption_charge": rate_consumption_charge}
+    environment = {key: np.asarray(environment[key], dtype=np.float64)
+                   for key in ["solar_irradiance", "wind_speed", "rate_consumption_charge"]}
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if not isinstance(demand, str):
+            # Workers read the demand from a file instead of receiving it pickled
+            demand_file = os.path.join(temp_dir, "demand.npy")
+            np.save(demand_file, np.asarray(demand, dtype=np.float32))
+        else:
+            demand_file = demand
+        n_sites, n_hours = np.load(demand_file, mmap_mode="r").shape
+        if n_hours < len(environment["wind_speed"]):
+            raise Exception(f"The demand has only {n_hours} < {len(environment['wind_speed'])} hours")
+
+        chunks = [(start, min(start + chunk_size, n_sites)) for start in range(0, n_sites, chunk_size)]
+        args = (environment, actions, policy_file, wind, wind_generator, alternative_cost, initial_soc)
+        if n_workers is None:
+            n_workers = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+        if n_workers == 1 or len(chunks) == 1:
+            results = [_simulate_chunk(demand_file, start, stop, *args) for start, stop in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=min(n_workers, len(chunks)),
+                                     mp_context=mp.get_context("spawn")) as executor:
+                futures = [executor.submit(_simulate_chunk, demand_file, start, stop, *args) for start, stop in chunks]
+                results = [future.result() for future in futures]
+
+    summary = {key: np.zeros(n_sites, dtype=np.int64 if key == "blackout_hours" else np.float64)
+               for key in summary_keys}
+    for start, chunk_summary in results:
+        for key in summary_keys:
+            summary[key][start:start + len(chunk_summary[key])] = chunk_summary[key]
+    return summary
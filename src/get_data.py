@@ -1,28 +1,288 @@
-import pandas as pd
 import numpy as np
+import hashlib
+import json
 import os
+import tempfile
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows, the memo cache is used without locking
+    fcntl = None
 
 
 # NOTE: We assume here that all time series have the identical starting point and no NAs
 
-def get_energy_demand_data(k=25, region="CA"):
+household_data_path = "data/residential_load_data_base"
+cache_path = "data/cache"
+demand_column = "Electricity:Facility [kW](Hourly)"
+min_household_hours = 8640
+environment_files = ["data/SolarIrradiance.csv", "data/WindSpeed.csv", "data/rate_consumption_charge.csv"]
+
+# Memoization of the loaded data arrays, see load_data_arrays
+memo_path = os.path.join(cache_path, "memo")
+memo_lru_size = 8  # number of (k, region) combinations kept in memory
+memo_max_bytes = 1 << 30  # size of the memo directory above which the least recently used entries are deleted
+_memo_lru = OrderedDict()
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """
+    Exclusive lock of a file across processes, e.g. so only one of them builds a cache file.
+    Yields whether the lock was acquired, which is only False if blocking is False and
+    another process holds the lock. Lock files may be deleted by their holder (see
+    remove_unlocked), a lock of a deleted file is released and the new file is locked.
+    """
+    while True:
+        with open(path, "a") as file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+                try:
+                    if os.stat(path).st_ino != os.fstat(file.fileno()).st_ino:
+                        continue  # deleted (and maybe recreated) before it was locked
+                except FileNotFoundError:
+                    continue
+            try:
+                yield True
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+            return
+
+
+def remove_unlocked(path):
+    """
+    Delete a cache file and its lock file unless another process holds the lock, i.e. is
+    about to read or write the file. Returns whether the file was deleted.
+    """
+    with file_lock(path + ".lock", blocking=False) as locked:
+        if locked:
+            if os.path.exists(path):
+                os.remove(path)
+            if fcntl is not None:  # the lock file is still open here, which only POSIX systems can delete
+                os.remove(path + ".lock")
+    return locked
+
+
+@contextmanager
+def atomic_file(path):
+    """
+    Unique temporary file name next to path, the file replaces path when the block completes.
+    Readers never see a partially written file and concurrent writers never share a temporary file.
+    """
+    directory, name = os.path.split(path)
+    fd, tmp_file = tempfile.mkstemp(dir=directory or ".", prefix=name + ".", suffix=".tmp")
+    os.close(fd)
+    os.chmod(tmp_file, 0o644)
+    try:
+        yield tmp_file
+        os.replace(tmp_file, path)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def get_region_prefix(region):
     if isinstance(region, list):
         region = tuple(region)
     if isinstance(region, tuple):
-        region = tuple(f"USA_{r}" for r in region)
-    else:
-        region = f"USA_{region}"
+        return tuple(f"USA_{r}" for r in region)
+    return f"USA_{region}"
+
+
+def read_csv_column(path, column, dtype=np.float64):
+    """Parse a single column of a CSV file, returns the values and the time it took in seconds"""
+    import pandas as pd
+    start = time.perf_counter()
+    values = pd.read_csv(path, usecols=[column], dtype={column: dtype})[column].to_numpy(copy=True)
+    return values, time.perf_counter() - start
+
+
+def read_household_demand(files, data_path=household_data_path, k=None, dtype=np.float64, n_workers=None,
+                          processes=False, verbose=False):
+    """
+    Read the demand column of the given household CSVs concurrently.
+
+    Params:
+        files: household CSV file names in data_path
+        k: stop reading once k households with at least min_household_hours hours
+            are found (all files are read if None)
+        dtype: dtype the demand column is parsed as
+        n_workers: number of threads (or processes) reading files at once
+        processes: read files in a process pool instead of a thread pool
+        verbose: print the time it took to read each file
+    Returns:
+        list of (file, demand) tuples of all read files in the order of files,
+        and a dict with the read time in seconds of each file
+    """
+    n_workers = n_workers or min(32, (os.cpu_count() or 1) + 4)
+    executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+
+    household_demand, timings = [], {}
+    n_qualifying = 0
+    start = time.perf_counter()
+    with executor_class(max_workers=n_workers) as executor:
+        # Keep a bounded number of files in flight and collect them in order, so reading can stop after k households
+        files_iter = iter(files)
+        pending = deque()
+
+        def submit_next():
+            file = next(files_iter, None)
+            if file is not None:
+                pending.append((file, executor.submit(read_csv_column, data_path + "/" + file, demand_column,
+                                                      dtype)))
+
+        for _ in range(2 * n_workers):
+            submit_next()
+
+        while pending:
+            file, future = pending.popleft()
+            demand, timings[file] = future.result()
+            household_demand.append((file, demand))
+            if demand.shape[0] >= min_household_hours:
+                n_qualifying += 1
+            if k is not None and n_qualifying >= k:
+                for _, future in pending:
+                    future.cancel()
+                break
+            submit_next()
+
+    if verbose:
+        for file, seconds in timings.items():
+            print(f"{file}: {seconds * 1000:.1f} ms")
+        print(f"Read {len(timings)} files in {time.perf_counter() - start:.2f} s")
+
+    return household_demand, timings
+
+
+def get_file_fingerprints(data_path, files):
+    """(file, size, modification time) of each file, used to detect changes of the source data"""
+    fingerprints = []
+    for file in files:
+        stat = os.stat(os.path.join(data_path, file))
+        fingerprints.append([file, stat.st_size, stat.st_mtime_ns])
+    return fingerprints
+
+
+def ingest_energy_demand_data(data_path=household_data_path, cache_dir=cache_path, n_workers=None, verbose=False):
+    """
+    Convert the demand column of all household CSVs into one float32 matrix of shape
+    (households, hours) that is stored in cache_dir as .npy file, next to a JSON index
+    with the file name, region, number of hours and fingerprint of every household.
+    Households with less hours are zero padded.
+
+    The cache is built while holding the lock of cache_dir, so concurrent processes
+    (e.g. the workers of a sweep on a cold cache) never interleave their writes. The
+    matrix file is named after the fingerprints and the index names it, so the index
+    and the matrix always belong together.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    with file_lock(os.path.join(cache_dir, "household_demand.lock")):
+        return build_energy_demand_cache(data_path, cache_dir, n_workers=n_workers, verbose=verbose)
+
+
+def build_energy_demand_cache(data_path, cache_dir, n_workers=None, verbose=False):
+    # Build the cache of ingest_energy_demand_data, the caller holds the lock of cache_dir
+    files = [file for file in os.listdir(data_path) if file.endswith(".csv")]
+
+    household_demand, _ = read_household_demand(files, data_path, dtype=np.float32, n_workers=n_workers,
+                                                verbose=verbose)
+    household_demand = [demand for _, demand in household_demand]
+
+    lengths = [demand.shape[0] for demand in household_demand]
+    matrix = np.zeros((len(files), max(lengths, default=0)), dtype=np.float32)
+    for i, demand in enumerate(household_demand):
+        matrix[i, :lengths[i]] = demand
 
-    data_path = "data/residential_load_data_base"
-    files = os.listdir(data_path)
+    fingerprints = get_file_fingerprints(data_path, files)
+    key = hashlib.sha1(json.dumps(sorted(fingerprints)).encode()).hexdigest()[:16]
+    index = {
+        "files": files,
+        "regions": [file.split("_")[1] if file.startswith("USA_") else "" for file in files],
+        "lengths": lengths,
+        "fingerprints": fingerprints,
+        "matrix_file": f"household_demand_{key}.npy",
+    }
+
+    # The new matrix is complete before the index refers to it, matrices of older indices are deleted afterwards.
+    # Processes that memory-mapped them keep their mapping
+    with atomic_file(os.path.join(cache_dir, index["matrix_file"])) as tmp_file:
+        with open(tmp_file, "wb") as file:
+            np.save(file, matrix)
+    with atomic_file(os.path.join(cache_dir, "household_demand.json")) as tmp_file:
+        with open(tmp_file, "w") as file:
+            json.dump(index, file)
+    for file in os.listdir(cache_dir):
+        if file.startswith("household_demand") and file.endswith(".npy") and file != index["matrix_file"]:
+            os.remove(os.path.join(cache_dir, file))
+    evict_fleet_cache(cache_dir)
+
+    return matrix, index
+
+
+def evict_fleet_cache(cache_dir=cache_path):
+    # The fleet matrices of src.fleet are derived from the household demand matrix, the ones of an older matrix are
+    # never used again. Matrices that are being built are skipped
+    fleet_files = {file.removesuffix(".lock") for file in os.listdir(cache_dir)
+                   if file.startswith("fleet_") and file.endswith((".npy", ".npy.lock"))}
+    for file in fleet_files:
+        remove_unlocked(os.path.join(cache_dir, file))
+
+
+def load_energy_demand_cache(data_path=household_data_path, cache_dir=cache_path):
+    """
+    Memory-map the household demand matrix created by ingest_energy_demand_data. The
+    cache is rebuilt if it is missing or if any household CSV was added, removed or
+    modified since the last ingestion.
+    """
+    index_file = os.path.join(cache_dir, "household_demand.json")
+    os.makedirs(cache_dir, exist_ok=True)
+    with file_lock(os.path.join(cache_dir, "household_demand.lock")):
+        if os.path.exists(index_file):
+            with open(index_file, "r") as file:
+                index = json.load(file)
+            matrix_file = os.path.join(cache_dir, index.get("matrix_file", ""))
+            files = sorted(file for file in os.listdir(data_path) if file.endswith(".csv"))
+            if os.path.isfile(matrix_file) and sorted(index["fingerprints"]) == get_file_fingerprints(data_path, files):
+                return np.load(matrix_file, mmap_mode="r"), index
+
+        return build_energy_demand_cache(data_path, cache_dir)
+
+
+def get_energy_demand_data(k=25, region="CA", use_cache=True, n_workers=None, verbose=False):
+    region = get_region_prefix(region)
+
+    if use_cache:
+        matrix, index = load_energy_demand_cache()
+        rows = [i for i, file in enumerate(index["files"])
+                if file.startswith(region) and index["lengths"][i] >= min_household_hours][:k]
+        if len(rows) < k:
+            raise Exception(f"WARNING: Found only {len(rows)} < {k} households. Either decrease k or change "
+                            f"region(s)")
+        lengths = {index["lengths"][i] for i in rows}
+        if len(lengths) > 1:
+            raise Exception(f"Households of region(s) {region} differ in length: {sorted(lengths)}")
+
+        # Only the selected rows of the memory-mapped matrix are read from disk
+        household_demand = matrix[rows, :lengths.pop()]
+        aggr_household_demand = household_demand.sum(axis=0, dtype=np.float64)
+        aggr_household_demand = aggr_household_demand[:-120]  # Drop 5 days bc other data sources lack these days
+        return aggr_household_demand
+
+    files = os.listdir(household_data_path)
 
     files_sample = [file for file in files if file.startswith(region)]
-    
-    household_demand = []
-    for file in files_sample:
-        df = pd.read_csv(data_path + "/" + file)
-        if df['Electricity:Facility [kW](Hourly)'].shape[0] >= 8640:
-            household_demand.append(df['Electricity:Facility [kW](Hourly)'])
+
+    household_demand, _ = read_household_demand(files_sample, k=k, n_workers=n_workers, verbose=verbose)
+    household_demand = [demand for _, demand in household_demand if demand.shape[0] >= min_household_hours]
 
     household_demand = household_demand[:k]
     if len(household_demand) < k:
@@ -38,33 +298,133 @@ def get_energy_demand_data(k=25, region="CA"):
 def get_environment_data():
     # Read the solar irradiance and wind speed data from file
     # Read the rate of consumption charge date from file
-    file_SolarIrradiance = "data/SolarIrradiance.csv"
-    file_WindSpeed = "data/WindSpeed.csv"
-    file_rateConsumptionCharge = "data/rate_consumption_charge.csv"
+    file_SolarIrradiance, file_WindSpeed, file_rateConsumptionCharge = environment_files
+
+    # Read only the used column of the three files concurrently
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        data_solar = executor.submit(read_csv_column, file_SolarIrradiance, "Avg Global Horizontal [W/m^2]")
+        data_wind = executor.submit(read_csv_column, file_WindSpeed, "Wind Speed  ")
+        data_rate_consumption_charge = executor.submit(read_csv_column, file_rateConsumptionCharge,
+                                                       "Grid Elecricity Price（$/kWh）")
 
     # Read the solar irradiance
-    data_solar = pd.read_csv(file_SolarIrradiance)
-    solarirradiance = np.array(data_solar["Avg Global Horizontal [W/m^2]"])
+    solarirradiance = data_solar.result()[0]
     # Solar irradiance measured by MegaWatt / km^2
 
     # Read the wind speed
-    data_wind = pd.read_csv(file_WindSpeed)
-    windspeed = 3.6 * np.array(data_wind["Wind Speed  "])
+    windspeed = 3.6 * data_wind.result()[0]
     windspeed = windspeed[:-2]  # Drop last two faulty entries
     # Wind speed measured by km/h = 1/3.6 m/s
 
     # Read the rate of consumption charge
-    data_rate_consumption_charge = pd.read_csv(file_rateConsumptionCharge)
-    rate_consumption_charge = np.array(data_rate_consumption_charge["Grid Elecricity Price（$/kWh）"])
+    rate_consumption_charge = data_rate_consumption_charge.result()[0]
     rate_consumption_charge *= 10  # increasing energy buying price by factor 10 to make more plausible
     # Rate of consumption charge measured by 10^4 $/ MegaWatt = 10 $/kWh
 
     return solarirradiance, windspeed, rate_consumption_charge
 
 
-def get_data_dict(k=10, region="CA"):
-    solar_irradiance, wind_speed, rate_consumption_charge = get_environment_data()
-    energy_demand = get_energy_demand_data(k=k, region=region)
+def get_memo_key(k, region):
+    """
+    Content address of the data arrays of (k, region): a hash of k, the set of regions and the
+    fingerprints of all source files. The households are selected in file order, so the order
+    of the regions does not matter.
+    """
+    region = get_region_prefix(region)
+    regions = sorted(set(region)) if isinstance(region, tuple) else [region]
+    files = sorted(file for file in os.listdir(household_data_path) if file.endswith(".csv"))
+    fingerprints = get_file_fingerprints(household_data_path, files) + get_file_fingerprints(".", environment_files)
+    key = json.dumps({"k": k, "regions": regions, "fingerprints": fingerprints})
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def evict_memo(keep=None, max_bytes=memo_max_bytes):
+    """
+    Delete the least recently used memo files until the memo directory is smaller than max_bytes,
+    together with their lock files and the lock files left behind by deleted entries.
+    Files whose lock is held are skipped, another process is about to read or write them.
+    """
+    memo_files = []
+    for file in os.listdir(memo_path):
+        if file.endswith(".npz"):
+            try:
+                stat = os.stat(os.path.join(memo_path, file))
+            except FileNotFoundError:  # evicted by another process
+                continue
+            memo_files.append((stat.st_mtime_ns, stat.st_size, os.path.join(memo_path, file)))
+    total = sum(size for _, size, _ in memo_files)
+    for _, size, file in sorted(memo_files):
+        if total <= max_bytes:
+            break
+        if file == keep:
+            continue
+        if remove_unlocked(file):
+            total -= size
+    for file in os.listdir(memo_path):
+        lock_file = os.path.join(memo_path, file)
+        if file.endswith(".npz.lock") and not os.path.exists(lock_file.removesuffix(".lock")) and fcntl is not None:
+            with file_lock(lock_file, blocking=False) as locked:
+                if locked and not os.path.exists(lock_file.removesuffix(".lock")):
+                    os.remove(lock_file)
+
+
+def clear_memo(disk=False):
+    """Empty the in-process memo cache and optionally the memo directory"""
+    _memo_lru.clear()
+    if disk and os.path.exists(memo_path):
+        evict_memo(max_bytes=0)
+
+
+def load_data_arrays(k=10, region="CA", use_memo=True):
+    """
+    Aggregated energy demand of k households and the environment data, memoized by get_memo_key.
+
+    Entries are kept in an in-process LRU cache of memo_lru_size entries and as .npz files in
+    memo_path, which are shared by all processes. A file is written atomically by the process
+    holding its lock, other processes wait for it and read the result instead of loading the
+    data again. The lock is held while a file is read as well, so evict_memo never deletes it
+    in the meantime. The returned arrays are read-only as they are shared between callers.
+    """
+    def load():
+        solar_irradiance, wind_speed, rate_consumption_charge = get_environment_data()
+        energy_demand = get_energy_demand_data(k=k, region=region)
+        return {"energy_demand": energy_demand, "solar_irradiance": solar_irradiance, "wind_speed": wind_speed,
+                "rate_consumption_charge": rate_consumption_charge}
+
+    if not use_memo:
+        return load()
+
+    key = get_memo_key(k, region)
+    if key in _memo_lru:
+        _memo_lru.move_to_end(key)
+        return dict(_memo_lru[key])
+
+    os.makedirs(memo_path, exist_ok=True)
+    memo_file = os.path.join(memo_path, f"{key}.npz")
+    with file_lock(memo_file + ".lock"):
+        if os.path.exists(memo_file):
+            with np.load(memo_file) as memo:
+                arrays = {name: memo[name] for name in memo.files}
+            os.utime(memo_file)  # mark as recently used for the eviction
+        else:
+            arrays = load()
+            with atomic_file(memo_file) as tmp_file:
+                with open(tmp_file, "wb") as file:
+                    np.savez(file, **arrays)
+            evict_memo(keep=memo_file)
+
+    for array in arrays.values():
+        array.flags.writeable = False
+    _memo_lru[key] = arrays
+    if len(_memo_lru) > memo_lru_size:
+        _memo_lru.popitem(last=False)
+    return dict(arrays)
+
+
+def get_data_dict(k=10, region="CA", use_memo=True):
+    arrays = load_data_arrays(k=k, region=region, use_memo=use_memo)
+    energy_demand, solar_irradiance = arrays["energy_demand"], arrays["solar_irradiance"]
+    wind_speed, rate_consumption_charge = arrays["wind_speed"], arrays["rate_consumption_charge"]
 
     if not energy_demand.shape[0] == solar_irradiance.shape[0] == wind_speed.shape[0] == rate_consumption_charge.shape[0]:
         print("Household demand:", energy_demand.shape[0])
@@ -81,10 +441,11 @@ def get_data_dict(k=10, region="CA"):
     return data_dict
 
 
-def get_test_dict(k=10, region="CA", sample_size=800, seed=None):
+def get_test_dict(k=10, region="CA", sample_size=800, seed=None, use_memo=True):
     """Create artificial test data"""
-    solar_irradiance, wind_speed, rate_consumption_charge = get_environment_data()
-    energy_demand = get_energy_demand_data(k=k, region=region)
+    arrays = load_data_arrays(k=k, region=region, use_memo=use_memo)
+    energy_demand, solar_irradiance = arrays["energy_demand"], arrays["solar_irradiance"]
+    wind_speed, rate_consumption_charge = arrays["wind_speed"], arrays["rate_consumption_charge"]
     
     # Set seed for reproducibility
     if seed:
@@ -1,8 +1,20 @@
-from src.get_data import get_data_dict
-from src.microgrid_env import MicrogridEnv
+import argparse
+import json
 
+# Only the standard library is imported at module level, every command imports what it needs so that e.g.
+# "python -m src simulate" does not load gym, pandas or stable-baselines3
+
+# Environment parameters of the questions of the assignment, like the configs in output/configs
+questions = {1: {"wind": False, "wind_generator": False, "alternative_cost": False},
+             2: {"wind": True, "wind_generator": False, "alternative_cost": False},
+             3: {"wind": False, "wind_generator": True, "alternative_cost": False},
+             4: {"wind": False, "wind_generator": True, "alternative_cost": True}}
+
+
+def demo():
+    from src.get_data import get_data_dict
+    from src.microgrid_env import MicrogridEnv
 
-def main():
     data_dict = get_data_dict(k=10, region="CA")
 
     grid = MicrogridEnv(data_dict)
@@ -13,8 +25,174 @@ def main():
     print(grid.microgrid.print_microgrid())
 
 
-if __name__ == "__main__":
-    main()
+def simulate(args):
+    import numpy as np
+    from src.get_data import get_data_dict
+    from src.env_layout import get_action_dims
+    from src.simulate import simulate
+
+    parameters = questions[args.question]
+    data_dict = get_data_dict(k=args.households, region=args.region)
+    n_hours = args.hours or len(data_dict["wind_speed"])
+    if args.actions:
+        actions = np.load(args.actions)
+    else:
+        # Uniformly random actions of the action space
+        rng = np.random.default_rng(args.seed)
+        dims = get_action_dims(parameters["wind"], parameters["wind_generator"])
+        actions = rng.integers(dims, size=(args.traces, n_hours, len(dims)))
+
+    results = simulate(actions, data_dict, **parameters)
+    total_cost = np.atleast_1d(results["total_cost"])
+    blackout_rate = np.atleast_2d(results["blackout"]).mean(axis=1)
+    for i, (cost, rate) in enumerate(zip(total_cost, blackout_rate)):
+        print(f"Trace {i}: total cost {cost:.2f}, blackout rate {rate:.2%}")
+    if args.output:
+        np.savez(args.output, **results)
+
+
+def train(args):
+    from src.sweep import train_run, evaluate_run, get_run_name
+
+    for config_file in args.configs:
+        train_run(config_file)
+        print(f"Trained {get_run_name(config_file)}")
+        if args.evaluate:
+            print(evaluate_run(get_run_name(config_file), seeds=args.seeds))
+
+
+def evaluate(args):
+    import glob
+    import os
+    from src.sweep import evaluate_run, model_path
+
+    # output/models/model_<run>(.zip), next to the observation statistics and exported policies (.npz)
+    run_names = args.runs or sorted(os.path.basename(model_file)[len("model_"):].removesuffix(".zip")
+                                    for model_file in glob.glob(os.path.join(model_path, "model_*"))
+                                    if not model_file.endswith(".npz"))
+    for run_name in run_names:
+        print(f"{run_name}: {evaluate_run(run_name, seeds=args.seeds)}")
+
+
+def ingest(args):
+    from src.get_data import ingest_energy_demand_data, household_data_path
+
+    matrix, index = ingest_energy_demand_data(data_path=args.data_path or household_data_path,
+                                              n_workers=args.workers, verbose=args.verbose)
+    print(f"Ingested {matrix.shape[0]} households with up to {matrix.shape[1]} hours")
+
+
+def export(args):
+    import os
+    from src.numpy_policy import export_policy, get_numpy_policy_path
+    from src.sweep import get_model_file, model_path
+    from src.utils import RunningMeanStd, get_obs_rms_path
+
+    for run_name in args.runs:
+        # Include the observation statistics if the model was trained on normalized observations
+        obs_rms_path = get_obs_rms_path(run_name, model_path)
+        obs_rms = RunningMeanStd.load(obs_rms_path) if os.path.exists(obs_rms_path) else None
+        policy_path = get_numpy_policy_path(run_name, model_path)
+        export_policy(get_model_file(run_name), policy_path, obs_rms=obs_rms)
+        print(f"Exported {run_name} to {policy_path}")
 
 
+def fleet(args):
+    import numpy as np
+    from src.fleet import get_fleet_demand, simulate_fleet
 
+    demand, demand_file, names = get_fleet_demand(args.level)
+    actions = np.load(args.actions) if args.actions else None
+    summary = simulate_fleet(demand_file, actions=actions, policy_file=args.policy, chunk_size=args.chunk_size,
+                             n_workers=args.workers, **questions[args.question])
+    print(f"Simulated {len(names)} sites for {demand.shape[1]} hours: mean total cost "
+          f"{summary['total_cost'].mean():.2f}, mean blackout rate {summary['blackout_rate'].mean():.2%}")
+    if args.output:
+        np.savez(args.output, site=np.array(names), **summary)
+
+
+def sweep(args):
+    from src.sweep import expand_grid, run_sweep
+
+    config_files = args.configs or None
+    if args.grid:
+        if not args.base:
+            raise Exception("--grid requires a --base config")
+        config_files = expand_grid(args.base, json.loads(args.grid))
+    run_sweep(config_files, n_jobs=args.jobs, pin_cpus=not args.no_pin, resume=not args.no_resume,
+              evaluate=not args.no_evaluate, seeds=args.seeds)
+
+
+def add_question_argument(parser):
+    parser.add_argument("--question", type=int, choices=sorted(questions), default=3,
+                        help="action space and cost of the question: 1 solar, 2 solar and wind, 3 solar, wind and "
+                             "generator, 4 like 3 with quadratic purchase cost (default: 3)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src")
+    subparsers = parser.add_subparsers(dest="command")
+
+    simulate_parser = subparsers.add_parser("simulate", help="cost, SOC and blackouts of action traces, see "
+                                                             "src/simulate.py")
+    simulate_parser.add_argument("--actions", help=".npy file with actions of shape (hours, n_actions) or (traces, "
+                                                   "hours, n_actions), random actions if not given")
+    simulate_parser.add_argument("--households", type=int, default=10, help="number of households")
+    simulate_parser.add_argument("--region", default="CA", help="region of the households")
+    add_question_argument(simulate_parser)
+    simulate_parser.add_argument("--traces", type=int, default=1, help="number of random traces")
+    simulate_parser.add_argument("--hours", type=int, help="hours of the random traces (default: all data)")
+    simulate_parser.add_argument("--seed", type=int, default=0, help="seed of the random actions")
+    simulate_parser.add_argument("--output", help="write the results to this .npz file")
+
+    train_parser = subparsers.add_parser("train", help="train PPO agents for config files one after another")
+    train_parser.add_argument("configs", nargs="+", help="config files, e.g. output/configs/config_ppo_q2.json")
+    train_parser.add_argument("--evaluate", action="store_true", help="evaluate the models after training")
+    train_parser.add_argument("--seeds", type=int, nargs="+", default=[123], help="seeds of the test data")
+
+    evaluate_parser = subparsers.add_parser("evaluate", help="evaluate trained models on test data")
+    evaluate_parser.add_argument("runs", nargs="*", help="run names, defaults to all models of output/models")
+    evaluate_parser.add_argument("--seeds", type=int, nargs="+", default=[123], help="seeds of the test data")
+
+    ingest_parser = subparsers.add_parser("ingest", help="convert the household profiles into the demand cache")
+    ingest_parser.add_argument("--data-path", help="folder of the household CSVs")
+    ingest_parser.add_argument("--workers", type=int, help="number of parsing threads")
+    ingest_parser.add_argument("--verbose", action="store_true", help="print the parsing times")
+
+    export_parser = subparsers.add_parser("export", help="export trained models for NumpyPolicy, see "
+                                                         "src/numpy_policy.py")
+    export_parser.add_argument("runs", nargs="+", help="run names, e.g. ppo_q2")
+
+    fleet_parser = subparsers.add_parser("fleet", help="cost and blackouts of the microgrids of all households or "
+                                                       "regions, see src/fleet.py")
+    fleet_parser.add_argument("--level", choices=["household", "region"], default="household",
+                              help="one site per household or per region")
+    fleet_parser.add_argument("--actions", help=".npy file with one action or actions of shape (hours, n_actions) "
+                                                "for all sites")
+    fleet_parser.add_argument("--policy", help="exported policy .npz, see the export command")
+    add_question_argument(fleet_parser)
+    fleet_parser.add_argument("--chunk-size", type=int, default=2048, help="sites simulated at once per worker")
+    fleet_parser.add_argument("--workers", type=int, help="number of processes (default: number of CPUs)")
+    fleet_parser.add_argument("--output", help="write the per-site summaries to this .npz file")
+
+    sweep_parser = subparsers.add_parser("sweep", help="train and evaluate configs of output/configs in parallel")
+    sweep_parser.add_argument("configs", nargs="*", help="config files, defaults to all of output/configs")
+    sweep_parser.add_argument("--grid", help='parameter grid as JSON, e.g. \'{"ent_coef": [0, 0.01]}\'')
+    sweep_parser.add_argument("--base", help="config file the grid is applied to")
+    sweep_parser.add_argument("--jobs", type=int, help="maximum number of concurrent runs (default: number of CPUs)")
+    sweep_parser.add_argument("--seeds", type=int, nargs="+", default=[123], help="seeds of the test data")
+    sweep_parser.add_argument("--no-pin", action="store_true", help="do not pin the workers to CPUs")
+    sweep_parser.add_argument("--no-resume", action="store_true", help="rerun completed runs")
+    sweep_parser.add_argument("--no-evaluate", action="store_true", help="only train")
+
+    args = parser.parse_args(argv)
+    commands = {"simulate": simulate, "train": train, "evaluate": evaluate, "ingest": ingest, "export": export,
+                "fleet": fleet, "sweep": sweep}
+    if args.command in commands:
+        commands[args.command](args)
+    else:
+        demo()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,51 @@
 from src.params import *
 
+# Indices of the working status / adjusting status lists
+SOLAR, WIND, GENERATOR = 0, 1, 2
+# Indices of the purchased actions list
+LOAD, BATTERY = 0, 1
+
+
+def potential_energy_solar(solar_irradiance):
+    # Energy generated by the solar PV with working status 1 (kWh)
+    return solar_irradiance * area_solarPV * efficiency_solarPV / 1000
+
+
+def potential_energy_wind(wind_speed):
+    # Energy generated by the wind turbine with working status 1 (kWh), following the cut-in, rated and cut-off speeds
+    wind_speed = np.asarray(wind_speed, dtype=np.float64)
+    ramp = (rated_windspeed > wind_speed) & (wind_speed >= cutin_windspeed)
+    rated = (cutoff_windspeed > wind_speed) & (wind_speed >= rated_windspeed)
+    return np.where(ramp, number_windturbine * rated_power_wind_turbine * (wind_speed - cutin_windspeed) /
+                    (rated_windspeed - cutin_windspeed) * 1000,  # changed to kWh
+                    np.where(rated, number_windturbine * rated_power_wind_turbine * delta_t * 1000, 0.))
+
+
+def potential_energy_generator():
+    # Energy generated by the generator with working status 1 (kWh)
+    return number_generators * rated_output_power_generator * delta_t
+
+
+def get_generation_tables(data_dict):
+    """
+    Potential energy of solar PV, wind turbine and generator for every hour of data_dict,
+    i.e. the energy generated if the source is working. Used by Microgrid to look up the
+    generated energy instead of recomputing it in every step.
+    """
+    n_hours = len(data_dict["wind_speed"])
+    return {"solar": potential_energy_solar(np.asarray(data_dict["solar_irradiance"], dtype=np.float64)),
+            "wind": potential_energy_wind(data_dict["wind_speed"]),
+            "generator": np.full(n_hours, potential_energy_generator(), dtype=np.float64)}
+
 
 class Microgrid(object):
+    __slots__ = ("energy_for_battery_bought", "energy_for_load_bought", "energy_total", "working_status",
+                 "energy_demand", "soc", "solar_irradiance", "wind_speed", "energy_price_utility_grid",
+                 "operational_cost_battery", "energy_purchased", "alternative_cost",
+                 "actions_adjusting_status", "actions_solar", "actions_wind", "actions_generator",
+                 "actions_purchased", "actions_discharged",
+                 "generation_tables", "energy_solar", "energy_wind", "energy_generator")
+
     def __init__(self,
                  # Environment
                  working_status=[1, 0, 0],  # working status of solar PV, wind turbine, generator
@@ -17,13 +61,14 @@ class Microgrid(object):
                  actions_generator=0,
                  actions_purchased=[0, 0],  # buy energy from utility grid for: [energy load, charge battery]
                  actions_discharged=0,
-                 alternative_cost=False
+                 alternative_cost=False,
+                 generation_tables=None  # precomputed potential energy per hour, see get_generation_tables
                  ):
         # Environment
         self.energy_for_battery_bought = 0
         self.energy_for_load_bought = 0
         self.energy_total = 0
-        self.working_status = self.get_actions_dict(working_status, actions=["solar", "wind", "generator"])
+        self.working_status = list(working_status)  # indexed by SOLAR, WIND, GENERATOR
         self.energy_demand = energy_demand
         self.soc = soc
         self.solar_irradiance = solar_irradiance
@@ -34,57 +79,82 @@ class Microgrid(object):
         self.alternative_cost = alternative_cost
 
         # Actions
-        self.actions_adjusting_status = self.get_actions_dict(actions_adjusting_status,
-                                                      actions=["solar", "wind", "generator"])
+        self.actions_adjusting_status = list(actions_adjusting_status)  # indexed by SOLAR, WIND, GENERATOR
         self.actions_solar = actions_solar
         self.actions_wind = actions_wind
         self.actions_generator = actions_generator
-        self.actions_purchased = self.get_actions_dict(actions_purchased,
-                                                      actions=["load", "battery"])
+        self.actions_purchased = list(actions_purchased)  # indexed by LOAD, BATTERY
         self.actions_discharged = actions_discharged
 
+        # Generated energy of the current epoch
+        self.generation_tables = generation_tables
+        self.update_generation()
+
     @staticmethod
     def get_actions_dict(ls: list, actions=["load", "battery", "sell"]) -> dict:
         return {a: l for a, l in zip(actions, ls)}
 
     def update_actions(self, action):
-        self.actions_adjusting_status = self.get_actions_dict(action["adjusting_status"],
-                                                              actions=["solar", "wind", "generator"])
+        self.actions_adjusting_status[:] = action["adjusting_status"]
         self.actions_solar = action["solar"]
         self.actions_wind = action["wind"]
         self.actions_generator = action["generator"]
-        self.actions_purchased = self.get_actions_dict(action["purchased"],
-                                                              actions=["load", "battery"])
+        self.actions_purchased[:] = action["purchased"]
         self.actions_discharged = action["discharged"]
 
+    def update_actions_from_array(self, action, action_layout):
+        """
+        Set the actions directly from a flat MultiDiscrete action without building an action dict.
+
+        Params:
+            action: MultiDiscrete action of MicrogridEnv
+            action_layout: position in action of (purchased load, purchased battery,
+                discharged, solar, wind, generator, adjusting status solar, wind,
+                generator), -1 for actions that are always 0. See get_action_layout
+        """
+        if isinstance(action, np.ndarray):
+            action = action.tolist()
+        load, battery, discharged, solar, wind, generator, status_solar, status_wind, status_generator = action_layout
+
+        self.actions_purchased[LOAD] = action[load]
+        self.actions_purchased[BATTERY] = action[battery]
+        self.actions_discharged = action[discharged]
+        self.actions_solar = action[solar]
+        self.actions_wind = action[wind] if wind >= 0 else 0
+        self.actions_generator = action[generator] if generator >= 0 else 0
+        self.actions_adjusting_status[SOLAR] = action[status_solar]
+        self.actions_adjusting_status[WIND] = action[status_wind] if status_wind >= 0 else 0
+        self.actions_adjusting_status[GENERATOR] = action[status_generator] if status_generator >= 0 else 0
+
     def update_working_status(self):
-        self.working_status["solar"] = self.actions_adjusting_status["solar"]
-        self.working_status["generator"] = self.actions_adjusting_status["generator"]
+        self.working_status[SOLAR] = self.actions_adjusting_status[SOLAR]
+        self.working_status[GENERATOR] = self.actions_adjusting_status[GENERATOR]
 
         if self.wind_speed > cutoff_windspeed or self.wind_speed < cutin_windspeed:
-            self.working_status["wind"] = 0
+            self.working_status[WIND] = 0
         else:
-            self.working_status["wind"] = self.actions_adjusting_status["wind"]
+            self.working_status[WIND] = self.actions_adjusting_status[WIND]
 
     def update_environment(self, data_dict, step_count):
         self.energy_demand = data_dict["energy_demand"][step_count]
         self.solar_irradiance = data_dict["solar_irradiance"][step_count]
         self.wind_speed = data_dict["wind_speed"][step_count]
         self.energy_price_utility_grid = data_dict["rate_consumption_charge"][step_count]
+        self.update_generation(step_count)
 
         # Production
         self.energy_total = 0
         if self.actions_solar == 0:
-            self.energy_total += self.energy_generated_solar()
+            self.energy_total += self.energy_solar
         if self.actions_wind == 0:
-            self.energy_total += self.energy_generated_wind()
+            self.energy_total += self.energy_wind
         if self.actions_generator == 0:
-            self.energy_total += self.energy_generated_generator()
+            self.energy_total += self.energy_generator
         if self.actions_discharged == 1:
             self.energy_total += self.soc - soc_min
             self.soc = soc_min
 
-        if self.actions_purchased["load"] and self.energy_demand > self.energy_total:
+        if self.actions_purchased[LOAD] and self.energy_demand > self.energy_total:
             # Buy energy from grid to meet demand (assumption to reduce action complexity)
             self.energy_for_load_bought = self.energy_demand - self.energy_total
             self.energy_total += self.energy_for_load_bought
@@ -93,47 +163,57 @@ class Microgrid(object):
         self.operational_cost_battery = 0
 
         if self.actions_solar == 1:
-            self.soc += self.energy_generated_solar() * charging_discharging_efficiency
-            self.operational_cost_battery += self.energy_generated_solar()
+            self.soc += self.energy_solar * charging_discharging_efficiency
+            self.operational_cost_battery += self.energy_solar
         if self.actions_wind == 1:
-            self.soc += self.energy_generated_wind() * charging_discharging_efficiency
-            self.operational_cost_battery += self.energy_generated_wind()
+            self.soc += self.energy_wind * charging_discharging_efficiency
+            self.operational_cost_battery += self.energy_wind
         if self.actions_generator == 1:
-            self.soc += self.energy_generated_generator() * charging_discharging_efficiency
-            self.operational_cost_battery += self.energy_generated_generator()
+            self.soc += self.energy_generator * charging_discharging_efficiency
+            self.operational_cost_battery += self.energy_generator
 
         if self.soc > soc_max:
             self.soc = soc_max
 
-        if self.actions_purchased["battery"] == 1:
+        if self.actions_purchased[BATTERY] == 1:
             # Buy energy from grid to fully load battery (assumption to reduce action complexity)
             self.energy_for_battery_bought = soc_max - self.soc
             self.soc = soc_max
             self.operational_cost_battery += self.energy_for_battery_bought
 
-    def transition(self, action, data_dict, step_count):
-        self.update_actions(action)
+    def transition(self, action, data_dict, step_count, action_layout=None):
+        if action_layout is None:
+            self.update_actions(action)
+        else:
+            self.update_actions_from_array(action, action_layout)
         self.update_working_status()
         self.update_environment(data_dict, step_count)
 
+    def update_generation(self, step_count=None):
+        # Look up the potential energy of the current epoch if the tables are available, compute it otherwise
+        if self.generation_tables is not None and step_count is not None:
+            solar = self.generation_tables["solar"][step_count]
+            wind = self.generation_tables["wind"][step_count]
+            generator = self.generation_tables["generator"][step_count]
+        else:
+            solar = potential_energy_solar(self.solar_irradiance)
+            wind = float(potential_energy_wind(self.wind_speed))
+            generator = potential_energy_generator()
+
+        # Working status is either 0 or 1, so multiplying by it gives the same result as the formulas in params
+        working_status = self.working_status
+        self.energy_solar = working_status[SOLAR] * solar if working_status[SOLAR] > 0 else 0
+        self.energy_wind = working_status[WIND] * wind if working_status[WIND] > 0 else 0
+        self.energy_generator = working_status[GENERATOR] * generator if working_status[GENERATOR] > 0 else 0
+
     def energy_generated_solar(self):
-        if self.working_status["solar"] > 0:
-            return self.working_status["solar"] * self.solar_irradiance * area_solarPV * efficiency_solarPV / 1000
-        return 0
+        return self.energy_solar
 
     def energy_generated_wind(self):
-        if self.working_status["wind"] > 0 and rated_windspeed > self.wind_speed >= cutin_windspeed:
-            return self.working_status["wind"] * number_windturbine * rated_power_wind_turbine * (self.wind_speed -
-                cutin_windspeed) / (rated_windspeed - cutin_windspeed) * 1000  # changed to kWh
-        elif self.working_status["wind"] > 0 and cutoff_windspeed > self.wind_speed >= rated_windspeed:
-            # changed to kWh
-            return self.working_status["wind"] * number_windturbine * rated_power_wind_turbine * delta_t * 1000
-        return 0
+        return self.energy_wind
 
     def energy_generated_generator(self):
-        if self.working_status["generator"] > 0:
-            return self.working_status["generator"] * number_generators * rated_output_power_generator * delta_t
-        return 0
+        return self.energy_generator
 
     def check_blackout(self):
         if self.energy_total < self.energy_demand:
@@ -142,9 +222,9 @@ class Microgrid(object):
 
     def operational_cost(self):
         # Cost of operating solar, wind and generator production
-        operational_cost = self.energy_generated_solar() * unit_operational_cost_solar + \
-                           self.energy_generated_wind() * unit_operational_cost_wind + \
-                           self.energy_generated_generator() * unit_operational_cost_generator
+        operational_cost = self.energy_solar * unit_operational_cost_solar + \
+                           self.energy_wind * unit_operational_cost_wind + \
+                           self.energy_generator * unit_operational_cost_generator
         # Cost of battery usage
         operational_cost += self.operational_cost_battery * delta_t * unit_operational_cost_battery / \
                             (2 * capacity_battery_storage * (soc_max - soc_min))
@@ -153,18 +233,18 @@ class Microgrid(object):
     def sell_back_reward(self):
         sell_back_energy = 0
         if self.actions_solar == 2:
-            sell_back_energy += self.energy_generated_solar() * sell_back_energy_price
+            sell_back_energy += self.energy_solar * sell_back_energy_price
         if self.actions_wind == 2:
-            sell_back_energy += self.energy_generated_wind() * sell_back_energy_price
+            sell_back_energy += self.energy_wind * sell_back_energy_price
         if self.actions_generator == 2:
-            sell_back_energy += self.energy_generated_generator() * sell_back_energy_price
+            sell_back_energy += self.energy_generator * sell_back_energy_price
         return sell_back_energy
     
     def cost_of_epoch(self):
         if self.alternative_cost:
             energy_purchased = self.energy_for_battery_bought + self.energy_for_load_bought
             
-            self.energy_purchased = 0.25 * energy_purchased**2 * self.energy_price_utility_grid + \
+            self.energy_purchased = 0.25 * energy_purchased * energy_purchased * self.energy_price_utility_grid + \
                                     0.5 * energy_purchased * self.energy_price_utility_grid
         else:
             self.energy_purchased = (self.energy_for_battery_bought + self.energy_for_load_bought) \
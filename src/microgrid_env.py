@@ -1,12 +1,18 @@
+import time
+
 import gym
 from gym import spaces
 
 from src.params import *
-from src.microgrid import Microgrid
+from src.microgrid import Microgrid, get_generation_tables, LOAD, BATTERY, SOLAR, WIND, GENERATOR
+from src.batched_microgrid import BatchedMicrogrid, get_batched_action_dict
+from src.env_layout import observation_low, observation_high, get_action_dims, get_action_layout
 
 
 class MicrogridEnv(gym.Env):
-    def __init__(self, data_dict, wind=False, wind_generator=True, alternative_cost=False):
+    def __init__(self, data_dict, wind=False, wind_generator=True, alternative_cost=False, batched=False,
+                 telemetry=None, episode_length=None, start_mode="fixed", start_offset=0, initial_soc=None,
+                 seed=None):
         """
         Params:
             data_dict: hourly environment data. Should contain the following
@@ -17,12 +23,44 @@ class MicrogridEnv(gym.Env):
                 simulation (question 2)
             wind_generator: indicator if solar, wind and generator should be
                 used for the simulation (question 3)
+            batched: use the vectorized BatchedMicrogrid (with a single grid)
+                as backend instead of the scalar Microgrid
+            telemetry: optional TelemetryRecorder that samples the values of
+                the steps, see src.telemetry
+            episode_length: number of hours per episode, defaults to the length
+                of data_dict. Episodes reaching the end of data_dict wrap around to
+                its beginning. Episodes shorter than the data end truncated
+                (info["TimeLimit.truncated"] is True), full-length episodes terminate
+            start_mode: hour of data_dict at which an episode starts,
+                "fixed": always at start_offset, "random": at a random hour,
+                "strided": at start_offset first, then every episode starts where
+                the previous one ended
+            start_offset: hour of the first episode for the "fixed" and "strided"
+                start_mode
+            initial_soc: SOC at the start of an episode, soc_min if None, a number
+                or "random" for a uniformly random SOC between soc_min and soc_max
+            seed: seed of the random start hours and SOCs
         """
         # Initialize your Microgrid
         self.alternative_cost = alternative_cost
-        self.microgrid = Microgrid(alternative_cost=alternative_cost)
-        self.step_count = 0
+        self.batched = batched
         self.data_dict = data_dict  # hourly environment data
+        self.generation_tables = get_generation_tables(data_dict)  # generated energy per hour, computed once
+        self.max_epochs = len(self.data_dict["wind_speed"])
+
+        # Episode windows
+        if start_mode not in ("fixed", "random", "strided"):
+            raise Exception(f"Unknown start_mode {start_mode}, use 'fixed', 'random' or 'strided'")
+        self.episode_length = self.max_epochs if episode_length is None else episode_length
+        self.truncate = self.episode_length != self.max_epochs
+        self.start_mode = start_mode
+        self.initial_soc = initial_soc
+        self.rng = np.random.default_rng(seed)
+        self.start_offset = start_offset % self.max_epochs
+        self.next_start_offset = self.start_offset
+
+        self.microgrid = self.get_microgrid(soc=soc_min)  # the initial SOC is drawn on reset
+        self.step_count = 0
         self.alternative_cost = alternative_cost
         self.wind = wind
         self.wind_generator = wind_generator
@@ -30,34 +68,65 @@ class MicrogridEnv(gym.Env):
             print("WARNING parameter wind=True was set to False as wind_generator is already True")
             self.wind = False
 
-        # Get correct action space dimensions
-        actions = [2, 2, 2, 3, 2]  # action space for solar only
-        if self.wind:
-            actions = [2, 2, 2, 3, 3, 2, 2]
-        elif self.wind_generator:
-            actions = [2, 2, 2, 3, 3, 3, 2, 2, 2]
-
         # Define the action space
-        self.action_space = spaces.MultiDiscrete(actions)
+        self.action_space = spaces.MultiDiscrete(get_action_dims(self.wind, self.wind_generator))
+        self.action_layout = get_action_layout(self.wind, self.wind_generator)
 
         # Define observation space
-        self.observation_space = spaces.Box(low=np.array([0] * 4 + [soc_min]),
-                                            high=np.array([10_000,  # solar irradiance
-                                                           100,  # wind speed
-                                                           10,  # electricity price to sell for
-                                                           10_000,  # energy demand in kWh
-                                                           soc_max,  # battery status
-                                                           ]),
-                                            dtype=np.float64)
+        self.observation_space = spaces.Box(low=observation_low, high=observation_high, dtype=np.float64)
+        self.observation = np.zeros(self.observation_space.shape, dtype=np.float64)  # internal, see get_observation
+        self.telemetry = telemetry
+        self.profiler = None  # see enable_profiling
+
+    def seed(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+        return [seed]
 
     def reset(self, **kwargs):
+        if kwargs.get("seed") is not None:
+            self.seed(kwargs["seed"])
         self.step_count = 0
+
+        # Choose the hour of data_dict the episode starts at
+        if self.start_mode == "random":
+            self.start_offset = int(self.rng.integers(self.max_epochs))
+        elif self.start_mode == "strided":
+            self.start_offset = self.next_start_offset
+            self.next_start_offset = (self.start_offset + self.episode_length) % self.max_epochs
+
         # Reset the Microgrid to its initial state
-        self.microgrid = Microgrid(alternative_cost=self.alternative_cost)
+        self.microgrid = self.get_microgrid()
         # Return the initial observation
         return self.get_observation()
 
+    def get_initial_soc(self):
+        if self.initial_soc is None:
+            return soc_min
+        if self.initial_soc == "random":
+            return self.rng.uniform(soc_min, soc_max)
+        return self.initial_soc
+
+    def get_microgrid(self, soc=None):
+        soc = self.get_initial_soc() if soc is None else soc
+        if self.batched:
+            microgrid = BatchedMicrogrid(n_envs=1, alternative_cost=self.alternative_cost,
+                                         generation_tables=self.generation_tables)
+            microgrid.reset(soc=soc)
+            return microgrid
+        return Microgrid(soc=soc, alternative_cost=self.alternative_cost, generation_tables=self.generation_tables)
+
+    def get_data_index(self):
+        # Hour of data_dict of the current step, episodes wrap around to the beginning of the data
+        data_index = self.start_offset + self.step_count
+        if data_index >= self.max_epochs:
+            data_index -= self.max_epochs
+        return data_index
+
     def get_action_dict(self, action):
+        if self.batched:
+            return get_batched_action_dict(np.asarray(action)[None], wind=self.wind,
+                                           wind_generator=self.wind_generator)
+
         # actions = [2, 2, 2, 3, 2] # TODO
         action_dict = {
             "purchased": action[0:2],
@@ -85,30 +154,130 @@ class MicrogridEnv(gym.Env):
         # adjusting_status = action[:3]
         # Ensure that adjusting_status values are either 0 or 1
         # adjusting_status = np.round(adjusting_status).astype(int)
-        action_dict = self.get_action_dict(action)
 
-        # Execute the chosen action on the Microgrid
-        self.microgrid.transition(action_dict, self.data_dict, self.step_count)
+        # Execute the chosen action on the Microgrid, the phases are timed separately by profiled_step
+        self.update_actions(action)
+        self.microgrid.update_working_status()
+        self.microgrid.update_environment(self.data_dict, self.get_data_index())
 
         # Calculate the reward based on your cost reduction goal
+        reward = self.step_reward()
+
+        # Return the next observation, reward, done flag, and any additional info
+        return self.end_step(reward)
+
+    def update_actions(self, action):
+        if self.batched:
+            self.microgrid.update_actions(self.get_action_dict(action))
+        else:
+            self.microgrid.update_actions_from_array(action, self.action_layout)
+
+    def step_reward(self):
+        # Reward of the step, recorded by the telemetry if the step is sampled
         reward = self.compute_reward()
+        telemetry = self.telemetry
+        if telemetry is not None and telemetry.is_sampled():
+            telemetry.append(self.get_telemetry_row(reward))
+        return reward
 
+    def end_step(self, reward):
         # Check if the episode is done (you can define a termination condition here)
         self.step_count += 1
-        max_epochs = len(self.data_dict["wind_speed"])
-        done = self.step_count >= max_epochs  # You need to define when an episode is done
+        done = self.step_count >= self.episode_length  # You need to define when an episode is done
+        info = {"TimeLimit.truncated": True} if done and self.truncate else {}
+        return self.get_observation(), reward, done, info
 
-        # Return the next observation, reward, done flag, and any additional info
-        return self.get_observation(), reward, done, {}
+    def enable_profiling(self, profiler=None):
+        """
+        Time the phases of every step with a StepProfiler (see src.profiling), returns the profiler.
+
+        step is replaced by profiled_step for this instance only, so the environment has no
+        overhead at all while profiling is disabled.
+        """
+        if profiler is None:
+            from src.profiling import StepProfiler
+            profiler = StepProfiler()
+        self.profiler = profiler
+        self.step = self.profiled_step
+        return profiler
+
+    def disable_profiling(self):
+        self.__dict__.pop("step", None)
+        self.profiler = None
+
+    def profiled_step(self, action):
+        # step with a timer around each phase
+        profiler = self.profiler
+        timers = profiler.timers
+        clock = time.perf_counter_ns
+        start = clock()
+        if profiler.last_step_end is not None:
+            timers["outside_env"].add(start - profiler.last_step_end)
+
+        self.update_actions(action)
+        t_actions = clock()
+        self.microgrid.update_working_status()
+        t_working_status = clock()
+        self.microgrid.update_environment(self.data_dict, self.get_data_index())
+        t_environment = clock()
+        reward = self.step_reward()
+        t_reward = clock()
+        result = self.end_step(reward)
+        end = clock()
+
+        timers["actions"].add(t_actions - start)
+        timers["working_status"].add(t_working_status - t_actions)
+        timers["environment"].add(t_environment - t_working_status)
+        timers["reward"].add(t_reward - t_environment)
+        timers["observation"].add(end - t_reward)
+        profiler.counters["steps"] += 1
+        profiler.counters["episodes"] += result[2]
+        profiler.last_step_end = end
+        return result
 
     def get_observation(self):
         # Extract relevant information from the Microgrid's state and return it as an observation (environment state)
+        # The observation is assembled in the internal buffer and returned as copy, callers like the VecEnvs keep
+        # observations (e.g. the terminal observation) beyond the next step
         # TODO scaling?
-        return [self.microgrid.solar_irradiance, self.microgrid.wind_speed, self.microgrid.energy_price_utility_grid,
-                self.microgrid.energy_demand, self.microgrid.soc]
+        mg = self.microgrid
+        obs = self.observation
+        if self.batched:
+            obs[:] = (mg.solar_irradiance[0], mg.wind_speed[0], mg.energy_price_utility_grid[0], mg.energy_demand[0],
+                      mg.soc[0])
+            return obs.copy()
+        obs[0] = mg.solar_irradiance
+        obs[1] = mg.wind_speed
+        obs[2] = mg.energy_price_utility_grid
+        obs[3] = mg.energy_demand
+        obs[4] = mg.soc
+        return obs.copy()
+
+    def get_telemetry_row(self, reward):
+        # Values of the current step in the order of telemetry_columns, all of them except the operational cost and
+        # the sell back revenue were computed during the step
+        mg = self.microgrid
+        if self.batched:
+            return (self.telemetry.n_calls, self.step_count, reward, mg.operational_cost()[0], mg.energy_purchased[0],
+                    mg.energy_for_battery_bought[0], mg.energy_for_load_bought[0], mg.sell_back_reward()[0],
+                    mg.energy_demand[0], mg.energy_total[0], mg.actions_discharged[0], mg.actions_purchased[0, LOAD],
+                    mg.actions_purchased[0, BATTERY], mg.energy_solar[0], mg.actions_solar[0], mg.energy_wind[0],
+                    mg.actions_wind[0], mg.energy_generator[0], mg.actions_generator[0],
+                    mg.actions_adjusting_status[0, SOLAR], mg.actions_adjusting_status[0, WIND],
+                    mg.actions_adjusting_status[0, GENERATOR], mg.soc[0], mg.solar_irradiance[0], mg.wind_speed[0],
+                    mg.energy_price_utility_grid[0])
+        return (self.telemetry.n_calls, self.step_count, reward, mg.operational_cost(), mg.energy_purchased,
+                mg.energy_for_battery_bought, mg.energy_for_load_bought, mg.sell_back_reward(), mg.energy_demand,
+                mg.energy_total, mg.actions_discharged, mg.actions_purchased[LOAD], mg.actions_purchased[BATTERY],
+                mg.energy_solar, mg.actions_solar, mg.energy_wind, mg.actions_wind, mg.energy_generator,
+                mg.actions_generator, mg.actions_adjusting_status[SOLAR], mg.actions_adjusting_status[WIND],
+                mg.actions_adjusting_status[GENERATOR], mg.soc, mg.solar_irradiance, mg.wind_speed,
+                mg.energy_price_utility_grid)
 
     def compute_reward(self):
         # negative costs as reward
+        if self.batched:
+            return -self.microgrid.cost_of_epoch()[0]
         return -self.microgrid.cost_of_epoch()
 
     def render(self, mode='human'):
@@ -144,4 +313,11 @@ class MicrogridEnv(gym.Env):
             "energy_price_utility_grid": mg.energy_price_utility_grid,
         }
 
+        if self.batched:
+            # Unpack the single grid of the batched backend
+            info = {key: value[0] if isinstance(value, np.ndarray) else value for key, value in info.items()}
+        info["purchase_energy"] = Microgrid.get_actions_dict(info["purchase_energy"], actions=["load", "battery"])
+        info["actions_adjusting_status"] = Microgrid.get_actions_dict(info["actions_adjusting_status"],
+                                                                      actions=["solar", "wind", "generator"])
+
         return info
@@ -0,0 +1,215 @@
+from gymnasium import spaces
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+
+from src.params import *
+from src.microgrid import get_generation_tables
+from src.batched_microgrid import BatchedMicrogrid, get_batched_action_dict
+from src.env_layout import get_action_dims, observation_low, observation_high
+
+
+class MicrogridVecEnv(VecEnv):
+    def __init__(self, data_dict, n_envs=8, wind=False, wind_generator=True, alternative_cost=False,
+                 start_offsets=None, episode_length=None, auto_reset=True, start_mode="fixed", initial_soc=None,
+                 seed=None, stride=None):
+        """
+        Vectorized MicrogridEnv implementing the stable-baselines3 VecEnv interface.
+
+        All n_envs episodes are advanced by a single BatchedMicrogrid, so one call of
+        step() simulates one hour for every environment. Finished environments are
+        reset automatically, their last observation is returned in
+        infos[i]["terminal_observation"] as with the stable-baselines3 VecEnvs.
+
+        Params:
+            data_dict: hourly environment data, see MicrogridEnv
+            n_envs: number of environments simulated in parallel
+            wind: indicator if solar and wind power should be used for the
+                simulation (question 2)
+            wind_generator: indicator if solar, wind and generator should be
+                used for the simulation (question 3)
+            alternative_cost: use the quadratic cost of purchased energy
+            start_offsets: hour of data_dict at which the first episodes of each
+                environment start. Defaults to offsets evenly spread over the data
+            episode_length: number of hours per episode, defaults to the length
+                of data_dict. Episodes reaching the end of data_dict wrap around to
+                its beginning. Episodes shorter than the data end truncated
+                (info["TimeLimit.truncated"] is True), full-length episodes terminate
+            auto_reset: reset finished environments automatically. If False, the
+                final state of the Microgrids stays accessible after the last step
+                and the caller has to reset the environment
+            start_mode: start hour of the following episodes of an environment,
+                "fixed": always its start offset, "random": a random hour,
+                "strided": stride hours after the previous start. With the default
+                start_offsets and stride (n_envs * episode_length) the environments
+                cover the data in consecutive windows
+            initial_soc: SOC at the start of an episode, soc_min if None, a number
+                or "random" for a uniformly random SOC between soc_min and soc_max
+            seed: seed of the random start hours and SOCs
+            stride: hours between the starts of consecutive episodes of an
+                environment for the "strided" start_mode
+        """
+        self.data_dict = {key: np.asarray(value) for key, value in data_dict.items()}  # hourly environment data
+        self.n_hours = len(self.data_dict["wind_speed"])
+        self.alternative_cost = alternative_cost
+        self.wind = wind
+        self.wind_generator = wind_generator
+        if self.wind and self.wind_generator:
+            print("WARNING parameter wind=True was set to False as wind_generator is already True")
+            self.wind = False
+
+        self.episode_length = self.n_hours if episode_length is None else episode_length
+        self.truncate = self.episode_length != self.n_hours
+        self.auto_reset = auto_reset
+        if start_mode not in ("fixed", "random", "strided"):
+            raise Exception(f"Unknown start_mode {start_mode}, use 'fixed', 'random' or 'strided'")
+        self.start_mode = start_mode
+        self.stride = n_envs * self.episode_length if stride is None else stride
+
+        if start_offsets is None:
+            if start_mode == "strided":
+                start_offsets = np.arange(n_envs) * self.episode_length
+            else:
+                start_offsets = np.arange(n_envs) * self.n_hours // n_envs
+        self.start_offsets = np.asarray(start_offsets, dtype=np.int64) % self.n_hours
+        if self.start_offsets.shape != (n_envs,):
+            raise Exception(f"Expected {n_envs} start offsets, got {self.start_offsets.shape[0]}")
+        self.initial_start_offsets = self.start_offsets.copy()
+        self.initial_soc = initial_soc
+        self.rng = np.random.default_rng(seed)
+
+        self.generation_tables = get_generation_tables(self.data_dict)  # generated energy per hour, computed once
+        self.microgrid = BatchedMicrogrid(n_envs=n_envs, alternative_cost=alternative_cost,
+                                          generation_tables=self.generation_tables)
+        self.step_count = np.zeros(n_envs, dtype=np.int64)
+        self.actions = None
+
+        # Buffer reused for every step, get_observation returns a copy
+        self.buf_obs = np.zeros((n_envs, len(observation_low)))
+
+        super().__init__(num_envs=n_envs,
+                         observation_space=spaces.Box(low=observation_low, high=observation_high, dtype=np.float64),
+                         action_space=spaces.MultiDiscrete(get_action_dims(self.wind, self.wind_generator)))
+
+    def reset(self):
+        # Seeds set with seed() are used by the next reset only, like in the stable-baselines3 VecEnvs
+        seeds = [seed for seed in self._seeds if seed is not None]
+        if seeds:
+            self.rng = np.random.default_rng(seeds)
+        self.step_count[:] = 0
+        if self.start_mode == "fixed":
+            self.start_offsets[:] = self.initial_start_offsets
+        elif self.start_mode == "strided":
+            self.start_offsets[:] = self.initial_start_offsets
+            self.next_start(np.ones(self.num_envs, dtype=bool), first=True)
+        else:
+            self.next_start(np.ones(self.num_envs, dtype=bool))
+        # Reset the Microgrids to their initial state
+        self.microgrid.reset(soc=self.get_initial_soc(self.num_envs))
+        self._reset_seeds()
+        self._reset_options()
+        return self.get_observation()
+
+    def reset_envs(self, mask):
+        """Start the next episode of the environments selected by a boolean mask, returns the observations of all"""
+        self.next_start(mask)
+        self.microgrid.reset(mask, soc=self.get_initial_soc(int(mask.sum())))
+        self.step_count[mask] = 0
+        return self.get_observation()
+
+    def next_start(self, mask, first=False):
+        # Set the start offsets of the next episodes of the environments selected by mask
+        if self.start_mode == "random":
+            self.start_offsets[mask] = self.rng.integers(self.n_hours, size=int(mask.sum()))
+        elif self.start_mode == "strided" and not first:
+            self.start_offsets[mask] = (self.start_offsets[mask] + self.stride) % self.n_hours
+
+    def get_initial_soc(self, n):
+        if self.initial_soc is None:
+            return soc_min
+        if self.initial_soc == "random":
+            return self.rng.uniform(soc_min, soc_max, size=n)
+        return self.initial_soc
+
+    def step_async(self, actions):
+        self.actions = actions
+
+    def step_wait(self):
+        action_dict = get_batched_action_dict(self.actions, wind=self.wind, wind_generator=self.wind_generator)
+
+        # Execute the chosen actions on all Microgrids
+        data_index = (self.start_offsets + self.step_count) % self.n_hours
+        self.microgrid.transition(action_dict, self.data_dict, data_index)
+
+        # negative costs as reward
+        rewards = -self.microgrid.cost_of_epoch()
+
+        self.step_count += 1
+        dones = self.step_count >= self.episode_length
+
+        obs = self.get_observation()
+        # New info dicts every step, callers may keep the infos of earlier steps
+        infos = [{} for _ in range(self.num_envs)]
+        if self.auto_reset and dones.any():
+            for env_idx in np.flatnonzero(dones):
+                infos[env_idx]["terminal_observation"] = obs[env_idx].copy()
+                infos[env_idx]["TimeLimit.truncated"] = self.truncate
+            obs[dones] = self.reset_envs(dones)[dones]
+
+        return obs, rewards, dones, infos
+
+    def get_observation(self):
+        mg = self.microgrid
+        self.buf_obs[:, 0] = mg.solar_irradiance
+        self.buf_obs[:, 1] = mg.wind_speed
+        self.buf_obs[:, 2] = mg.energy_price_utility_grid
+        self.buf_obs[:, 3] = mg.energy_demand
+        self.buf_obs[:, 4] = mg.soc
+        return self.buf_obs.copy()
+
+    def close(self):
+        pass
+
+    def get_attr_owner(self, attr_name):
+        # Attributes of the VecEnv itself or of the Microgrids, e.g. "soc"
+        if hasattr(self, attr_name) or not hasattr(self.microgrid, attr_name):
+            return self
+        return self.microgrid
+
+    def is_per_env(self, value):
+        # Per-environment state is kept in arrays with one entry per environment, everything else is shared
+        return isinstance(value, np.ndarray) and value.ndim > 0 and value.shape[0] == self.num_envs
+
+    def get_attr(self, attr_name, indices=None):
+        value = getattr(self.get_attr_owner(attr_name), attr_name)
+        indices = list(self._get_indices(indices))
+        if self.is_per_env(value):
+            return [value[env_idx] for env_idx in indices]
+        return [value for _ in indices]
+
+    def set_attr(self, attr_name, value, indices=None):
+        owner = self.get_attr_owner(attr_name)
+        current = getattr(owner, attr_name, None)
+        indices = list(self._get_indices(indices))
+        if self.is_per_env(current):
+            current[indices] = value
+        elif sorted(indices) == list(range(self.num_envs)):
+            setattr(owner, attr_name, value)
+        else:
+            raise Exception(f"{attr_name} is shared by all environments and can only be set for all of them")
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        indices = list(self._get_indices(indices))
+        if method_name == "reset":
+            # Reset only the selected environments, one observation per environment
+            mask = np.zeros(self.num_envs, dtype=bool)
+            mask[indices] = True
+            obs = self.reset_envs(mask)
+            return [obs[env_idx] for env_idx in indices]
+
+        # Other methods act on all environments at once, per-environment results are split up
+        result = getattr(self, method_name)(*method_args, **method_kwargs)
+        if self.is_per_env(result):
+            return [result[env_idx] for env_idx in indices]
+        return [result for _ in indices]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
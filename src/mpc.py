@@ -0,0 +1,188 @@
+import time
+
+from src.params import *
+from src.batched_microgrid import BatchedMicrogrid
+from src.dp_solver import get_action_table
+from src.microgrid import get_generation_tables
+
+
+class MPCController(object):
+    def __init__(self, data_dict, horizon=24, beam_width=16, wind=False, wind_generator=True, alternative_cost=False,
+                 start_offsets=None, episode_length=None, time_budget=None):
+        """
+        Rolling-horizon model-predictive controller for MicrogridEnv.
+
+        At every hour the controller searches action sequences for the next horizon
+        hours of data_dict and applies the first action of the cheapest one. The
+        sequences are evaluated with the transition and cost_of_epoch of
+        BatchedMicrogrid, i.e. with the exact Microgrid rules including the grid
+        purchases that are charged again in later hours. The search is a beam search
+        over the non-redundant actions of the action space (see get_action_table):
+        every sequence of the beam is extended by all actions and of the extended
+        sequences, the cheapest one per SOC bin is kept (beam_width bins between
+        soc_min and soc_max), topped up with the next cheapest ones.
+
+        The controller has the predict method of stable-baselines3, so it can be
+        passed to evaluate_policy. It counts the hours itself and keeps a copy of
+        the Microgrid state of every environment, which it updates from the
+        observations (irradiance, wind speed, price, demand and SOC of the last hour).
+
+        Params:
+            data_dict: hourly data the controller looks ahead on, the environment
+                data itself (perfect foresight) or a forecast of it with the same hours
+            horizon: number of hours looked ahead
+            beam_width: number of sequences kept after every hour of the horizon
+            wind, wind_generator, alternative_cost: see MicrogridEnv
+            start_offsets: hour of data_dict at which the episode of every
+                environment starts, defaults to 0 for all
+            episode_length: number of hours per episode, the controller does not
+                look beyond the end of an episode. Defaults to the length of data_dict
+            time_budget: optional time limit per predict call in seconds, the
+                search stops at a shorter horizon if it is exceeded
+        """
+        if wind and wind_generator:
+            wind = False
+        self.data_dict = {key: np.asarray(value, dtype=np.float64) for key, value in data_dict.items()}
+        self.generation_tables = get_generation_tables(self.data_dict)
+        self.n_hours = len(self.data_dict["wind_speed"])
+        self.horizon = horizon
+        self.beam_width = beam_width
+        self.alternative_cost = alternative_cost
+        self.start_offsets = None if start_offsets is None else np.asarray(start_offsets, dtype=np.int64)
+        self.episode_length = episode_length or self.n_hours
+        self.time_budget = time_budget
+        self.actions, self.action_dict = get_action_table(wind, wind_generator)
+
+        # State of the environments, set by the first predict call
+        self.step_count = None
+        self.microgrid = None  # copy of the Microgrid state of every environment
+        self.last_actions = None
+
+    @classmethod
+    def for_test_dicts(cls, test_dicts, **kwargs):
+        """Controller for evaluate_policy, with perfect foresight of every test dict"""
+        n_hours = len(test_dicts[0]["wind_speed"])
+        data_dict = {key: np.concatenate([np.asarray(test_dict[key]) for test_dict in test_dicts])
+                     for key in test_dicts[0]}
+        return cls(data_dict, start_offsets=np.arange(len(test_dicts)) * n_hours, episode_length=n_hours, **kwargs)
+
+    def reset(self, mask=None, soc=soc_min):
+        """Start new episodes for all environments or the ones selected by a boolean mask"""
+        idx = slice(None) if mask is None else mask
+        self.step_count[idx] = 0
+        self.microgrid.reset(mask, soc=soc)
+
+    def observe(self, obs, episode_start):
+        n_envs = len(obs)
+        if self.step_count is None or len(self.step_count) != n_envs:
+            self.step_count = np.zeros(n_envs, dtype=np.int64)
+            self.microgrid = BatchedMicrogrid(n_envs=n_envs, alternative_cost=self.alternative_cost)
+            self.last_actions = None
+            episode_start = np.ones(n_envs, dtype=bool)
+
+        # Replay the last actions with the data of the last hour from the observations
+        if self.last_actions is not None:
+            observed = {"solar_irradiance": obs[:, 0], "wind_speed": obs[:, 1], "rate_consumption_charge": obs[:, 2],
+                        "energy_demand": obs[:, 3]}
+            self.microgrid.transition(self.last_actions, observed, np.arange(n_envs))
+            self.microgrid.soc = obs[:, 4].astype(np.float64)
+            self.step_count += 1
+
+        if episode_start is not None and np.any(episode_start):
+            episode_start = np.asarray(episode_start, dtype=bool)
+            self.reset(episode_start, soc=obs[episode_start, 4])
+
+    def search(self):
+        """Index into self.actions of the first action of the best sequence of every environment"""
+        start = time.perf_counter()
+        n_envs = len(self.step_count)
+        n_actions = len(self.actions)
+        offsets = np.zeros(n_envs, dtype=np.int64) if self.start_offsets is None else self.start_offsets
+        hours = (offsets + self.step_count) % self.n_hours
+        horizons = np.minimum(self.horizon, self.episode_length - self.step_count)
+
+        # Beam of every environment, starting from its current state
+        mg = self.microgrid
+        env_index = np.arange(n_envs)
+        beam = {"soc": mg.soc.copy(), "load_bought": mg.energy_for_load_bought.copy(),
+                "battery_bought": mg.energy_for_battery_bought.copy(), "wind_speed": mg.wind_speed.copy(),
+                "cost": np.zeros(n_envs), "first_action": np.zeros(n_envs, dtype=np.int64)}
+
+        for depth in range(max(horizons.max(), 1)):
+            # Environments whose horizon ended keep their beam
+            active = depth < horizons[env_index] if depth > 0 else np.ones(len(env_index), dtype=bool)
+            parents = np.repeat(np.flatnonzero(active), n_actions)
+            action_index = np.tile(np.arange(n_actions), active.sum())
+
+            grid = BatchedMicrogrid(n_envs=len(parents), alternative_cost=self.alternative_cost,
+                                    generation_tables=self.generation_tables)
+            grid.soc = beam["soc"][parents]
+            grid.energy_for_load_bought = beam["load_bought"][parents]
+            grid.energy_for_battery_bought = beam["battery_bought"][parents]
+            grid.wind_speed = beam["wind_speed"][parents]
+            action_dict = {key: value[action_index] for key, value in self.action_dict.items()}
+            grid.transition(action_dict, self.data_dict, (hours[env_index[parents]] + depth) % self.n_hours)
+
+            candidates = {"soc": grid.soc, "load_bought": grid.energy_for_load_bought,
+                          "battery_bought": grid.energy_for_battery_bought, "wind_speed": grid.wind_speed,
+                          "cost": beam["cost"][parents] + grid.cost_of_epoch(),
+                          "first_action": action_index if depth == 0 else beam["first_action"][parents]}
+            candidate_env = env_index[parents]
+
+            # Keep the finished beams of inactive environments next to the pruned candidates
+            kept_index = [self.prune(candidates["soc"][mask], candidates["cost"][mask], np.flatnonzero(mask))
+                          for mask in (candidate_env == env for env in range(n_envs)) if mask.any()]
+            kept_index = np.concatenate(kept_index)
+            inactive = np.flatnonzero(~active)
+            beam = {key: np.concatenate([beam[key][inactive], candidates[key][kept_index]]) for key in beam}
+            env_index = np.concatenate([env_index[inactive], candidate_env[kept_index]])
+
+            if self.time_budget is not None and time.perf_counter() - start > self.time_budget:
+                break
+
+        # First action of the cheapest sequence of every environment
+        first_action = np.zeros(n_envs, dtype=np.int64)
+        order = np.lexsort((beam["cost"], env_index))
+        _, first = np.unique(env_index[order], return_index=True)
+        best_index = order[first]
+        first_action[env_index[best_index]] = beam["first_action"][best_index]
+        return first_action
+
+    def prune(self, soc, cost, index):
+        # Cheapest candidate per SOC bin, filled up with the cheapest remaining candidates to beam_width
+        order = np.argsort(cost, kind="stable")
+        bins = np.minimum(((soc[order] - soc_min) / (soc_max - soc_min) * self.beam_width).astype(np.int64),
+                          self.beam_width - 1)
+        _, first = np.unique(bins, return_index=True)
+        kept = np.zeros(len(order), dtype=bool)
+        kept[first] = True
+        n_rest = self.beam_width - kept.sum()
+        if n_rest > 0:
+            kept[np.flatnonzero(~kept)[:n_rest]] = True
+        return index[order[kept]]
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=True):
+        """
+        Actions for the observations of one or several environments, see MPCController.
+
+        Params:
+            observation: observation of shape (5,) or (n_envs, 5) of MicrogridEnv
+            state: unused
+            episode_start: optional boolean array, environments whose episode
+                starts with this observation. The first call always starts episodes
+            deterministic: unused, the controller is deterministic
+        Returns:
+            MicrogridEnv actions of shape (n_actions,) or (n_envs, n_actions) and
+            the state (None)
+        """
+        observation = np.asarray(observation, dtype=np.float64)
+        single = observation.ndim == 1
+        obs = observation[None] if single else observation
+        if single and episode_start is not None:
+            episode_start = np.atleast_1d(episode_start)
+        self.observe(obs, episode_start)
+
+        action_index = self.search()
+        self.last_actions = {key: value[action_index] for key, value in self.action_dict.items()}
+        actions = self.actions[action_index]
+        return (actions[0] if single else actions), state
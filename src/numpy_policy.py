@@ -0,0 +1,138 @@
+import numpy as np
+
+# Exported policies only need NumPy, stable-baselines3 and torch are imported by export_policy alone
+activations = {"Tanh": np.tanh, "ReLU": lambda x: np.maximum(x, 0, out=x)}
+
+
+def get_numpy_policy_path(save_name, model_path="output/models"):
+    # Exported policies are stored next to the model of the run
+    return f"{model_path}/model_{save_name}_policy.npz"
+
+
+def export_policy(model, path, obs_rms=None):
+    """
+    Export the actor of a stable-baselines3 PPO MlpPolicy to a .npz file for NumpyPolicy.
+
+    Stores the weights of the hidden layers of the policy network and of the
+    action head as float32, the activation function and the sizes of the
+    MultiDiscrete action space. The value network is not needed for inference
+    and left out.
+
+    Params:
+        model: PPO model or path of a saved model, e.g. output/models/model_<run>
+        path: file the policy is written to, see get_numpy_policy_path
+        obs_rms: optional RunningMeanStd the policy was trained with, stored so that
+            NumpyPolicy normalizes the observations itself
+    """
+    import torch
+    from stable_baselines3 import PPO
+
+    if not isinstance(model, PPO):
+        model = PPO.load(model, device="cpu")
+    policy = model.policy
+    if not hasattr(model.action_space, "nvec"):
+        raise Exception(f"Only MultiDiscrete action spaces are supported, got {model.action_space}")
+
+    hidden_layers = [module for module in policy.mlp_extractor.policy_net if isinstance(module, torch.nn.Linear)]
+    activation = {type(module).__name__ for module in policy.mlp_extractor.policy_net
+                  if not isinstance(module, torch.nn.Linear)}
+    if len(activation) > 1 or not activation <= set(activations):
+        raise Exception(f"Unsupported activation functions {activation}, supported are {list(activations)}")
+
+    # Weights are stored transposed, as (in_features, out_features), for obs @ weight
+    arrays = {}
+    for i, layer in enumerate(hidden_layers + [policy.action_net]):
+        arrays[f"weight_{i}"] = layer.weight.detach().cpu().numpy().T.astype(np.float32)
+        arrays[f"bias_{i}"] = layer.bias.detach().cpu().numpy().astype(np.float32)
+    arrays["n_layers"] = np.array(len(hidden_layers) + 1)
+    arrays["activation"] = np.array(activation.pop() if activation else "Tanh")
+    arrays["nvec"] = np.asarray(model.action_space.nvec, dtype=np.int64)
+    if obs_rms is not None:
+        arrays["obs_mean"] = np.asarray(obs_rms.mean, dtype=np.float64)
+        arrays["obs_var"] = np.asarray(obs_rms.var, dtype=np.float64)
+
+    with open(path, "wb") as file:
+        np.savez(file, **arrays)
+
+
+class NumpyPolicy(object):
+    def __init__(self, weights, biases, nvec, activation="Tanh", obs_mean=None, obs_var=None, epsilon=1e-8):
+        """
+        Pure NumPy inference of a PPO MlpPolicy exported with export_policy.
+
+        Deterministic actions are the same as the ones of model.predict(obs,
+        deterministic=True): the hidden layers with activation followed by the
+        action head give the logits of every MultiDiscrete action, the action is
+        the argmax of its logits. Only logits that are equal up to float32 rounding
+        can give a different action, as NumPy and torch sum the matmuls in a
+        different order. All observations of a batch are evaluated with one
+        float32 matmul per layer.
+
+        Params:
+            weights: list of the layer weights of shape (in_features, out_features),
+                the last one is the action head
+            biases: list of the layer biases
+            nvec: number of choices of every MultiDiscrete action
+            activation: activation function of the hidden layers, "Tanh" or "ReLU"
+            obs_mean, obs_var: observation statistics, observations are normalized
+                with them if given (see RunningMeanStd.normalize)
+            epsilon: stability parameter of the normalization
+        """
+        self.weights = [np.ascontiguousarray(weight, dtype=np.float32) for weight in weights]
+        self.biases = [np.asarray(bias, dtype=np.float32) for bias in biases]
+        self.nvec = np.asarray(nvec, dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(self.nvec)])
+        self.activation = activations[activation]
+        self.obs_mean = None if obs_mean is None else np.asarray(obs_mean, dtype=np.float64)
+        self.obs_std = None if obs_var is None else np.sqrt(np.asarray(obs_var, dtype=np.float64) + epsilon)
+
+    @classmethod
+    def load(cls, path):
+        """Load a policy written by export_policy"""
+        with np.load(path) as data:
+            n_layers = int(data["n_layers"])
+            return cls([data[f"weight_{i}"] for i in range(n_layers)], [data[f"bias_{i}"] for i in range(n_layers)],
+                       data["nvec"], activation=str(data["activation"]),
+                       obs_mean=data["obs_mean"] if "obs_mean" in data else None,
+                       obs_var=data["obs_var"] if "obs_var" in data else None)
+
+    def logits(self, obs):
+        """Action logits of shape (n_obs, sum(nvec)) for observations of shape (n_obs, n_features)"""
+        # Normalized in float64 like RunningMeanStd.normalize, the network runs in float32 like the torch policy
+        if self.obs_mean is not None:
+            obs = (np.asarray(obs, dtype=np.float64) - self.obs_mean) / self.obs_std
+        x = np.asarray(obs, dtype=np.float32)
+        for weight, bias in zip(self.weights[:-1], self.biases[:-1]):
+            x = x @ weight
+            x += bias
+            x = self.activation(x)
+        x = x @ self.weights[-1]
+        x += self.biases[-1]
+        return x
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=True, rng=None):
+        """
+        Actions for one observation or a batch of observations, with the signature of
+        stable-baselines3's predict so that the policy can be passed to evaluate_policy.
+
+        Params:
+            observation: observation of shape (n_features,) or (n_obs, n_features)
+            state, episode_start: unused, the policy is not recurrent
+            deterministic: argmax actions if True, sampled from the action
+                distribution otherwise
+            rng: numpy Generator used for sampling
+        Returns:
+            actions of shape (len(nvec),) or (n_obs, len(nvec)) and the state (None)
+        """
+        observation = np.asarray(observation)
+        single = observation.ndim == 1
+        logits = self.logits(observation[None] if single else observation)
+        if not deterministic:
+            # Gumbel-max trick, the argmax of the perturbed logits is a sample of the categorical distribution
+            rng = rng if rng is not None else np.random.default_rng()
+            logits = logits - np.log(-np.log(rng.random(logits.shape, dtype=np.float32)))
+
+        actions = np.empty((len(logits), len(self.nvec)), dtype=np.int64)
+        for i in range(len(self.nvec)):
+            actions[:, i] = logits[:, self.offsets[i]:self.offsets[i + 1]].argmax(axis=1)
+        return (actions[0] if single else actions), state
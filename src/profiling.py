@@ -0,0 +1,72 @@
+import numpy as np
+
+n_buckets = 48  # histogram buckets of durations in powers of two nanoseconds, the last one is ~39 hours
+step_phases = ("actions", "working_status", "environment", "reward", "observation", "outside_env")
+
+
+class PhaseTimer(object):
+    __slots__ = ("count", "total", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0  # nanoseconds
+        self.histogram = [0] * n_buckets  # bucket i counts durations in [2^(i-1), 2^i) ns
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.histogram[min(duration.bit_length(), n_buckets - 1)] += 1
+
+    def percentile(self, q):
+        """Upper bound of the q-th percentile (0 <= q <= 100) in nanoseconds, from the histogram"""
+        if self.count == 0:
+            return 0
+        rank = q / 100 * self.count
+        cumulative = np.cumsum(self.histogram)
+        return 2 ** int(np.searchsorted(cumulative, rank))
+
+
+class StepProfiler(object):
+    def __init__(self, phases=step_phases):
+        """
+        Per-phase timers and counters of MicrogridEnv.step, see MicrogridEnv.enable_profiling.
+
+        Durations are measured with the monotonic time.perf_counter_ns clock and
+        collected per phase as count, total and a histogram with power of two
+        buckets. "outside_env" is the time between two steps, i.e. the policy and
+        the stable-baselines3 overhead during training.
+        """
+        self.timers = {phase: PhaseTimer() for phase in phases}
+        self.counters = {"steps": 0, "episodes": 0}
+        self.last_step_end = None
+
+    def reset(self):
+        for timer in self.timers.values():
+            timer.__init__()
+        for key in self.counters:
+            self.counters[key] = 0
+        self.last_step_end = None
+
+    def summary(self):
+        """Dict of count, mean, p50, p99 (in us), total (in s) and share of the total time per phase"""
+        total = sum(timer.total for timer in self.timers.values()) or 1
+        return {phase: {"count": timer.count,
+                        "mean_us": timer.total / timer.count / 1e3 if timer.count else 0.,
+                        "p50_us": timer.percentile(50) / 1e3,
+                        "p99_us": timer.percentile(99) / 1e3,
+                        "total_s": timer.total / 1e9,
+                        "share": timer.total / total}
+                for phase, timer in self.timers.items()}
+
+    def record_to_logger(self, logger, prefix="profile"):
+        """
+        Record the summary with a stable-baselines3 logger, e.g. to output/logs/<run>/progress.json.
+        The histograms are only written to JSON outputs.
+        """
+        for phase, stats in self.summary().items():
+            for key, value in stats.items():
+                logger.record(f"{prefix}/{phase}_{key}", value)
+            logger.record(f"{prefix}/{phase}_histogram", np.array(self.timers[phase].histogram),
+                          exclude=("stdout", "log", "csv", "tensorboard"))
+        for key, value in self.counters.items():
+            logger.record(f"{prefix}/{key}", value)
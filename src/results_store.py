@@ -0,0 +1,360 @@
+import ast
+import csv
+import glob
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+from src.get_data import file_lock, atomic_file
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional, the parts are stored as .npz files without it
+    pyarrow = None
+
+config_path = "output/configs"
+logs_path = "output/logs"
+train_data_path = "output/train_data"
+results_path = "output/results"
+tables = ("metrics", "telemetry")
+
+# Nested dict columns of the CSVs written from MicrogridEnv.render, split into the flat columns of telemetry_columns
+nested_columns = {"purchase_energy": "purchase_energy_", "actions_adjusting_status": "adjusting_status_"}
+filter_operators = {"==": np.equal, "!=": np.not_equal, "<": np.less, "<=": np.less_equal, ">": np.greater,
+                    ">=": np.greater_equal, "in": np.isin}
+
+
+def get_head_hash(path, n_bytes=256):
+    # Hash and length of the first n_bytes of a file, detects files that were rewritten from scratch, e.g. when a run
+    # is trained again. Files shorter than n_bytes are hashed as far as they are written
+    with open(path, "rb") as file:
+        head = file.read(n_bytes)
+    return hashlib.sha1(head).hexdigest(), len(head)
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def parse_nested(value):
+    # Dict repr of a nested column. Numpy 2 scalars are written as e.g. np.int64(1) or np.True_, which
+    # ast.literal_eval rejects, so they are replaced by their plain Python repr first
+    value = re.sub(r"np\.(?:True|False)_", lambda match: match.group(0)[3:-1], value)
+    return ast.literal_eval(re.sub(r"np\.\w+\(([^()]*)\)", r"\1", value))
+
+
+def read_new_lines(path, offset):
+    """Complete lines of a file after byte offset, returns them and the offset after the last complete line"""
+    with open(path, "rb") as file:
+        file.seek(offset)
+        data = file.read()
+    end = data.rfind(b"\n") + 1
+    return data[:end].decode().splitlines(), offset + end
+
+
+def rows_to_columns(rows):
+    # List of dicts to dict of float64 columns, missing values are NaN
+    columns = {}
+    for row in rows:
+        for key in row:
+            columns.setdefault(key, None)
+    return {key: np.array([to_float(row.get(key)) for row in rows], dtype=np.float64) for key in columns}
+
+
+class ResultsStore(object):
+    def __init__(self, path=results_path, file_format=None):
+        """
+        Columnar store of the training metrics and telemetry of all runs.
+
+        sync appends the rows that were added to output/logs/<run>/progress.json
+        ("metrics") and output/train_data/<run>(.csv) ("telemetry") since the last
+        sync as new part files, partitioned by table and run:
+        path/<table>/run=<run>/part_<n>.<parquet|npz>. Source files are never read
+        twice. The index (path/index.json) holds the config of every run from
+        output/configs, the parts with their number of rows and the min/max of
+        every column.
+
+        read only opens the parts of the requested runs whose min/max can satisfy
+        the filters (predicate pushdown) and only reads the requested columns
+        (column pushdown). With since=cursor(table) it returns only the rows added
+        after the cursor was taken.
+
+        Params:
+            path: directory of the store
+            file_format: "parquet" or "npz", defaults to "parquet" if pyarrow is
+                installed. Parts of both formats can be read
+        """
+        if file_format is None:
+            file_format = "parquet" if pyarrow is not None else "npz"
+        if file_format == "parquet" and pyarrow is None:
+            raise Exception("file_format 'parquet' requires pyarrow, use 'npz'")
+        self.path = path
+        self.file_format = file_format
+        self.index_file = os.path.join(path, "index.json")
+        self.load_index()
+
+    def load_index(self):
+        if os.path.exists(self.index_file):
+            with open(self.index_file, "r") as file:
+                self.index = json.load(file)
+        else:
+            self.index = {"runs": {}}
+
+    def save_index(self):
+        # Write to a temporary file first so that readers never see a partially written index
+        with atomic_file(self.index_file) as tmp_file:
+            with open(tmp_file, "w") as file:
+                json.dump(self.index, file)
+
+    def get_run(self, run_name):
+        return self.index["runs"].setdefault(run_name, {"config": {}, "tables": {table: {"parts": [], "source": {}}
+                                                                                 for table in tables}})
+
+    def update_configs(self):
+        """Add the parameters of all configs in output/configs to the index"""
+        for config_file in sorted(glob.glob(os.path.join(config_path, "config_*.json"))):
+            run_name = os.path.basename(config_file)[len("config_"):-len(".json")]
+            with open(config_file, "r") as json_file:
+                self.get_run(run_name)["config"] = json.load(json_file)
+
+    def sync(self, run_names=None):
+        """
+        Append the new rows of the logs and train data to the store.
+
+        Params:
+            run_names: runs to sync, defaults to all runs with a config in output/configs
+        Returns:
+            dict of run name to the number of new rows per table
+        """
+        # Stores syncing at the same time (e.g. a notebook and a sweep) take turns, each one continues from the
+        # index the previous one saved
+        os.makedirs(self.path, exist_ok=True)
+        with file_lock(os.path.join(self.path, "index.lock")):
+            self.load_index()
+            self.update_configs()
+            new_rows = {}
+            for run_name in run_names or sorted(self.index["runs"]):
+                run = self.get_run(run_name)
+                new_rows[run_name] = {"metrics": self.sync_metrics(run_name, run["tables"]["metrics"]),
+                                      "telemetry": self.sync_telemetry(run_name, run["tables"]["telemetry"])}
+            self.save_index()
+        return new_rows
+
+    def sync_metrics(self, run_name, table):
+        # One JSON object per line of progress.json, written by the stable-baselines3 logger
+        progress_file = os.path.join(logs_path, run_name, "progress.json")
+        if not os.path.exists(progress_file):
+            return 0
+        source = self.check_source(run_name, "metrics", table, progress_file)
+        lines, source["offset"] = read_new_lines(progress_file, source.get("offset", 0))
+        return self.append(run_name, "metrics", table, rows_to_columns([json.loads(line) for line in lines if line]))
+
+    def sync_telemetry(self, run_name, table):
+        # Chunks of a TelemetryRecorder in train_data/<run>/ or the CSV train_data/<run>.csv
+        chunk_files = sorted(glob.glob(os.path.join(train_data_path, run_name, "chunk_*")))
+        csv_file = os.path.join(train_data_path, f"{run_name}.csv")
+        if chunk_files:
+            source = self.check_source(run_name, "telemetry", table, chunk_files[0])
+            n_rows = 0
+            for chunk_file in chunk_files[len(source.get("chunks", [])):]:
+                n_rows += self.append(run_name, "telemetry", table, self.read_chunk(chunk_file))
+                source.setdefault("chunks", []).append(os.path.basename(chunk_file))
+            return n_rows
+        if not os.path.exists(csv_file):
+            return 0
+
+        source = self.check_source(run_name, "telemetry", table, csv_file)
+        with open(csv_file, "rb") as file:
+            header_line = file.readline()
+        if not header_line.endswith(b"\n"):
+            return 0
+        header = next(csv.reader([header_line.decode()]))
+        header_end = len(header_line)
+        lines, source["offset"] = read_new_lines(csv_file, max(source.get("offset", 0), header_end))
+
+        rows = []
+        for values in csv.reader(lines):
+            row = {}
+            for column, value in zip(header, values):
+                if column == "":
+                    continue  # index of the DataFrame the CSV was written from
+                if column in nested_columns:
+                    for key, item in parse_nested(value).items():
+                        row[nested_columns[column] + key] = item
+                else:
+                    row[column] = value
+            rows.append(row)
+        return self.append(run_name, "telemetry", table, rows_to_columns(rows))
+
+    @staticmethod
+    def read_chunk(chunk_file):
+        if chunk_file.endswith(".npz"):
+            with np.load(chunk_file) as chunk:
+                return {column: chunk[column].astype(np.float64) for column in chunk.files}
+        import pandas as pd
+        frame = pd.read_parquet(chunk_file)
+        return {column: frame[column].to_numpy(dtype=np.float64) for column in frame.columns}
+
+    def check_source(self, run_name, table_name, table, source_file):
+        # Start the table of the run from scratch if its source file was rewritten. The head is compared over the
+        # length it had at the last sync, so a source that was shorter than the head and grew is not rewritten
+        source = table["source"]
+        head_bytes = source.get("head_bytes", 256)
+        if "head_hash" in source and get_head_hash(source_file, head_bytes)[0] != source["head_hash"]:
+            for part in table["parts"]:
+                part_file = os.path.join(self.path, table_name, f"run={run_name}", part["file"])
+                if os.path.exists(part_file):
+                    os.remove(part_file)
+            table["parts"] = []
+            table["source"] = {}
+        table["source"]["head_hash"], table["source"]["head_bytes"] = get_head_hash(source_file)
+        return table["source"]
+
+    def append(self, run_name, table_name, table, columns):
+        """Write columns as new part of a table of a run, returns the number of rows"""
+        n_rows = len(next(iter(columns.values()))) if columns else 0
+        if n_rows == 0:
+            return 0
+        part_dir = os.path.join(self.path, table_name, f"run={run_name}")
+        os.makedirs(part_dir, exist_ok=True)
+        part_name = f"part_{len(table['parts']):05d}.{self.file_format}"
+        part_file = os.path.join(part_dir, part_name)
+
+        names = list(columns)
+        with atomic_file(part_file) as tmp_file:
+            if self.file_format == "parquet":
+                pyarrow.parquet.write_table(pyarrow.table(columns), tmp_file)
+            else:
+                # Column names like "train/loss" are no valid .npz keys, the names are kept in the index
+                with open(tmp_file, "wb") as file:
+                    np.savez(file, **{f"column_{i}": columns[name] for i, name in enumerate(names)})
+
+        stats = {}
+        for name in names:
+            finite = columns[name][~np.isnan(columns[name])]
+            stats[name] = [float(finite.min()), float(finite.max())] if len(finite) else None
+        start = table["parts"][-1]["start"] + table["parts"][-1]["rows"] if table["parts"] else 0
+        table["parts"].append({"file": part_name, "start": start, "rows": n_rows, "columns": names, "stats": stats})
+        return n_rows
+
+    def get_runs(self, **conditions):
+        """Names of the runs whose config has the given values, e.g. get_runs(wind=True, random=False)"""
+        return sorted(run_name for run_name, run in self.index["runs"].items()
+                      if all(run["config"].get(key) == value for key, value in conditions.items()))
+
+    def get_configs(self):
+        """DataFrame of the config parameters of all runs in the index"""
+        import pandas as pd
+        return pd.DataFrame.from_dict({run_name: run["config"] for run_name, run in self.index["runs"].items()},
+                                      orient="index")
+
+    def get_columns(self, table_name, run_names=None):
+        """Columns of a table in the order they first appear"""
+        columns = {}
+        for run_name in run_names or sorted(self.index["runs"]):
+            if run_name not in self.index["runs"]:
+                continue
+            for part in self.index["runs"][run_name]["tables"][table_name]["parts"]:
+                columns.update(dict.fromkeys(part["columns"]))
+        return list(columns)
+
+    def cursor(self, table_name):
+        """Number of rows per run of a table, pass to read(since=...) to only read rows added later"""
+        cursor = {}
+        for run_name, run in self.index["runs"].items():
+            parts = run["tables"][table_name]["parts"]
+            cursor[run_name] = parts[-1]["start"] + parts[-1]["rows"] if parts else 0
+        return cursor
+
+    def read(self, table_name, run_names=None, columns=None, filters=None, since=None, as_frame=True):
+        """
+        Read rows of a table.
+
+        Params:
+            table_name: "metrics" or "telemetry"
+            run_names: runs to read, defaults to all runs
+            columns: columns to read, defaults to all columns of the runs
+            filters: list of (column, operator, value) conditions that all rows
+                have to meet, operator is one of ==, !=, <, <=, >, >= and in, e.g.
+                [("reward", "<", -1000)]. Rows with NaN in a filtered column are dropped
+            since: cursor (see cursor) of rows that were read before
+            as_frame: return a DataFrame, a dict of numpy columns otherwise
+        Returns:
+            the rows with a "run" column and the requested columns, missing values
+            are NaN
+        """
+        filters = filters or []
+        for _, operator, _ in filters:
+            if operator not in filter_operators:
+                raise Exception(f"Unknown filter operator {operator}, use one of {list(filter_operators)}")
+        run_names = run_names or sorted(self.index["runs"])
+        columns = columns or self.get_columns(table_name, run_names)
+        needed = list(dict.fromkeys(columns + [column for column, _, _ in filters]))
+
+        blocks = []
+        for run_name in run_names:
+            if run_name not in self.index["runs"]:
+                continue
+            for part in self.index["runs"][run_name]["tables"][table_name]["parts"]:
+                skip_rows = (since or {}).get(run_name, 0) - part["start"]
+                if skip_rows >= part["rows"] or not self.may_match(part, filters):
+                    continue
+                data = self.read_part(table_name, run_name, part, needed)
+                data = {column: values[max(skip_rows, 0):] for column, values in data.items()}
+                mask = np.ones(part["rows"] - max(skip_rows, 0), dtype=bool)
+                for column, operator, value in filters:
+                    mask &= filter_operators[operator](data[column], value) & ~np.isnan(data[column])
+                block = {column: data[column][mask] for column in columns}
+                block["run"] = np.full(mask.sum(), run_name, dtype=object)
+                blocks.append(block)
+
+        result = {column: np.concatenate([block[column] for block in blocks]) if blocks else np.zeros(0)
+                  for column in ["run"] + columns}
+        if as_frame:
+            import pandas as pd
+            return pd.DataFrame(result)
+        return result
+
+    @staticmethod
+    def may_match(part, filters):
+        # Predicate pushdown, False if the min/max of the part rule out every row
+        for column, operator, value in filters:
+            stats = part["stats"].get(column)
+            if stats is None:
+                return False  # column missing or only NaN in this part
+            low, high = stats
+            if operator == "in":
+                values = np.asarray(value, dtype=np.float64)
+                if not np.any((values >= low) & (values <= high)):
+                    return False
+            elif (operator == "==" and not low <= value <= high) or (operator == "<" and not low < value) or \
+                    (operator == "<=" and not low <= value) or (operator == ">" and not high > value) or \
+                    (operator == ">=" and not high >= value) or (operator == "!=" and low == high == value):
+                return False
+        return True
+
+    def read_part(self, table_name, run_name, part, columns):
+        """Columns of a part, only the requested columns are read from the file"""
+        part_file = os.path.join(self.path, table_name, f"run={run_name}", part["file"])
+        available = [column for column in columns if column in part["columns"]]
+        data = {}
+        if part["file"].endswith(".parquet"):
+            table = pyarrow.parquet.read_table(part_file, columns=available)
+            for column in available:
+                data[column] = table.column(column).to_numpy(zero_copy_only=False).astype(np.float64)
+        else:
+            # Arrays of a .npz file are only loaded when accessed
+            with np.load(part_file) as npz:
+                for column in available:
+                    data[column] = npz[f"column_{part['columns'].index(column)}"]
+        for column in columns:
+            if column not in data:
+                data[column] = np.full(part["rows"], np.nan)
+        return data
@@ -0,0 +1,89 @@
+from src.params import *
+
+noisy_keys = ["energy_demand", "solar_irradiance", "wind_speed"]  # rate_consumption_charge stays unchanged
+
+
+class ScenarioGenerator(object):
+    def __init__(self, data_dict, block_length=7 * 24, noise_scale=0.1, noise_correlation=0.9):
+        """
+        Synthetic test scenarios drawn from the hourly data of get_data_dict.
+
+        Scenarios are a block bootstrap of the data: blocks of block_length
+        consecutive hours are copied from random days of the data, so the daily
+        (and within a block the weekly) structure of demand, irradiance, wind and
+        price is kept. Demand, irradiance and wind speed are multiplied by
+        1 + noise, where the noise of each series is an AR(1) process with standard
+        deviation noise_scale and lag-1 correlation noise_correlation.
+
+        Every scenario is defined by its seed alone and is produced lazily in
+        chunks, so many scenarios can be evaluated in parallel without
+        materializing all of them.
+
+        Params:
+            data_dict: hourly environment data, see get_data_dict
+            block_length: hours per bootstrap block, a multiple of 24
+            noise_scale: standard deviation of the multiplicative noise
+            noise_correlation: lag-1 autocorrelation of the noise
+        """
+        if block_length % 24 != 0:
+            raise Exception(f"block_length must be a multiple of 24 hours, got {block_length}")
+        self.data_dict = {key: np.asarray(value, dtype=np.float64) for key, value in data_dict.items()}
+        self.n_hours = len(self.data_dict["wind_speed"])
+        if block_length > self.n_hours:
+            raise Exception(f"block_length {block_length} exceeds the {self.n_hours} hours of data")
+        self.block_length = block_length
+        self.noise_scale = noise_scale
+        self.noise_correlation = noise_correlation
+        self.n_block_starts = (self.n_hours - block_length) // 24 + 1  # blocks start at midnight
+
+    def stream(self, seed, chunk_size=7 * 24, n_hours=None):
+        """
+        Lazily generate the scenario of a seed.
+
+        Params:
+            seed: seed of the scenario, the same seed always gives the same scenario
+            chunk_size: hours per yielded chunk
+            n_hours: length of the scenario, endless if None. The last chunk is
+                shorter if n_hours is not a multiple of chunk_size
+        Yields:
+            data dicts with the keys of data_dict and chunk_size hours each
+        """
+        # Separate streams for the blocks and the noise make the scenario independent of chunk_size
+        block_rng, noise_rng = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(2)]
+        rho = self.noise_correlation
+        innovation_scale = self.noise_scale * np.sqrt(1 - rho * rho)
+        noise = noise_rng.normal(scale=self.noise_scale, size=len(noisy_keys))  # stationary start of the AR(1) process
+
+        pending = np.empty(0, dtype=np.int64)  # data indices of the current block not yet yielded
+        n_yielded = 0
+        while n_hours is None or n_yielded < n_hours:
+            size = chunk_size if n_hours is None else min(chunk_size, n_hours - n_yielded)
+
+            # Draw new blocks until the chunk is covered
+            n_blocks = max(0, -(-(size - len(pending)) // self.block_length))
+            starts = block_rng.integers(self.n_block_starts, size=n_blocks) * 24
+            blocks = (starts[:, None] + np.arange(self.block_length)).ravel()
+            pending = np.concatenate([pending, blocks])
+            indices, pending = pending[:size], pending[size:]
+
+            # AR(1) noise, the state carries over to the next chunk
+            innovations = noise_rng.normal(scale=innovation_scale, size=(size, len(noisy_keys)))
+            noise_chunk = np.empty_like(innovations)
+            for t in range(size):
+                noise = rho * noise + innovations[t]
+                noise_chunk[t] = noise
+
+            chunk = {key: value[indices] for key, value in self.data_dict.items()}
+            for i, key in enumerate(noisy_keys):
+                chunk[key] *= np.maximum(1 + noise_chunk[:, i], 0)
+            n_yielded += size
+            yield chunk
+
+    def get_scenario(self, seed, n_hours):
+        """Complete scenario of n_hours hours as one data dict, e.g. as test data of MicrogridEnv"""
+        chunks = list(self.stream(seed, chunk_size=n_hours, n_hours=n_hours))
+        return chunks[0]
+
+    def get_scenarios(self, seeds, n_hours):
+        """List of the scenarios of several seeds, see get_scenario"""
+        return [self.get_scenario(seed, n_hours) for seed in seeds]
@@ -0,0 +1,238 @@
+import multiprocessing as mp
+import os
+from multiprocessing import shared_memory
+
+from gymnasium import spaces
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+
+from src.params import *
+from src.env_layout import get_action_dims, observation_low, observation_high
+from src.microgrid_vec_env import MicrogridVecEnv
+
+data_keys = ["energy_demand", "solar_irradiance", "wind_speed", "rate_consumption_charge"]
+
+
+def create_shared_array(array):
+    """Copy an array into a new shared memory block, returns the block and an array backed by it"""
+    array = np.asarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared_array = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    shared_array[:] = array
+    return shm, shared_array
+
+
+def attach_shared_array(spec):
+    """Attach (zero-copy) to a shared array described by a (name, shape, dtype) spec"""
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _worker(remote, parent_remote, specs, env_kwargs, env_slice, seed):
+    parent_remote.close()
+    shms, arrays = {}, {}
+    for key, spec in specs.items():
+        shms[key], arrays[key] = attach_shared_array(spec)
+
+    data_dict = {key: arrays[key] for key in data_keys}
+    start, stop = env_slice
+    venv = MicrogridVecEnv(data_dict, n_envs=stop - start, start_offsets=arrays["start_offsets"][start:stop],
+                           seed=seed, **env_kwargs)
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                obs, rewards, dones, infos = venv.step(arrays["actions"][start:stop])
+                arrays["obs"][start:stop] = obs
+                arrays["rewards"][start:stop] = rewards
+                arrays["dones"][start:stop] = dones
+                for env_idx in np.flatnonzero(dones):
+                    arrays["terminal_obs"][start + env_idx] = infos[env_idx]["terminal_observation"]
+                remote.send(None)
+            elif cmd == "reset":
+                venv._seeds = data  # seeds of the environments of this worker for this reset
+                arrays["obs"][start:stop] = venv.reset()
+                remote.send(None)
+            elif cmd in ("get_attr", "set_attr", "env_method"):
+                # data holds the arguments with indices local to this worker, errors are raised in the main process
+                try:
+                    remote.send(getattr(venv, cmd)(*data[0], indices=data[1], **data[2]))
+                except Exception as error:
+                    remote.send(error)
+            elif cmd == "close":
+                break
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Release all views into the shared memory before detaching from it
+        venv = data_dict = None
+        arrays.clear()
+        for shm in shms.values():
+            shm.close()
+        remote.close()
+
+
+class SharedMemoryVecEnv(VecEnv):
+    def __init__(self, data_dict, n_envs=8, n_workers=None, wind=False, wind_generator=True, alternative_cost=False,
+                 start_offsets=None, episode_length=None, start_method=None, start_mode="fixed", initial_soc=None,
+                 seed=None):
+        """
+        Process-parallel MicrogridVecEnv with the environment data in shared memory.
+
+        The arrays of data_dict are copied into shared memory once and every worker
+        process attaches to them without copying. Each worker simulates a contiguous
+        block of the n_envs environments with its own MicrogridVecEnv. Actions,
+        observations, rewards and dones are exchanged through shared buffers as
+        well, so a step costs one small message to and from each worker, no matter
+        how many environments it simulates.
+
+        Params:
+            data_dict: hourly environment data, see MicrogridEnv
+            n_envs: total number of environments
+            n_workers: number of worker processes, defaults to the number of CPUs
+            wind, wind_generator, alternative_cost, start_offsets, episode_length,
+                start_mode, initial_soc: see MicrogridVecEnv
+            seed: seed of the random start hours and SOCs, every worker gets its
+                own stream
+            start_method: multiprocessing start method, defaults to "forkserver"
+                where available and "spawn" otherwise
+        """
+        if wind and wind_generator:
+            print("WARNING parameter wind=True was set to False as wind_generator is already True")
+            wind = False
+        n_hours = len(data_dict["wind_speed"])
+        episode_length = n_hours if episode_length is None else episode_length
+        if start_offsets is None:
+            if start_mode == "strided":
+                start_offsets = np.arange(n_envs) * episode_length
+            else:
+                start_offsets = np.arange(n_envs) * n_hours // n_envs
+        n_workers = min(n_workers or os.cpu_count() or 1, n_envs)
+        n_actions = len(get_action_dims(wind, wind_generator))
+
+        # Shared environment data and step buffers
+        arrays = {key: np.asarray(data_dict[key], dtype=np.float64) for key in data_keys}
+        arrays.update({
+            "start_offsets": np.asarray(start_offsets, dtype=np.int64),
+            "actions": np.zeros((n_envs, n_actions), dtype=np.int64),
+            "obs": np.zeros((n_envs, len(observation_low))),
+            "terminal_obs": np.zeros((n_envs, len(observation_low))),
+            "rewards": np.zeros(n_envs),
+            "dones": np.zeros(n_envs, dtype=bool),
+        })
+        self.shared_blocks = {}
+        self.arrays = {}
+        for key, array in arrays.items():
+            self.shared_blocks[key], self.arrays[key] = create_shared_array(array)
+        specs = {key: (shm.name, self.arrays[key].shape, self.arrays[key].dtype)
+                 for key, shm in self.shared_blocks.items()}
+
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+
+        env_kwargs = {"wind": wind, "wind_generator": wind_generator, "alternative_cost": alternative_cost,
+                      "episode_length": episode_length, "start_mode": start_mode, "initial_soc": initial_soc,
+                      "stride": n_envs * episode_length}
+        worker_seeds = np.random.SeedSequence(seed).spawn(n_workers)
+        self.truncate = episode_length != n_hours
+        bounds = np.linspace(0, n_envs, n_workers + 1).astype(int)
+        self.remotes, self.processes = [], []
+        self.env_slices = list(zip(bounds[:-1], bounds[1:]))
+        for start, stop, worker_seed in zip(bounds[:-1], bounds[1:], worker_seeds):
+            remote, work_remote = ctx.Pipe()
+            process = ctx.Process(target=_worker, args=(work_remote, remote, specs, env_kwargs, (start, stop),
+                                                        worker_seed), daemon=True)
+            process.start()
+            work_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+
+        self.waiting = False
+        self.closed = False
+
+        super().__init__(num_envs=n_envs,
+                         observation_space=spaces.Box(low=observation_low, high=observation_high, dtype=np.float64),
+                         action_space=spaces.MultiDiscrete(get_action_dims(wind, wind_generator)))
+
+    def _send_all(self, cmd, data=None):
+        for remote in self.remotes:
+            remote.send((cmd, data))
+
+    def _wait_all(self):
+        for remote in self.remotes:
+            remote.recv()
+
+    def reset(self):
+        # Seeds set with seed() are used by the next reset only, every worker gets the ones of its environments
+        for remote, (start, stop) in zip(self.remotes, self.env_slices):
+            remote.send(("reset", self._seeds[start:stop]))
+        self._wait_all()
+        self._reset_seeds()
+        self._reset_options()
+        return self.arrays["obs"].copy()
+
+    def step_async(self, actions):
+        self.arrays["actions"][:] = actions
+        self._send_all("step")
+        self.waiting = True
+
+    def step_wait(self):
+        self._wait_all()
+        self.waiting = False
+
+        dones = self.arrays["dones"].copy()
+        # New info dicts every step, callers may keep the infos of earlier steps
+        infos = [{} for _ in range(self.num_envs)]
+        for env_idx in np.flatnonzero(dones):
+            infos[env_idx]["terminal_observation"] = self.arrays["terminal_obs"][env_idx].copy()
+            infos[env_idx]["TimeLimit.truncated"] = self.truncate
+
+        return self.arrays["obs"].copy(), self.arrays["rewards"].copy(), dones, infos
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            self._wait_all()
+        self._send_all("close")
+        for process in self.processes:
+            process.join()
+        for remote in self.remotes:
+            remote.close()
+        self.arrays = {}
+        for shm in self.shared_blocks.values():
+            shm.close()
+            shm.unlink()
+        self.closed = True
+
+    def _call_workers(self, cmd, args, indices, kwargs=None):
+        # Call get_attr, set_attr or env_method of the MicrogridVecEnvs of the workers that simulate the environments
+        # of indices, returns the results in the order of indices
+        indices = list(self._get_indices(indices))
+        results = {}
+        for remote, (start, stop) in zip(self.remotes, self.env_slices):
+            worker_indices = [env_idx for env_idx in indices if start <= env_idx < stop]
+            if not worker_indices:
+                continue
+            remote.send((cmd, (args, [env_idx - start for env_idx in worker_indices], kwargs or {})))
+            worker_results = remote.recv()
+            if isinstance(worker_results, Exception):
+                raise worker_results
+            results.update(zip(worker_indices, worker_results or [None] * len(worker_indices)))
+        return [results[env_idx] for env_idx in indices]
+
+    def get_attr(self, attr_name, indices=None):
+        return self._call_workers("get_attr", (attr_name,), indices)
+
+    def set_attr(self, attr_name, value, indices=None):
+        self._call_workers("set_attr", (attr_name, value), indices)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return self._call_workers("env_method", (method_name, *method_args), indices, method_kwargs)
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
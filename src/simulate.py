@@ -0,0 +1,184 @@
+from src.params import *
+from src.microgrid import get_generation_tables, SOLAR, WIND, GENERATOR, LOAD, BATTERY
+from src.batched_microgrid import BatchedMicrogrid, get_batched_action_dict
+from src.env_layout import get_action_dims
+
+try:
+    from numba import njit
+except ImportError:  # optional, the SOC recurrence runs in Python / NumPy without it
+    njit = None
+
+
+def _soc_recurrence(energy_load, charge, discharged, buy_load, buy_battery, energy_demand, initial_soc, soc_out,
+                    energy_total_out, load_bought_out, battery_bought_out, operational_cost_battery_out):
+    # Battery and grid purchases of Microgrid.update_environment, one trace after another. Compiled with Numba if
+    # available. The amounts bought from the grid are kept until they are overwritten, like in Microgrid
+    n_traces, n_hours = energy_load.shape
+    for n in range(n_traces):
+        soc = initial_soc
+        load_bought = 0.
+        battery_bought = 0.
+        for t in range(n_hours):
+            energy_total = energy_load[n, t]
+            if discharged[n, t]:
+                energy_total += soc - soc_min
+                soc = soc_min
+            if buy_load[n, t] and energy_demand[t] > energy_total:
+                load_bought = energy_demand[t] - energy_total
+                energy_total += load_bought
+
+            operational_cost_battery = 0.
+            for source in range(3):
+                soc += charge[n, t, source] * charging_discharging_efficiency
+                operational_cost_battery += charge[n, t, source]
+            if soc > soc_max:
+                soc = soc_max
+            if buy_battery[n, t]:
+                battery_bought = soc_max - soc
+                soc = soc_max
+                operational_cost_battery += battery_bought
+
+            soc_out[n, t] = soc
+            energy_total_out[n, t] = energy_total
+            load_bought_out[n, t] = load_bought
+            battery_bought_out[n, t] = battery_bought
+            operational_cost_battery_out[n, t] = operational_cost_battery
+
+
+def _soc_recurrence_numpy(energy_load, charge, discharged, buy_load, buy_battery, energy_demand, initial_soc, soc_out,
+                          energy_total_out, load_bought_out, battery_bought_out, operational_cost_battery_out):
+    # Same as _soc_recurrence with all traces advanced at once, used for many traces if Numba is not installed
+    n_traces, n_hours = energy_load.shape
+    soc = np.full(n_traces, initial_soc, dtype=np.float64)
+    load_bought = np.zeros(n_traces)
+    battery_bought = np.zeros(n_traces)
+    for t in range(n_hours):
+        energy_total = energy_load[:, t] + np.where(discharged[:, t], soc - soc_min, 0)
+        soc = np.where(discharged[:, t], soc_min, soc)
+        buy = buy_load[:, t] & (energy_demand[t] > energy_total)
+        load_bought = np.where(buy, energy_demand[t] - energy_total, load_bought)
+        energy_total += np.where(buy, load_bought, 0)
+
+        operational_cost_battery = np.zeros(n_traces)
+        for source in range(3):
+            soc += charge[:, t, source] * charging_discharging_efficiency
+            operational_cost_battery += charge[:, t, source]
+        soc = np.where(soc > soc_max, soc_max, soc)
+        battery_bought = np.where(buy_battery[:, t], soc_max - soc, battery_bought)
+        soc = np.where(buy_battery[:, t], soc_max, soc)
+        operational_cost_battery += np.where(buy_battery[:, t], battery_bought, 0)
+
+        soc_out[:, t] = soc
+        energy_total_out[:, t] = energy_total
+        load_bought_out[:, t] = load_bought
+        battery_bought_out[:, t] = battery_bought
+        operational_cost_battery_out[:, t] = operational_cost_battery
+
+
+if njit is not None:
+    _soc_recurrence = njit(cache=True, nogil=True)(_soc_recurrence)
+
+
+def _simulate_chunk(actions, data_dict, generation_tables, previous_wind_off, wind, wind_generator, alternative_cost,
+                    initial_soc):
+    n_traces, n_hours, n_actions = actions.shape
+    action_dict = get_batched_action_dict(actions.reshape(-1, n_actions), wind=wind, wind_generator=wind_generator)
+    allocation = np.stack([action_dict["solar"], action_dict["wind"], action_dict["generator"]], axis=-1)
+    allocation = allocation.reshape(n_traces, n_hours, 3)
+
+    # Working status and generated energy only depend on the actions and the data, not on the SOC
+    working_status = action_dict["adjusting_status"].reshape(n_traces, n_hours, 3).copy()
+    working_status[:, :, WIND] = np.where(previous_wind_off, 0, working_status[:, :, WIND])
+    tables = np.stack([generation_tables["solar"], generation_tables["wind"], generation_tables["generator"]],
+                      axis=-1)
+    energy = np.where(working_status > 0, working_status * tables, 0.)
+
+    energy_load = np.zeros((n_traces, n_hours))
+    for source in (SOLAR, WIND, GENERATOR):
+        energy_load += np.where(allocation[:, :, source] == 0, energy[:, :, source], 0)
+    charge = np.where(allocation == 1, energy, 0.)
+    discharged = action_dict["discharged"].reshape(n_traces, n_hours) == 1
+    buy_load = action_dict["purchased"][:, LOAD].reshape(n_traces, n_hours) != 0
+    buy_battery = action_dict["purchased"][:, BATTERY].reshape(n_traces, n_hours) == 1
+
+    energy_demand = data_dict["energy_demand"]
+    outputs = [np.empty((n_traces, n_hours)) for _ in range(5)]
+    recurrence = _soc_recurrence if njit is not None or n_traces < 8 else _soc_recurrence_numpy
+    recurrence(energy_load, charge, discharged, buy_load, buy_battery, energy_demand, float(initial_soc), *outputs)
+    soc, energy_total, load_bought, battery_bought, operational_cost_battery = outputs
+
+    # The costs of all traces and hours follow with the formulas of BatchedMicrogrid
+    grid = BatchedMicrogrid(n_envs=n_traces * n_hours, alternative_cost=alternative_cost)
+    grid.energy_for_load_bought = load_bought.ravel()
+    grid.energy_for_battery_bought = battery_bought.ravel()
+    grid.energy_total = energy_total.ravel()
+    grid.operational_cost_battery = operational_cost_battery.ravel()
+    grid.energy_demand = np.broadcast_to(energy_demand, (n_traces, n_hours)).ravel()
+    grid.energy_price_utility_grid = np.broadcast_to(data_dict["rate_consumption_charge"], (n_traces, n_hours)).ravel()
+    grid.energy_solar = energy[:, :, SOLAR].ravel()
+    grid.energy_wind = energy[:, :, WIND].ravel()
+    grid.energy_generator = energy[:, :, GENERATOR].ravel()
+    grid.actions_solar = action_dict["solar"]
+    grid.actions_wind = action_dict["wind"]
+    grid.actions_generator = action_dict["generator"]
+
+    cost = grid.cost_of_epoch().reshape(n_traces, n_hours)
+    blackout = energy_total < energy_demand
+    return cost, soc, blackout
+
+
+def simulate(actions, data_dict, wind=False, wind_generator=True, alternative_cost=False, initial_soc=soc_min,
+             chunk_size=64):
+    """
+    Simulate complete action traces without stepping MicrogridEnv.
+
+    Gives the same per-hour costs as a new MicrogridEnv stepped through the actions
+    of a trace, including the quadratic cost of alternative_cost. Everything that
+    does not depend on the SOC (working status, generation, sell back) is computed
+    for all hours at once. The SOC recurrence runs in a loop that is compiled with
+    Numba if it is installed.
+
+    Params:
+        actions: MultiDiscrete actions of MicrogridEnv of shape (n_hours, n_actions)
+            for one trace or (n_traces, n_hours, n_actions) to score several traces
+        data_dict: hourly environment data with at least n_hours hours, see MicrogridEnv
+        wind, wind_generator, alternative_cost: see MicrogridEnv
+        initial_soc: SOC of the battery before the first hour
+        chunk_size: number of traces simulated at once, bounds the memory use
+    Returns:
+        dict with the per-hour "cost", "soc" and "blackout" of shape
+        (n_traces, n_hours) (or (n_hours,) for a single trace) and the "total_cost"
+        of every trace
+    """
+    if wind and wind_generator:
+        print("WARNING parameter wind=True was set to False as wind_generator is already True")
+        wind = False
+    actions = np.asarray(actions)
+    single_trace = actions.ndim == 2
+    if single_trace:
+        actions = actions[None]
+    n_traces, n_hours, n_actions = actions.shape
+    if n_actions != len(get_action_dims(wind, wind_generator)):
+        raise Exception(f"Expected {len(get_action_dims(wind, wind_generator))} actions per hour, got {n_actions}")
+
+    data_dict = {key: np.asarray(value, dtype=np.float64)[:n_hours] for key, value in data_dict.items()}
+    if len(data_dict["wind_speed"]) < n_hours:
+        raise Exception(f"data_dict has only {len(data_dict['wind_speed'])} < {n_hours} hours")
+    generation_tables = get_generation_tables(data_dict)
+
+    # Microgrid switches the wind turbine off based on the wind speed of the previous epoch (initially 40 km/h)
+    previous_wind_speed = np.concatenate([[40.], data_dict["wind_speed"][:-1]])
+    previous_wind_off = (previous_wind_speed > cutoff_windspeed) | (previous_wind_speed < cutin_windspeed)
+
+    results = {"cost": np.empty((n_traces, n_hours)), "soc": np.empty((n_traces, n_hours)),
+               "blackout": np.empty((n_traces, n_hours), dtype=bool)}
+    for start in range(0, n_traces, chunk_size):
+        chunk = slice(start, start + chunk_size)
+        results["cost"][chunk], results["soc"][chunk], results["blackout"][chunk] = _simulate_chunk(
+            actions[chunk], data_dict, generation_tables, previous_wind_off, wind, wind_generator, alternative_cost,
+            initial_soc)
+    results["total_cost"] = results["cost"].sum(axis=1)
+
+    if single_trace:
+        results = {key: value[0] for key, value in results.items()}
+    return results
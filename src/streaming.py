@@ -0,0 +1,134 @@
+import csv
+import os
+import time
+
+from src.params import *
+from src.microgrid import potential_energy_solar, potential_energy_wind, potential_energy_generator
+from src.microgrid_env import MicrogridEnv
+
+data_keys = ["energy_demand", "solar_irradiance", "wind_speed", "rate_consumption_charge"]
+
+
+def replay_source(data_dict, start=0, n_hours=None):
+    """Hourly readings of a data dict (see get_data_dict) from hour start on, as a source of StreamingMicrogridEnv"""
+    data_dict = {key: np.asarray(data_dict[key], dtype=np.float64) for key in data_keys}
+    end = len(data_dict["wind_speed"]) if n_hours is None else start + n_hours
+    for hour in range(start, end):
+        yield {key: data_dict[key][hour] for key in data_keys}
+
+
+def tail_source(path, poll_interval=0.5, timeout=None):
+    """
+    Hourly readings appended to a CSV file, like tail -f. Stand-in for a live feed.
+
+    The file needs a header with the columns of data_keys (in any order) and gets
+    one row per hour appended. Waits for rows that are not complete yet.
+
+    Params:
+        path: CSV file, may not exist yet
+        poll_interval: seconds between checks for new rows
+        timeout: stop after this many seconds without a new row, wait forever if None
+    """
+    last_row = time.monotonic()
+    while not os.path.exists(path):
+        if timeout is not None and time.monotonic() - last_row > timeout:
+            return
+        time.sleep(poll_interval)
+
+    with open(path, "r", newline="") as file:
+        columns = None
+        pending = ""
+        while True:
+            line = file.readline()
+            if not line.endswith("\n"):
+                # No complete row yet, keep the partial line until the writer finished it
+                pending += line
+                if timeout is not None and time.monotonic() - last_row > timeout:
+                    return
+                time.sleep(poll_interval)
+                continue
+            line, pending = pending + line, ""
+            last_row = time.monotonic()
+            if not line.strip():
+                continue
+            row = next(csv.reader([line]))
+            if columns is None:
+                columns = row
+                continue
+            reading = dict(zip(columns, row))
+            yield {key: float(reading[key]) for key in data_keys}
+
+
+class StreamingMicrogridEnv(MicrogridEnv):
+    def __init__(self, source=None, capacity=7 * 24, episode_length=None, **kwargs):
+        """
+        MicrogridEnv on hourly readings that arrive one after another instead of a data dict.
+
+        The readings are kept in a ring buffer of capacity hours, so the memory is
+        constant no matter how long the environment runs. Every step consumes the
+        reading of the next hour. Readings are either pushed with feed, e.g. from an
+        async consumer, or pulled from source by step when the next reading is not
+        buffered yet, so step blocks until the reading arrives.
+
+        Episodes do not rewind the data, a new episode continues with the next hour
+        of the stream. Apart from that the environment behaves exactly like
+        MicrogridEnv on the same data with start_mode "strided", so a policy can be
+        run on a historical replay (see replay_source) and on a live feed (see
+        tail_source) alike.
+
+        Params:
+            source: iterator of readings, dicts with a value for every key of data_keys
+            capacity: number of hours kept in the ring buffer. At most capacity
+                readings can be buffered ahead of the current step, the previous ones
+                are available through get_history
+            episode_length: number of hours per episode, endless if None. Episodes
+                always end truncated (info["TimeLimit.truncated"] is True)
+            kwargs: other parameters of MicrogridEnv except start_mode and start_offset
+        """
+        ring = {key: np.zeros(capacity) for key in data_keys}
+        self.capacity = capacity
+        self.source = iter(source) if source is not None else None
+        self.n_received = 0  # readings written into the ring buffer
+        self.next_hour = 0  # hour of the stream the next step consumes
+        self.episode_start = 0  # hour of the stream the current episode started at
+        super().__init__(ring, episode_length=capacity, **kwargs)
+        self.episode_length = np.inf if episode_length is None else episode_length
+        self.truncate = True
+
+    def feed(self, reading):
+        """Append the reading of the next hour to the ring buffer"""
+        if self.n_received - self.next_hour >= self.capacity:
+            raise Exception(f"Ring buffer full, {self.capacity} readings wait to be consumed")
+        index = self.n_received % self.capacity
+        for key in data_keys:
+            self.data_dict[key][index] = reading[key]
+
+        # Potential energy of the hour, like get_generation_tables
+        tables = self.generation_tables
+        tables["solar"][index] = potential_energy_solar(self.data_dict["solar_irradiance"][index])
+        tables["wind"][index] = potential_energy_wind(self.data_dict["wind_speed"][index])
+        tables["generator"][index] = potential_energy_generator()
+        self.n_received += 1
+
+    def reset(self, **kwargs):
+        self.episode_start = self.next_hour
+        return super().reset(**kwargs)
+
+    def get_data_index(self):
+        # Position of the reading of the current step in the ring buffer, waits for the reading if necessary
+        hour = self.episode_start + self.step_count
+        while hour >= self.n_received:
+            if self.source is None:
+                raise Exception(f"No reading for hour {hour} of the stream, feed it first")
+            try:
+                self.feed(next(self.source))
+            except StopIteration:
+                raise Exception(f"The source ended at hour {hour} of the stream") from None
+        self.next_hour = hour + 1
+        return hour % self.capacity
+
+    def get_history(self, n_hours=None):
+        """Data dict of the last n_hours consumed readings (at most capacity), oldest first"""
+        n_hours = min(n_hours or self.capacity, self.next_hour, self.capacity - (self.n_received - self.next_hour))
+        index = np.arange(self.next_hour - n_hours, self.next_hour) % self.capacity
+        return {key: self.data_dict[key][index] for key in data_keys}
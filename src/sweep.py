@@ -0,0 +1,195 @@
+import glob
+import itertools
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+config_path = "output/configs"
+model_path = "output/models"
+logs_path = "output/logs"
+train_data_path = "output/train_data"
+
+
+def get_run_name(config_file):
+    # output/configs/config_<run>.json, the save_name inside random configs lacks the "_random" suffix
+    return os.path.basename(config_file)[len("config_"):-len(".json")]
+
+
+def get_model_file(run_name):
+    model_file = os.path.join(model_path, f"model_{run_name}")
+    return model_file if os.path.exists(model_file) else model_file + ".zip"
+
+
+def get_evaluation_file(run_name):
+    return os.path.join(logs_path, run_name, "evaluation.json")
+
+
+def is_trained(run_name):
+    return os.path.exists(get_model_file(run_name))
+
+
+def is_evaluated(run_name):
+    return os.path.exists(get_evaluation_file(run_name))
+
+
+def save_model(model, run_name):
+    # Written to a temporary file first, so a killed worker never leaves a partial model that counts as trained
+    from src.get_data import atomic_file
+
+    os.makedirs(model_path, exist_ok=True)
+    with atomic_file(os.path.join(model_path, f"model_{run_name}.zip")) as tmp_file:
+        model.save(tmp_file)
+
+
+def expand_grid(base_config_file, grid):
+    """
+    Write one config file to output/configs per combination of the values in grid.
+
+    Params:
+        base_config_file: config whose parameters are used where grid has no values
+        grid: dict of parameter name to list of values
+    Returns:
+        list of the written config files, named after the base config and the
+        grid values, e.g. config_ppo_q2_ent_coef=0.01.json
+    """
+    with open(base_config_file, "r") as json_file:
+        base_config = json.load(json_file)
+    base_name = get_run_name(base_config_file)
+
+    config_files = []
+    keys = sorted(grid)
+    for values in itertools.product(*[grid[key] for key in keys]):
+        run_name = base_name + "".join(f"_{key}={value}" for key, value in zip(keys, values))
+        config = dict(base_config, **dict(zip(keys, values)), save_name=run_name)
+        config_file = os.path.join(config_path, f"config_{run_name}.json")
+        with open(config_file, "w") as json_file:
+            json.dump(config, json_file, indent=4)
+        config_files.append(config_file)
+    return config_files
+
+
+def train_run(config_file, render_interval=100):
+    """
+    Train a PPO agent for a config like notebooks/1_training.ipynb. Writes the model to
+    output/models/model_<run>, the SB3 logs to output/logs/<run> and every render_interval-th
+    training step to output/train_data/<run>.csv.
+    """
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.logger import configure
+    from src.get_data import get_data_dict
+    from src.microgrid_env import MicrogridEnv
+    from src.telemetry import TelemetryRecorder
+
+    with open(config_file, "r") as json_file:
+        parameters = json.load(json_file)
+    run_name = get_run_name(config_file)
+
+    data_dict = get_data_dict(parameters["nr_households"], parameters["region"])
+    env = MicrogridEnv(data_dict, wind=parameters["wind"], wind_generator=parameters["wind_generator"],
+                       alternative_cost=parameters["alternative_cost"])
+    model = PPO("MlpPolicy", env, verbose=0, ent_coef=parameters["ent_coef"])
+
+    # PPO collects whole rollouts of n_steps, keep all sampled steps of them
+    n_timesteps = -(-parameters["total_timesteps"] // model.n_steps) * model.n_steps
+    telemetry = TelemetryRecorder(sample_interval=render_interval, capacity=n_timesteps // render_interval + 1)
+    env.telemetry = telemetry
+    model.set_logger(configure(os.path.join(logs_path, run_name), ["json"]))
+    model.learn(total_timesteps=parameters["total_timesteps"])
+
+    os.makedirs(train_data_path, exist_ok=True)
+    telemetry.to_frame().to_csv(os.path.join(train_data_path, f"{run_name}.csv"))
+    save_model(model, run_name)
+
+
+def evaluate_run(run_name, seeds=(123,)):
+    """Evaluate the model of a run (see evaluate_config) and write the aggregates to output/logs/<run>"""
+    from src.evaluate import evaluate_config
+    from src.get_data import atomic_file
+
+    results = evaluate_config(run_name, seeds=seeds)
+    summary = {key: float(results[key]) for key in ["blackout_rate", "mean_cost", "total_cost"]}
+    summary["seeds"] = list(seeds)
+
+    evaluation_file = get_evaluation_file(run_name)
+    os.makedirs(os.path.dirname(evaluation_file), exist_ok=True)
+    with atomic_file(evaluation_file) as tmp_file:
+        with open(tmp_file, "w") as json_file:
+            json.dump(summary, json_file, indent=4)
+    return summary
+
+
+def _pin_worker(cpu_queue):
+    # Pin the worker process to one CPU and keep torch from starting a thread per CPU in every worker
+    cpu = cpu_queue.get()
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+    import torch
+    torch.set_num_threads(1)
+
+
+def _run_job(config_file, train, evaluate, seeds, train_function, evaluate_function):
+    run_name = get_run_name(config_file)
+    start = time.perf_counter()
+    if train:
+        train_function(config_file)
+    summary = evaluate_function(run_name, seeds=seeds) if evaluate else None
+    return run_name, time.perf_counter() - start, summary
+
+
+def run_sweep(config_files=None, n_jobs=None, pin_cpus=True, resume=True, evaluate=True, seeds=(123,),
+              train_function=train_run, evaluate_function=evaluate_run):
+    """
+    Train and evaluate several configs in parallel, one process per run.
+
+    Params:
+        config_files: config files to run, defaults to all configs in output/configs
+        n_jobs: maximum number of concurrent runs, defaults to the number of
+            available CPUs
+        pin_cpus: pin every worker process to its own CPU
+        resume: skip the training of runs with a saved model and the evaluation
+            of runs with an evaluation in output/logs/<run>
+        evaluate: evaluate the models after training
+        seeds: seeds of the test data of the evaluation
+        train_function, evaluate_function: called by the workers to train a config
+            file and to evaluate a run, see train_run and evaluate_run. Must be
+            importable module-level functions
+    Returns:
+        dict of run name to evaluation summary (None if not evaluated)
+    """
+    if config_files is None:
+        config_files = sorted(glob.glob(os.path.join(config_path, "config_*.json")))
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    n_jobs = min(n_jobs or len(cpus), len(config_files)) or 1
+
+    jobs = []
+    for config_file in config_files:
+        run_name = get_run_name(config_file)
+        train = not (resume and is_trained(run_name))
+        run_evaluation = evaluate and (train or not (resume and is_evaluated(run_name)))
+        if train or run_evaluation:
+            jobs.append((config_file, train, run_evaluation))
+        else:
+            print(f"Skipping {run_name}, already completed")
+
+    summaries = {}
+    if not jobs:
+        return summaries
+
+    # Every worker takes one CPU from the queue when it starts
+    ctx = mp.get_context("spawn")
+    cpu_queue = ctx.Queue()
+    for i in range(n_jobs):
+        cpu_queue.put(cpus[i % len(cpus)] if pin_cpus else None)
+
+    with ProcessPoolExecutor(max_workers=n_jobs, mp_context=ctx, initializer=_pin_worker,
+                             initargs=(cpu_queue,)) as executor:
+        futures = [executor.submit(_run_job, config_file, train, run_evaluation, seeds, train_function,
+                                   evaluate_function)
+                   for config_file, train, run_evaluation in jobs]
+        for future in as_completed(futures):
+            run_name, seconds, summary = future.result()
+            summaries[run_name] = summary
+            print(f"Finished {run_name} in {seconds:.1f} s: {summary}")
+    return summaries
@@ -0,0 +1,132 @@
+import glob
+import os
+
+import numpy as np
+
+train_data_path = "output/train_data"
+
+# Flat columns recorded per sampled step. The nested "purchase_energy" and "actions_adjusting_status" dicts of
+# MicrogridEnv.render are split into one column per entry
+telemetry_columns = ["timestep", "step", "reward", "operational_cost", "purchased_energy_cost",
+                     "purchased_energy_battery", "purchased_energy_load", "sell_back_revenue", "energy_demand",
+                     "energy_load", "discharged", "purchase_energy_load",
+                     "purchase_energy_battery", "energy_generated_solar", "solar", "energy_generated_wind", "wind",
+                     "energy_generated_generator", "generator", "adjusting_status_solar", "adjusting_status_wind",
+                     "adjusting_status_generator", "soc", "solar_irradiance", "wind_speed",
+                     "energy_price_utility_grid"]
+
+
+class TelemetryRecorder(object):
+    def __init__(self, save_name=None, sample_interval=100, capacity=10_000, file_format="npz",
+                 path=train_data_path, columns=telemetry_columns):
+        """
+        Columnar ring buffer for the per-step values of MicrogridEnv.
+
+        The environment appends one row every sample_interval steps from values it
+        computed during the step anyway. Rows are written into a preallocated
+        (capacity, columns) array, so memory stays bounded no matter how long the
+        training runs. If save_name is given, every full buffer is flushed as one
+        chunk file to path/save_name and the buffer starts over, otherwise the
+        oldest rows are overwritten.
+
+        Params:
+            save_name: name of the run, chunks are written to path/save_name
+            sample_interval: record every sample_interval-th step
+            capacity: number of rows kept in memory (per chunk)
+            file_format: "npz" or "parquet" (requires pyarrow)
+            path: directory of the chunk directories
+            columns: names of the recorded values
+        """
+        if file_format not in ("npz", "parquet"):
+            raise Exception(f"Unknown file format {file_format}, use 'npz' or 'parquet'")
+        self.save_name = save_name
+        self.sample_interval = sample_interval
+        self.capacity = capacity
+        self.file_format = file_format
+        self.path = path
+        self.columns = list(columns)
+
+        self.buffer = np.zeros((capacity, len(self.columns)))
+        self.n_calls = 0  # number of steps seen, sampled or not
+        self.size = 0  # number of rows in the buffer
+        self.position = 0  # next row to write
+        self.n_chunks = 0  # number of chunks flushed to disk
+
+    @property
+    def chunk_dir(self):
+        return os.path.join(self.path, self.save_name)
+
+    def is_sampled(self):
+        """Count a step, returns True if it should be recorded"""
+        self.n_calls += 1
+        return self.n_calls % self.sample_interval == 0
+
+    def append(self, row):
+        """Write one row of values in the order of columns"""
+        self.buffer[self.position] = row
+        self.position += 1
+        if self.size < self.capacity:
+            self.size += 1
+        if self.position == self.capacity:
+            if self.save_name is not None:
+                self.flush()
+            else:
+                self.position = 0
+
+    def get_columns(self):
+        """Dict of the buffered rows per column, oldest first"""
+        if self.size < self.capacity:
+            rows = self.buffer[:self.size]
+        else:
+            rows = np.roll(self.buffer, -self.position, axis=0)
+        return {column: rows[:, i].copy() for i, column in enumerate(self.columns)}
+
+    def flush(self):
+        """Write the buffered rows as new chunk file to chunk_dir and empty the buffer"""
+        if self.save_name is None:
+            raise Exception("Set a save_name to flush the telemetry to disk")
+        if self.size == 0:
+            return
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        if self.n_chunks == 0:
+            # Remove the chunks of a previous run with the same name
+            for chunk_file in glob.glob(os.path.join(self.chunk_dir, "chunk_*")):
+                os.remove(chunk_file)
+        chunk_file = os.path.join(self.chunk_dir, f"chunk_{self.n_chunks:05d}.{self.file_format}")
+
+        # Write to a temporary file first so that readers never see a partially written chunk
+        if self.file_format == "npz":
+            with open(chunk_file + ".tmp", "wb") as file:
+                np.savez(file, **self.get_columns())
+        else:
+            import pandas as pd
+            pd.DataFrame(self.get_columns()).to_parquet(chunk_file + ".tmp", index=False)
+        os.replace(chunk_file + ".tmp", chunk_file)
+
+        self.n_chunks += 1
+        self.size = 0
+        self.position = 0
+
+    def to_frame(self):
+        """DataFrame of all flushed chunks followed by the buffered rows"""
+        import pandas as pd
+        frames = []
+        if self.n_chunks > 0:
+            frames.append(load_telemetry(self.save_name, self.path))
+        frames.append(pd.DataFrame(self.get_columns()))
+        return pd.concat(frames, ignore_index=True)
+
+
+def load_telemetry(save_name, path=train_data_path):
+    """Read all chunks of a run written by TelemetryRecorder.flush into one DataFrame"""
+    import pandas as pd
+    frames = []
+    for chunk_file in sorted(glob.glob(os.path.join(path, save_name, "chunk_*"))):
+        if chunk_file.endswith(".npz"):
+            with np.load(chunk_file) as chunk:
+                frames.append(pd.DataFrame({column: chunk[column] for column in chunk.files}))
+        elif chunk_file.endswith(".parquet"):
+            frames.append(pd.read_parquet(chunk_file))
+    if not frames:
+        return pd.DataFrame(columns=telemetry_columns)
+    return pd.concat(frames, ignore_index=True)
@@ -1,7 +1,7 @@
 from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.vec_env import VecEnvWrapper
 import numpy as np
 import gym
-from gym.wrappers.normalize import RunningMeanStd
 
 
 class RenderCallback(BaseCallback):
@@ -18,6 +18,124 @@ class RenderCallback(BaseCallback):
         return True  # Continue training
 
 
+class TelemetryCallback(BaseCallback):
+    """
+    Lightweight replacement of RenderCallback. The MicrogridEnv samples its steps into
+    a TelemetryRecorder itself, the callback only flushes the remaining rows to
+    output/train_data/<save_name> when the training ends.
+    """
+
+    def __init__(self, telemetry, verbose=0):
+        super(TelemetryCallback, self).__init__(verbose)
+        self.telemetry = telemetry
+
+    def _on_step(self) -> bool:
+        return True  # Continue training
+
+    def _on_training_end(self) -> None:
+        if self.telemetry.save_name is not None:
+            self.telemetry.flush()
+
+
+class ProfilingCallback(BaseCallback):
+    """
+    Records the per-phase step timings of a StepProfiler (see MicrogridEnv.enable_profiling) with the
+    logger of the model after every rollout, so they are written e.g. to output/logs/<run>/progress.json.
+    The profiler is reset afterwards, so every entry covers one rollout.
+    """
+
+    def __init__(self, profiler, verbose=0):
+        super(ProfilingCallback, self).__init__(verbose)
+        self.profiler = profiler
+
+    def _on_step(self) -> bool:
+        return True  # Continue training
+
+    def _on_rollout_end(self) -> None:
+        self.profiler.record_to_logger(self.logger)
+        self.profiler.reset()
+
+
+# Adapted from https://github.com/openai/gym/blob/master/gym/wrappers/normalize.py#L8
+class RunningMeanStd(object):
+    """Running mean and variance of observations that can be updated with batches and merged across workers.
+
+    Batches are combined with the parallel algorithm of Chan et al.
+    (https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Parallel_algorithm), so the statistics of
+    several workers merged with merge() are the same as if one worker had seen all observations.
+    """
+
+    def __init__(self, epsilon=1e-4, shape=()):
+        self.mean = np.zeros(shape, dtype=np.float64)
+        self.var = np.ones(shape, dtype=np.float64)
+        self.count = epsilon
+        self.frozen = False  # frozen statistics are not updated anymore, e.g. for evaluation
+
+    def update(self, x):
+        """Update the statistics with a batch of observations of shape (n, *shape)"""
+        if self.frozen:
+            return
+        if x.shape[0] == 1:
+            self.update_single(x[0])
+        else:
+            self.update_from_moments(x.mean(axis=0), x.var(axis=0), x.shape[0])
+
+    def update_single(self, x):
+        """Update the statistics with a single observation (Welford's algorithm)"""
+        if self.frozen:
+            return
+        count = self.count + 1
+        delta = x - self.mean
+        self.mean += delta / count
+        self.var = (self.var * self.count + delta * (x - self.mean)) / count
+        self.count = count
+
+    def update_from_moments(self, batch_mean, batch_var, batch_count):
+        """Combine the statistics with the mean, variance and count of another set of observations"""
+        if self.frozen:
+            return
+        delta = batch_mean - self.mean
+        count = self.count + batch_count
+
+        self.mean = self.mean + delta * batch_count / count
+        m2 = self.var * self.count + batch_var * batch_count + np.square(delta) * self.count * batch_count / count
+        self.var = m2 / count
+        self.count = count
+
+    def merge(self, other):
+        """Merge the statistics of another RunningMeanStd, e.g. of a parallel worker"""
+        self.update_from_moments(other.mean, other.var, other.count)
+        return self
+
+    def normalize(self, x, epsilon=1e-8):
+        return (x - self.mean) / np.sqrt(self.var + epsilon)
+
+    def freeze(self):
+        self.frozen = True
+
+    def unfreeze(self):
+        self.frozen = False
+
+    def save(self, path):
+        """Save the statistics as .npz file, e.g. next to the model in output/models"""
+        with open(path, "wb") as file:
+            np.savez(file, mean=self.mean, var=self.var, count=self.count)
+
+    @classmethod
+    def load(cls, path, frozen=True):
+        """Load statistics saved with save(), they are frozen by default to normalize test observations"""
+        with np.load(path) as data:
+            rms = cls(shape=data["mean"].shape)
+            rms.mean, rms.var, rms.count = data["mean"], data["var"], float(data["count"])
+        rms.frozen = frozen
+        return rms
+
+
+def get_obs_rms_path(save_name, model_path="output/models"):
+    # Observation statistics are stored next to the model of the run
+    return f"{model_path}/model_{save_name}_obs_rms.npz"
+
+
 # Adapted from https://github.com/openai/gym/blob/master/gym/wrappers/normalize.py#L49
 class NormalizeObservation(gym.core.Wrapper):
     """This wrapper will normalize observations s.t. each coordinate is centered with unit variance.
@@ -27,17 +145,20 @@ class NormalizeObservation(gym.core.Wrapper):
         newly instantiated or the policy was changed recently.
     """
 
-    def __init__(self, env: gym.Env, epsilon: float = 1e-8):
+    def __init__(self, env: gym.Env, epsilon: float = 1e-8, obs_rms: RunningMeanStd = None):
         """This wrapper will normalize observations s.t. each coordinate is centered with unit variance.
 
         Args:
             env (Env): The environment to apply the wrapper
             epsilon: A stability parameter that is used when scaling the observations.
+            obs_rms: Statistics to start from, e.g. loaded with RunningMeanStd.load for evaluation
         """
         super().__init__(env)
         self.num_envs = getattr(env, "num_envs", 1)
         self.is_vector_env = getattr(env, "is_vector_env", False)
-        if self.is_vector_env:
+        if obs_rms is not None:
+            self.obs_rms = obs_rms
+        elif self.is_vector_env:
             self.obs_rms = RunningMeanStd(shape=self.single_observation_space.shape)
         else:
             self.obs_rms = RunningMeanStd(shape=self.observation_space.shape)
@@ -49,7 +170,7 @@ class NormalizeObservation(gym.core.Wrapper):
         if self.is_vector_env:
             obs = self.normalize(obs)
         else:
-            obs = self.normalize(np.array([obs]))[0]
+            obs = self.normalize_single(obs)
         return obs, rews, terminateds, truncateds
 
     def reset(self, **kwargs):
@@ -59,9 +180,41 @@ class NormalizeObservation(gym.core.Wrapper):
         if self.is_vector_env:
             return self.normalize(obs)
         else:
-            return self.normalize(np.array([obs]))[0]
+            return self.normalize_single(obs)
 
     def normalize(self, obs):
         """Normalises the observation using the running mean and variance of the observations."""
         self.obs_rms.update(obs)
-        return (obs - self.obs_rms.mean) / np.sqrt(self.obs_rms.var + self.epsilon)
+        return self.obs_rms.normalize(obs, self.epsilon)
+
+    def normalize_single(self, obs):
+        """Normalises a single observation without wrapping it into a batch."""
+        self.obs_rms.update_single(obs)
+        return self.obs_rms.normalize(obs, self.epsilon)
+
+
+class VecNormalizeObservation(VecEnvWrapper):
+    """Normalizes the batched observations of a stable-baselines3 VecEnv such as MicrogridVecEnv.
+
+    The statistics are updated once per step with the whole batch of observations. The terminal
+    observations of finished environments are normalized with the same statistics.
+    """
+
+    def __init__(self, venv, epsilon: float = 1e-8, obs_rms: RunningMeanStd = None):
+        super().__init__(venv)
+        self.obs_rms = obs_rms if obs_rms is not None else RunningMeanStd(shape=self.observation_space.shape)
+        self.epsilon = epsilon
+
+    def reset(self):
+        obs = self.venv.reset()
+        self.obs_rms.update(obs)
+        return self.obs_rms.normalize(obs, self.epsilon)
+
+    def step_wait(self):
+        obs, rewards, dones, infos = self.venv.step_wait()
+        self.obs_rms.update(obs)
+        for env_idx in np.flatnonzero(dones):
+            if "terminal_observation" in infos[env_idx]:
+                infos[env_idx]["terminal_observation"] = self.obs_rms.normalize(
+                    infos[env_idx]["terminal_observation"], self.epsilon)
+        return self.obs_rms.normalize(obs, self.epsilon), rewards, dones, infos
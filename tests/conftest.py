@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+
+def make_data_dict(n_hours=72, seed=0):
+    """Random hourly data with the keys of get_data_dict, wind speeds cover the cut-in and cut-off speeds"""
+    rng = np.random.default_rng(seed)
+    return {"energy_demand": rng.uniform(0, 200, n_hours),
+            "solar_irradiance": rng.uniform(0, 900, n_hours),
+            "wind_speed": rng.uniform(0, 30, n_hours),
+            "rate_consumption_charge": rng.uniform(0.2, 1, n_hours)}
+
+
+@pytest.fixture
+def data_dict():
+    return make_data_dict()
+
+
+@pytest.fixture
+def make_data():
+    return make_data_dict
+
+
+@pytest.fixture(scope="session")
+def synthetic_root(tmp_path_factory):
+    """Directory with a synthetic data folder (see benchmarks/synthetic_data.py), shared by all tests"""
+    from benchmarks.synthetic_data import create_synthetic_data
+    root = tmp_path_factory.mktemp("synthetic")
+    create_synthetic_data(str(root))
+    return root
+
+
+@pytest.fixture
+def synthetic_data(synthetic_root, monkeypatch):
+    """Run the test in the directory of the synthetic data with an empty cache, the data paths are relative"""
+    import shutil
+    shutil.rmtree(synthetic_root / "data" / "cache", ignore_errors=True)
+    monkeypatch.chdir(synthetic_root)
+    return synthetic_root
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from src.microgrid_env import MicrogridEnv
+
+
+@pytest.mark.parametrize("wind, wind_generator", [(False, False), (True, False), (False, True)])
+@pytest.mark.parametrize("alternative_cost", [False, True])
+def test_batched_step_matches_scalar_step(data_dict, wind, wind_generator, alternative_cost):
+    kwargs = dict(wind=wind, wind_generator=wind_generator, alternative_cost=alternative_cost, episode_length=24,
+                  start_mode="random", initial_soc="random", seed=0)
+    scalar = MicrogridEnv(data_dict, **kwargs)
+    batched = MicrogridEnv(data_dict, batched=True, **kwargs)
+    np.testing.assert_array_equal(batched.reset(), scalar.reset())
+    rng = np.random.default_rng(1)
+    for _ in range(100):
+        action = rng.integers(scalar.action_space.nvec)
+        observation, reward, done, info = scalar.step(action)
+        batched_observation, batched_reward, batched_done, batched_info = batched.step(action)
+        np.testing.assert_allclose(batched_observation, observation, rtol=1e-12)
+        assert batched_reward == pytest.approx(reward, rel=1e-12)
+        assert (batched_done, batched_info) == (done, info)
+        if done:
+            np.testing.assert_array_equal(batched.reset(), scalar.reset())
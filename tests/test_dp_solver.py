@@ -0,0 +1,35 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from src.dp_solver import solve_optimal_cost, get_action_table
+from src.simulate import simulate
+
+
+@pytest.mark.parametrize("alternative_cost", [False, True])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_cost_is_optimum_of_enumeration(make_data, alternative_cost, seed):
+    # All sequences of the non-redundant actions of question 1 over 4 hours, scored with the MicrogridEnv semantics
+    data_dict = make_data(n_hours=4, seed=seed)
+    actions = get_action_table(wind=False, wind_generator=False)[0]
+    sequences = actions[np.array(list(itertools.product(range(len(actions)), repeat=4)))]
+    costs = simulate(sequences, data_dict, wind=False, wind_generator=False, alternative_cost=alternative_cost,
+                     chunk_size=8192)["total_cost"]
+
+    result = solve_optimal_cost(data_dict, wind=False, wind_generator=False, alternative_cost=alternative_cost)
+    assert result["cost"] == pytest.approx(costs.min(), rel=1e-9)
+    assert result["env_cost"] == pytest.approx(result["cost"], rel=1e-12)
+
+
+@pytest.mark.parametrize("wind, wind_generator, alternative_cost",
+                         [(False, False, False), (True, False, False), (False, True, False), (False, True, True)])
+def test_cost_matches_microgrid_replay(make_data, wind, wind_generator, alternative_cost):
+    data_dict = make_data(n_hours=24)
+    result = solve_optimal_cost(data_dict, wind=wind, wind_generator=wind_generator,
+                                alternative_cost=alternative_cost)
+    np.testing.assert_allclose(result["costs"], result["env_costs"], rtol=1e-12, atol=1e-9)
+    replayed = simulate(result["actions"], data_dict, wind=wind, wind_generator=wind_generator,
+                        alternative_cost=alternative_cost)
+    np.testing.assert_allclose(replayed["soc"], result["soc"], rtol=1e-12)
+    np.testing.assert_allclose(replayed["cost"], result["costs"], rtol=1e-12, atol=1e-9)
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from src.evaluate import evaluate_policy, recorded_keys
+from src.microgrid_env import MicrogridEnv
+
+
+class ObservationPolicy(object):
+    """Deterministic actions that depend on every value of the observation, evaluated row by row"""
+
+    def __init__(self, nvec):
+        self.nvec = np.asarray(nvec)
+
+    def predict(self, observation, deterministic=True):
+        observation = np.asarray(observation)
+        single = observation.ndim == 1
+        obs = np.atleast_2d(observation)
+        actions = np.floor(obs.sum(axis=1, keepdims=True) * np.arange(1, len(self.nvec) + 1)).astype(np.int64)
+        actions %= self.nvec
+        return (actions[0] if single else actions), None
+
+
+def run_episode(policy, test_dict, **kwargs):
+    """Per-hour values of a MicrogridEnv episode like in the notebooks, with the step rewards and render"""
+    env = MicrogridEnv(test_dict, **kwargs)
+    obs = env.reset()
+    results = {key: [] for key in recorded_keys}
+    done = False
+    while not done:
+        action, _ = policy.predict(obs)
+        obs, reward, done, _ = env.step(action)
+        info = env.render()
+        results["reward"].append(reward)
+        results["blackout"].append(info["energy_load"] < info["energy_demand"])
+        for key in recorded_keys[2:]:
+            results[key].append(info[key])
+    return {key: np.array(value) for key, value in results.items()}
+
+
+@pytest.mark.parametrize("wind, wind_generator", [(False, False), (False, True)])
+def test_matches_episode_loop(make_data, wind, wind_generator):
+    test_dicts = [make_data(n_hours=48, seed=seed) for seed in (1, 2, 3)]
+    env = MicrogridEnv(test_dicts[0], wind=wind, wind_generator=wind_generator)
+    policy = ObservationPolicy(env.action_space.nvec)
+    results = evaluate_policy(policy, test_dicts, wind=wind, wind_generator=wind_generator)
+
+    for i, test_dict in enumerate(test_dicts):
+        expected = run_episode(policy, test_dict, wind=wind, wind_generator=wind_generator)
+        for key in recorded_keys:
+            np.testing.assert_allclose(results[key][i], expected[key], rtol=1e-12, err_msg=key)
+    rewards = np.array([run_episode(policy, test_dict, wind=wind, wind_generator=wind_generator)["reward"]
+                        for test_dict in test_dicts])
+    assert results["total_cost"] == pytest.approx(-rewards.sum(axis=1).mean(), rel=1e-12)
+
+
+def test_last_hour_is_not_reset(make_data):
+    # The environments of evaluate_policy do not reset after the last step, so it records the final state
+    test_dicts = [make_data(n_hours=24, seed=seed) for seed in (1, 2)]
+    policy = ObservationPolicy(MicrogridEnv(test_dicts[0]).action_space.nvec)
+    results = evaluate_policy(policy, test_dicts)
+    for i, test_dict in enumerate(test_dicts):
+        expected = run_episode(policy, test_dict)
+        for key in ["soc", "energy_demand", "energy_load"]:
+            assert results[key][i, -1] == pytest.approx(expected[key][-1], rel=1e-12)
+        assert results["energy_demand"][i, -1] == test_dict["energy_demand"][-1]
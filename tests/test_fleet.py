@@ -0,0 +1,57 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from src.fleet import get_fleet_demand, get_default_action, simulate_fleet, simulate_sites
+from src.get_data import cache_path, get_energy_demand_data
+from src.microgrid_env import MicrogridEnv
+from src.env_layout import get_action_dims
+
+
+def test_concurrent_fleet_demand(synthetic_data):
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(executor.map(lambda _: get_fleet_demand("region"), range(3)))
+    demand, fleet_file, names = results[0]
+    for other_demand, other_file, other_names in results[1:]:
+        np.testing.assert_array_equal(other_demand, demand)
+        assert (other_file, other_names) == (fleet_file, names)
+    assert not [file for file in os.listdir(cache_path) if file.endswith(".tmp")]
+
+    # A region is the sum of its households
+    n_households = sum(1 for name in get_fleet_demand("household")[2] if name.startswith("USA_AZ"))
+    np.testing.assert_allclose(demand[names.index("USA_AZ")], get_energy_demand_data(k=n_households, region="AZ"),
+                               rtol=1e-6)
+
+
+@pytest.mark.parametrize("wind, wind_generator", [(False, False), (True, False), (False, True)])
+@pytest.mark.parametrize("mode", ["default", "schedule"])
+def test_simulate_sites_matches_env(make_data, wind, wind_generator, mode):
+    environment = make_data(n_hours=96)
+    demand = np.random.default_rng(1).uniform(0, 200, size=(3, 96)).astype(np.float32)
+    dims = get_action_dims(wind, wind_generator)
+    schedule = np.random.default_rng(2).integers(dims, size=(96, len(dims))) if mode == "schedule" else None
+    summary = simulate_sites(demand, environment, actions=schedule, wind=wind, wind_generator=wind_generator)
+
+    for site in range(3):
+        env = MicrogridEnv(dict(environment, energy_demand=demand[site].astype(np.float64)), wind=wind,
+                           wind_generator=wind_generator)
+        env.reset()
+        total_cost, blackout_hours = 0, 0
+        for hour in range(96):
+            _, reward, _, _ = env.step(get_default_action(wind, wind_generator) if schedule is None else schedule[hour])
+            total_cost -= reward
+            blackout_hours += env.microgrid.energy_total < env.microgrid.energy_demand
+        assert summary["total_cost"][site] == total_cost
+        assert summary["blackout_hours"][site] == blackout_hours
+
+
+def test_simulate_fleet_chunks_and_workers(make_data):
+    environment = make_data(n_hours=48)
+    demand = np.random.default_rng(1).uniform(0, 200, size=(10, 48)).astype(np.float32)
+    expected = simulate_sites(demand, environment)
+    for chunk_size, n_workers in [(3, 1), (4, 2)]:
+        summary = simulate_fleet(demand, environment, chunk_size=chunk_size, n_workers=n_workers)
+        for key, value in expected.items():
+            np.testing.assert_array_equal(summary[key], value)
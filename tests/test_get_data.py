@@ -0,0 +1,122 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from src import get_data
+from src.get_data import load_energy_demand_cache, ingest_energy_demand_data, cache_path, household_data_path, \
+    read_csv_column, demand_column, min_household_hours
+
+
+def cache_files():
+    return sorted(os.listdir(cache_path))
+
+
+def test_concurrent_cold_cache(synthetic_data):
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: load_energy_demand_cache(), range(4)))
+
+    matrix, index = results[0]
+    for other_matrix, other_index in results[1:]:
+        np.testing.assert_array_equal(other_matrix, matrix)
+        assert other_index == index
+    # One matrix named by the index, no temporary files left behind
+    assert cache_files() == sorted([index["matrix_file"], "household_demand.json", "household_demand.lock"])
+
+
+def test_rebuild_replaces_matrix(synthetic_data):
+    _, index = load_energy_demand_cache()
+    household_file = os.path.join(household_data_path, index["files"][0])
+    os.utime(household_file, ns=(0, 0))  # modification time changes the fingerprint
+
+    matrix, new_index = load_energy_demand_cache()
+    assert new_index["matrix_file"] != index["matrix_file"]
+    assert index["matrix_file"] not in cache_files()
+    assert matrix.shape == (len(new_index["files"]), max(new_index["lengths"]))
+    _, ingested_index = ingest_energy_demand_data()
+    assert ingested_index["matrix_file"] == new_index["matrix_file"]
+
+
+def test_memo_eviction_skips_locked_entries(synthetic_data):
+    get_data.clear_memo()
+    get_data.load_data_arrays(k=2, region="AZ")
+    get_data.clear_memo()
+    (memo_file,) = [file for file in os.listdir(get_data.memo_path) if file.endswith(".npz")]
+    memo_file = os.path.join(get_data.memo_path, memo_file)
+
+    # Another process is loading the entry, the eviction must not delete it
+    with get_data.file_lock(memo_file + ".lock"):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(get_data.evict_memo, max_bytes=0).result()
+        assert os.path.exists(memo_file)
+    get_data.evict_memo(max_bytes=0)
+    assert not os.path.exists(memo_file)
+    assert not os.path.exists(memo_file + ".lock")
+
+
+def test_memo_eviction_removes_stale_locks(synthetic_data):
+    os.makedirs(get_data.memo_path, exist_ok=True)
+    stale_lock, held_lock = (os.path.join(get_data.memo_path, f"{key}.npz.lock") for key in ["stale", "held"])
+    open(stale_lock, "w").close()  # left behind by an entry that was evicted
+    with get_data.file_lock(held_lock):  # another process is about to write the entry
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(get_data.evict_memo).result()
+        assert os.path.exists(held_lock)
+    assert not os.path.exists(stale_lock)
+
+
+def test_rebuild_evicts_fleet_matrices(synthetic_data):
+    from src.fleet import get_fleet_demand
+
+    _, region_file, _ = get_fleet_demand("region")
+    _, household_file, _ = get_fleet_demand("household")
+    _, index = load_energy_demand_cache()
+    household_file_0 = os.path.join(household_data_path, index["files"][0])
+    mtime = os.stat(household_file_0).st_mtime_ns + 10 ** 9  # the synthetic data is shared by all tests
+    os.utime(household_file_0, ns=(mtime, mtime))
+
+    # The household matrix is being built by another process while the cache is rebuilt
+    with get_data.file_lock(household_file + ".lock"):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(load_energy_demand_cache).result()
+        assert os.path.exists(household_file)
+    assert not os.path.exists(region_file) and not os.path.exists(region_file + ".lock")
+    _, new_region_file, _ = get_fleet_demand("region")
+    assert new_region_file != region_file
+
+
+@pytest.mark.parametrize("n_workers, processes", [(1, False), (2, False), (4, False), (2, True)])
+def test_read_household_demand_stops_after_k(monkeypatch, tmp_path, n_workers, processes):
+    from benchmarks.synthetic_data import write_csv
+
+    # Short profiles first, then the qualifying ones
+    rng = np.random.default_rng(0)
+    files = []
+    for i, n_hours in enumerate([100] * 5 + [min_household_hours] * 12):
+        files.append(f"household_{i:02d}.csv")
+        write_csv(str(tmp_path / files[-1]), ["Date/Time", demand_column], [rng.uniform(0, 5, n_hours)])
+
+    # Sequential reference: read the files one after another until k qualify
+    k, expected = 3, []
+    for file in files:
+        expected.append((file, read_csv_column(str(tmp_path / file), demand_column)[0]))
+        if sum(len(demand) >= min_household_hours for _, demand in expected) == k:
+            break
+
+    read_files = []
+    if not processes:
+        def recording_read_csv_column(path, column, dtype=np.float64):
+            read_files.append(os.path.basename(path))
+            return read_csv_column(path, column, dtype)
+        monkeypatch.setattr(get_data, "read_csv_column", recording_read_csv_column)
+    household_demand, timings = get_data.read_household_demand(files, data_path=str(tmp_path), k=k,
+                                                                n_workers=n_workers, processes=processes)
+    assert [file for file, _ in household_demand] == [file for file, _ in expected]
+    for (_, demand), (_, expected_demand) in zip(household_demand, expected):
+        np.testing.assert_array_equal(demand, expected_demand)
+    assert list(timings) == [file for file, _ in expected]
+    # Besides the selected files, at most the bounded window of 2 * n_workers files in flight is read
+    if not processes:
+        assert set(read_files) <= set(files[:len(expected) - 1 + 2 * n_workers])
+        assert files[-1] not in read_files
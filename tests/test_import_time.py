@@ -0,0 +1,11 @@
+import pytest
+
+from benchmarks.bench import bench_import_time, import_budgets, heavy_modules
+
+
+@pytest.mark.parametrize("module", sorted(import_budgets))
+def test_import_time_budget(module):
+    results = bench_import_time(repeat=3, modules=[module])
+    name = module.replace(".", "_")
+    assert results[f"import_{name}_heavy_modules"]["value"] == 0, f"{module} loads one of {heavy_modules}"
+    assert results[f"import_{name}"]["value"] <= import_budgets[module]
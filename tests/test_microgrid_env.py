@@ -0,0 +1,51 @@
+import numpy as np
+from stable_baselines3.common.vec_env import DummyVecEnv
+
+from src.microgrid_env import MicrogridEnv
+
+
+def test_observations_are_not_shared(data_dict):
+    env = MicrogridEnv(data_dict)
+    first = env.reset()
+    second, _, _, _ = env.step(env.action_space.sample())
+    assert not np.shares_memory(first, second)
+    assert second[0] == data_dict["solar_irradiance"][0]
+    assert first[0] != second[0]
+
+
+def test_dummy_vec_env_terminal_observation(data_dict):
+    episode_length = 10
+    vec_env = DummyVecEnv([lambda: MicrogridEnv(data_dict, episode_length=episode_length, start_mode="strided")])
+    vec_env.reset()
+    vec_env.action_space.seed(0)
+    for episode in range(2):
+        for _ in range(episode_length):
+            _, _, dones, infos = vec_env.step(np.array([vec_env.action_space.sample()]))
+        assert dones[0]
+        assert infos[0]["TimeLimit.truncated"]
+
+        # The terminal observation holds the data of the last hour of the window, not the reset observation
+        last_hour = (episode + 1) * episode_length - 1
+        terminal_observation = infos[0]["terminal_observation"]
+        assert terminal_observation[0] == data_dict["solar_irradiance"][last_hour]
+        assert terminal_observation[2] == data_dict["rate_consumption_charge"][last_hour]
+        assert terminal_observation[3] == data_dict["energy_demand"][last_hour]
+
+
+def test_profiled_step_matches_step(data_dict):
+    plain = MicrogridEnv(data_dict, episode_length=24)
+    profiled = MicrogridEnv(data_dict, episode_length=24)
+    profiler = profiled.enable_profiling()
+    plain.reset()
+    profiled.reset()
+    rng = np.random.default_rng(0)
+    for _ in range(48):
+        action = rng.integers(plain.action_space.nvec)
+        observation, reward, done, info = plain.step(action)
+        profiled_observation, profiled_reward, profiled_done, profiled_info = profiled.step(action)
+        np.testing.assert_array_equal(observation, profiled_observation)
+        assert (reward, done, info) == (profiled_reward, profiled_done, profiled_info)
+        if done:
+            plain.reset()
+            profiled.reset()
+    assert profiler.counters == {"steps": 48, "episodes": 2}
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from src.microgrid_vec_env import MicrogridVecEnv
+from src.params import soc_min
+
+
+def test_get_set_attr_honor_indices(data_dict):
+    vec_env = MicrogridVecEnv(data_dict, n_envs=4, episode_length=12)
+    vec_env.reset()
+    assert vec_env.get_attr("episode_length") == [12] * 4
+    assert vec_env.get_attr("start_offsets", indices=[1, 3]) == [18, 54]
+    assert len(vec_env.get_attr("soc", indices=2)) == 1
+
+    vec_env.set_attr("soc", 200.0, indices=[0, 2])
+    np.testing.assert_array_equal(vec_env.get_attr("soc"), [200.0, soc_min, 200.0, soc_min])
+
+    vec_env.set_attr("episode_length", 6)
+    assert vec_env.episode_length == 6
+    with pytest.raises(Exception):
+        vec_env.set_attr("episode_length", 3, indices=[0])
+
+
+def test_env_method_reset_selected_envs(data_dict):
+    vec_env = MicrogridVecEnv(data_dict, n_envs=3, episode_length=12)
+    vec_env.reset()
+    vec_env.step(np.array([vec_env.action_space.sample() for _ in range(3)]))
+    observations = vec_env.env_method("reset", indices=[1])
+    assert len(observations) == 1
+    np.testing.assert_array_equal(vec_env.step_count, [1, 0, 1])
+    assert len(vec_env.env_method("reset")) == 3
+
+
+def test_infos_are_new_every_step(data_dict):
+    vec_env = MicrogridVecEnv(data_dict, n_envs=2, episode_length=2)
+    vec_env.reset()
+    actions = np.zeros((2, len(vec_env.action_space.nvec)), dtype=np.int64)
+    _, _, _, first_infos = vec_env.step(actions)
+    _, _, dones, second_infos = vec_env.step(actions)
+    assert dones.all() and "terminal_observation" in second_infos[0]
+    assert first_infos == [{}, {}]
+    _, _, _, third_infos = vec_env.step(actions)
+    assert "terminal_observation" in second_infos[0] and third_infos == [{}, {}]
+
+
+def test_seed_is_applied_on_reset(data_dict):
+    def start_offsets(seed):
+        vec_env = MicrogridVecEnv(data_dict, n_envs=4, start_mode="random", initial_soc="random")
+        vec_env.seed(seed)
+        return np.concatenate([vec_env.reset()[:, 4], vec_env.start_offsets])
+
+    np.testing.assert_array_equal(start_offsets(1), start_offsets(1))
+    assert not np.array_equal(start_offsets(1), start_offsets(2))
+
+
+@pytest.mark.parametrize("episode_length", [12, None], ids=["truncated", "full"])
+def test_matches_dummy_vec_env(data_dict, episode_length):
+    from stable_baselines3.common.vec_env import DummyVecEnv
+    from src.microgrid_env import MicrogridEnv
+
+    start_offsets = [0, 24, 60]
+    vec_env = MicrogridVecEnv(data_dict, n_envs=3, episode_length=episode_length, start_offsets=start_offsets)
+    dummy_vec_env = DummyVecEnv([lambda offset=offset: MicrogridEnv(data_dict, episode_length=episode_length,
+                                                                    start_offset=offset)
+                                 for offset in start_offsets])
+    np.testing.assert_allclose(vec_env.reset(), dummy_vec_env.reset(), rtol=1e-12)
+    rng = np.random.default_rng(0)
+    n_episodes = 0
+    n_steps = 2 * len(data_dict["wind_speed"]) + 5 if episode_length is None else 3 * episode_length + 5
+    for _ in range(n_steps):
+        actions = rng.integers(vec_env.action_space.nvec, size=(3, len(vec_env.action_space.nvec)))
+        observations, rewards, dones, infos = vec_env.step(actions)
+        dummy_observations, dummy_rewards, dummy_dones, dummy_infos = dummy_vec_env.step(actions)
+        np.testing.assert_allclose(observations, dummy_observations, rtol=1e-12)
+        np.testing.assert_allclose(rewards, dummy_rewards, rtol=1e-6)  # DummyVecEnv stores float32 rewards
+        np.testing.assert_array_equal(dones, dummy_dones)
+        n_episodes += dones.sum()
+        for info, dummy_info in zip(infos, dummy_infos):
+            assert info.get("TimeLimit.truncated", False) == dummy_info.get("TimeLimit.truncated", False)
+            assert ("terminal_observation" in info) == ("terminal_observation" in dummy_info)
+            if "terminal_observation" in info:
+                assert info["TimeLimit.truncated"] == (episode_length is not None)
+                np.testing.assert_allclose(info["terminal_observation"], dummy_info["terminal_observation"],
+                                           rtol=1e-12)
+    assert n_episodes == 3 * (2 if episode_length is None else 3)
@@ -0,0 +1,56 @@
+import time
+
+import numpy as np
+import pytest
+
+from src.evaluate import evaluate_policy
+from src.fleet import get_default_action
+from src.mpc import MPCController
+from src.env_layout import get_action_dims
+
+
+class FixedPolicy(object):
+    """The same action in every hour, see get_default_action"""
+
+    def __init__(self, wind=False, wind_generator=True):
+        self.action = get_default_action(wind, wind_generator)
+
+    def predict(self, observation, deterministic=True):
+        return np.tile(self.action, (len(observation), 1)), None
+
+
+@pytest.mark.parametrize("wind, wind_generator", [(False, False), (True, False), (False, True)])
+def test_predict_returns_valid_actions(data_dict, wind, wind_generator):
+    controller = MPCController(data_dict, horizon=6, beam_width=4, wind=wind, wind_generator=wind_generator,
+                               start_offsets=[0, 10, 20])
+    observations = np.tile([0.1, 40, 0.6, 34, 15], (3, 1))
+    nvec = get_action_dims(wind, wind_generator)
+    for _ in range(3):
+        actions, state = controller.predict(observations)
+        assert actions.shape == (3, len(nvec)) and state is None
+        assert ((actions >= 0) & (actions < nvec)).all()
+    assert controller.predict(observations[0], episode_start=True)[0].shape == (len(nvec),)
+
+
+def test_time_budget_bounds_the_decision_time(data_dict):
+    observations = np.tile([0.1, 40, 0.6, 34, 15], (4, 1))
+    unbounded = MPCController(data_dict, horizon=48, start_offsets=[0, 6, 12, 18])
+    start = time.perf_counter()
+    unbounded.predict(observations)
+    unbounded_time = time.perf_counter() - start
+
+    # The budget is checked after every hour of the horizon, so a call may exceed it by one hour of the search
+    time_budget = unbounded_time / 10
+    bounded = MPCController(data_dict, horizon=48, start_offsets=[0, 6, 12, 18], time_budget=time_budget)
+    start = time.perf_counter()
+    bounded.predict(observations)
+    assert time.perf_counter() - start < time_budget + unbounded_time / 4
+
+
+def test_evaluate_beats_fixed_action(make_data):
+    test_dicts = [make_data(n_hours=48, seed=seed) for seed in (1, 2)]
+    controller = MPCController.for_test_dicts(test_dicts, horizon=12)
+    mpc_results = evaluate_policy(controller, test_dicts)
+    fixed_results = evaluate_policy(FixedPolicy(), test_dicts)
+    assert mpc_results["total_cost"] < fixed_results["total_cost"]
+    assert (mpc_results["reward"].sum(axis=1) > fixed_results["reward"].sum(axis=1)).all()
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from src.numpy_policy import NumpyPolicy, export_policy
+from src.env_layout import observation_low, observation_high
+
+
+def sample_observations(n, seed=0):
+    return np.random.default_rng(seed).uniform(observation_low, observation_high, size=(n, len(observation_low)))
+
+
+@pytest.mark.parametrize("activation", ["Tanh", "ReLU"])
+def test_predict_matches_sb3(tmp_path, data_dict, activation):
+    import torch
+    from stable_baselines3 import PPO
+    from src.microgrid_env import MicrogridEnv
+
+    model = PPO("MlpPolicy", MicrogridEnv(data_dict), n_steps=64, batch_size=32, n_epochs=1, seed=0, device="cpu",
+                policy_kwargs={"activation_fn": getattr(torch.nn, activation)})
+    model.learn(total_timesteps=64)
+    export_policy(model, tmp_path / "policy.npz")
+    policy = NumpyPolicy.load(tmp_path / "policy.npz")
+
+    observations = sample_observations(256)
+    np.testing.assert_array_equal(policy.predict(observations)[0], model.predict(observations, deterministic=True)[0])
+    np.testing.assert_array_equal(policy.predict(observations[0])[0],
+                                  model.predict(observations[0], deterministic=True)[0])
+
+
+def test_predict_normalizes_like_vec_normalize_observation(tmp_path, data_dict):
+    from stable_baselines3 import PPO
+    from src.microgrid_vec_env import MicrogridVecEnv
+    from src.utils import VecNormalizeObservation
+
+    vec_env = VecNormalizeObservation(MicrogridVecEnv(data_dict, n_envs=4))
+    model = PPO("MlpPolicy", vec_env, n_steps=16, batch_size=32, n_epochs=1, seed=0, device="cpu")
+    model.learn(total_timesteps=64)
+    export_policy(model, tmp_path / "policy.npz", obs_rms=vec_env.obs_rms)
+    policy = NumpyPolicy.load(tmp_path / "policy.npz")
+
+    observations = sample_observations(256)
+    expected = model.predict(vec_env.obs_rms.normalize(observations, vec_env.epsilon), deterministic=True)[0]
+    np.testing.assert_array_equal(policy.predict(observations)[0], expected)
@@ -0,0 +1,77 @@
+import json
+import os
+
+import pytest
+
+from src import results_store
+from src.results_store import ResultsStore
+
+
+@pytest.fixture
+def output_dir(tmp_path, monkeypatch):
+    for name in ["config_path", "logs_path", "train_data_path"]:
+        path = tmp_path / name
+        path.mkdir()
+        monkeypatch.setattr(results_store, name, str(path))
+    return tmp_path
+
+
+def write_progress(output_dir, run_name, steps):
+    os.makedirs(output_dir / "logs_path" / run_name, exist_ok=True)
+    with open(output_dir / "logs_path" / run_name / "progress.json", "a") as file:
+        for step in steps:
+            file.write(json.dumps({"time/total_timesteps": step, "rollout/ep_rew_mean": -step}) + "\n")
+
+
+def test_short_source_that_grows_is_appended(output_dir):
+    store = ResultsStore(str(output_dir / "results"), file_format="npz")
+    write_progress(output_dir, "run", [1, 2])  # shorter than the hashed head
+    assert store.sync(["run"])["run"]["metrics"] == 2
+    write_progress(output_dir, "run", range(3, 20))
+    assert store.sync(["run"])["run"]["metrics"] == 17
+
+    rows = store.read("metrics", ["run"], as_frame=False)
+    assert list(rows["time/total_timesteps"]) == list(range(1, 20))
+    assert len(store.index["runs"]["run"]["tables"]["metrics"]["parts"]) == 2
+
+
+def test_rewritten_source_is_rebuilt(output_dir):
+    store = ResultsStore(str(output_dir / "results"), file_format="npz")
+    write_progress(output_dir, "run", range(1, 20))
+    store.sync(["run"])
+    os.remove(output_dir / "logs_path" / "run" / "progress.json")
+    write_progress(output_dir, "run", range(100, 103))
+    store.sync(["run"])
+    assert list(store.read("metrics", ["run"], as_frame=False)["time/total_timesteps"]) == [100, 101, 102]
+
+
+def test_concurrent_stores_keep_each_others_runs(output_dir):
+    path = str(output_dir / "results")
+    notebook, sweep = ResultsStore(path, file_format="npz"), ResultsStore(path, file_format="npz")
+    write_progress(output_dir, "first", [1, 2])
+    write_progress(output_dir, "second", [1, 2, 3])
+    notebook.sync(["first"])
+    sweep.sync(["second"])  # was created before the first sync, its index in memory is outdated
+
+    store = ResultsStore(path, file_format="npz")
+    assert store.cursor("metrics") == {"first": 2, "second": 3}
+    assert not [file for file in os.listdir(path) if file.endswith(".tmp")]
+
+
+def test_telemetry_csv_with_numpy_scalar_reprs(output_dir):
+    # Rows rendered through the batched backend hold numpy 2 scalars in the nested dict columns
+    with open(output_dir / "train_data_path" / "run.csv", "w") as file:
+        file.write(',reward,purchase_energy,actions_adjusting_status\n'
+                   '0,-1.5,"{\'load\': 2.0, \'battery\': 0.5}","{\'solar\': 1, \'wind\': 0, \'generator\': 1}"\n'
+                   '1,-2.5,"{\'load\': np.float64(3.0), \'battery\': np.float32(0.25)}",'
+                   '"{\'solar\': np.int64(0), \'wind\': np.True_, \'generator\': np.int64(1)}"\n')
+    store = ResultsStore(str(output_dir / "results"), file_format="npz")
+    assert store.sync(["run"])["run"]["telemetry"] == 2
+
+    rows = store.read("telemetry", ["run"], as_frame=False)
+    assert list(rows["reward"]) == [-1.5, -2.5]
+    assert list(rows["purchase_energy_load"]) == [2.0, 3.0]
+    assert list(rows["purchase_energy_battery"]) == [0.5, 0.25]
+    assert list(rows["adjusting_status_solar"]) == [1, 0]
+    assert list(rows["adjusting_status_wind"]) == [0, 1]
+    assert list(rows["adjusting_status_generator"]) == [1, 1]
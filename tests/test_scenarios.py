@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from src.scenarios import ScenarioGenerator
+
+
+@pytest.fixture
+def generator(make_data):
+    return ScenarioGenerator(make_data(n_hours=14 * 24), block_length=7 * 24)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 24, 50, 168])
+def test_stream_is_independent_of_chunk_size(generator, chunk_size):
+    expected = generator.get_scenario(seed=3, n_hours=400)
+    chunks = list(generator.stream(seed=3, chunk_size=chunk_size, n_hours=400))
+    assert [len(chunk["wind_speed"]) for chunk in chunks[:-1]] == [chunk_size] * (len(chunks) - 1)
+    for key, value in expected.items():
+        np.testing.assert_array_equal(np.concatenate([chunk[key] for chunk in chunks]), value)
+
+
+def test_endless_stream_matches_scenario(generator):
+    expected = generator.get_scenario(seed=3, n_hours=200)
+    stream = generator.stream(seed=3, chunk_size=40)
+    chunks = [next(stream) for _ in range(5)]
+    for key, value in expected.items():
+        np.testing.assert_array_equal(np.concatenate([chunk[key] for chunk in chunks]), value)
+
+
+def test_seeds_give_different_scenarios(generator):
+    first, second = generator.get_scenarios([1, 2], n_hours=200)
+    np.testing.assert_array_equal(generator.get_scenario(1, n_hours=200)["energy_demand"], first["energy_demand"])
+    assert not np.array_equal(first["energy_demand"], second["energy_demand"])
+    # Prices are copied from the data without noise
+    assert np.isin(first["rate_consumption_charge"], generator.data_dict["rate_consumption_charge"]).all()
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from src.microgrid_vec_env import MicrogridVecEnv
+from src.shared_memory_vec_env import SharedMemoryVecEnv
+
+
+@pytest.fixture
+def shared_env(data_dict):
+    vec_env = SharedMemoryVecEnv(data_dict, n_envs=4, n_workers=2, episode_length=12)
+    yield vec_env
+    vec_env.close()
+
+
+def test_matches_microgrid_vec_env(data_dict, shared_env):
+    vec_env = MicrogridVecEnv(data_dict, n_envs=4, episode_length=12)
+    np.testing.assert_array_equal(shared_env.reset(), vec_env.reset())
+    rng = np.random.default_rng(0)
+    kept_infos = []
+    for _ in range(30):
+        actions = rng.integers(vec_env.action_space.nvec, size=(4, len(vec_env.action_space.nvec)))
+        obs, rewards, dones, infos = shared_env.step(actions)
+        expected_obs, expected_rewards, expected_dones, expected_infos = vec_env.step(actions)
+        np.testing.assert_array_equal(obs, expected_obs)
+        np.testing.assert_array_equal(rewards, expected_rewards)
+        np.testing.assert_array_equal(dones, expected_dones)
+        for info, expected_info in zip(infos, expected_infos):
+            assert info.keys() == expected_info.keys()
+        kept_infos.append(infos)
+    # Infos of earlier steps are not overwritten
+    assert "terminal_observation" in kept_infos[11][0] and kept_infos[12][0] == {}
+
+
+def test_attributes_and_methods_per_env(shared_env):
+    shared_env.reset()
+    assert shared_env.get_attr("start_offsets") == [0, 18, 36, 54]
+    assert shared_env.get_attr("episode_length", indices=[3]) == [12]
+    shared_env.set_attr("soc", 200.0, indices=[1, 2])
+    assert shared_env.get_attr("soc", indices=[0, 1, 2]) == [shared_env.get_attr("soc")[0], 200.0, 200.0]
+    assert len(shared_env.env_method("reset", indices=[2, 3])) == 2
+    with pytest.raises(Exception):
+        shared_env.set_attr("episode_length", 3, indices=[0])
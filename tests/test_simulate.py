@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import src.simulate
+from src.simulate import simulate, _soc_recurrence_numpy
+from src.microgrid_env import MicrogridEnv
+from src.env_layout import get_action_dims
+
+
+def run_env(actions, data_dict, **kwargs):
+    """Per-hour cost, SOC and blackout of a new MicrogridEnv stepped through one action trace"""
+    env = MicrogridEnv(data_dict, **kwargs)
+    env.reset()
+    cost, soc, blackout = [], [], []
+    for action in actions:
+        _, reward, _, _ = env.step(action)
+        cost.append(-reward)
+        soc.append(env.microgrid.soc)
+        blackout.append(env.microgrid.energy_total < env.microgrid.energy_demand)
+    return np.array(cost), np.array(soc), np.array(blackout)
+
+
+@pytest.mark.parametrize("wind, wind_generator", [(False, False), (True, False), (False, True)])
+@pytest.mark.parametrize("alternative_cost", [False, True])
+@pytest.mark.parametrize("n_traces", [1, 8], ids=["python", "numpy"])
+def test_fallbacks_match_env(monkeypatch, data_dict, wind, wind_generator, alternative_cost, n_traces):
+    # Without Numba fewer than 8 traces run in the Python loop, more in the vectorized NumPy recurrence
+    monkeypatch.setattr(src.simulate, "njit", None)
+    if hasattr(src.simulate._soc_recurrence, "py_func"):
+        monkeypatch.setattr(src.simulate, "_soc_recurrence", src.simulate._soc_recurrence.py_func)
+    dims = get_action_dims(wind, wind_generator)
+    actions = np.random.default_rng(1).integers(dims, size=(n_traces, 72, len(dims)))
+    results = simulate(actions, data_dict, wind=wind, wind_generator=wind_generator,
+                       alternative_cost=alternative_cost)
+
+    for trace in range(n_traces):
+        cost, soc, blackout = run_env(actions[trace], data_dict, wind=wind, wind_generator=wind_generator,
+                                      alternative_cost=alternative_cost)
+        np.testing.assert_allclose(results["cost"][trace], cost, rtol=1e-12)
+        np.testing.assert_allclose(results["soc"][trace], soc, rtol=1e-12)
+        np.testing.assert_array_equal(results["blackout"][trace], blackout)
+        assert results["total_cost"][trace] == pytest.approx(cost.sum(), rel=1e-12)
+
+
+def test_compiled_recurrence_matches_numpy(monkeypatch, data_dict):
+    pytest.importorskip("numba")
+    dims = get_action_dims(False, True)
+    actions = np.random.default_rng(1).integers(dims, size=(16, 72, len(dims)))
+    compiled = simulate(actions, data_dict)
+    monkeypatch.setattr(src.simulate, "_soc_recurrence", _soc_recurrence_numpy)
+    fallback = simulate(actions, data_dict)
+    for key in ["cost", "soc", "total_cost"]:
+        np.testing.assert_allclose(compiled[key], fallback[key], rtol=1e-12)
+    np.testing.assert_array_equal(compiled["blackout"], fallback["blackout"])
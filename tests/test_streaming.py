@@ -0,0 +1,95 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.microgrid_env import MicrogridEnv
+from src.streaming import StreamingMicrogridEnv, replay_source, tail_source, data_keys
+
+
+def write_csv(path, data_dict, n_hours, delay=0.002):
+    # Appends one row per hour, the first half of every row is written before the rest to test partial lines
+    with open(path, "w", newline="") as file:
+        file.write(",".join(data_keys) + "\n")
+        file.flush()
+        for hour in range(n_hours):
+            row = ",".join(repr(float(data_dict[key][hour])) for key in data_keys) + "\n"
+            file.write(row[:len(row) // 2])
+            file.flush()
+            time.sleep(delay)
+            file.write(row[len(row) // 2:])
+            file.flush()
+
+
+@pytest.mark.parametrize("source", ["replay", "tail"])
+def test_matches_strided_microgrid_env(tmp_path, data_dict, source):
+    n_steps, episode_length = 35, 10
+    if source == "tail":
+        path = tmp_path / "readings.csv"
+        writer = threading.Thread(target=write_csv, args=(path, data_dict, n_steps))
+        writer.start()
+        readings = tail_source(path, poll_interval=0.001, timeout=5)
+    else:
+        readings = replay_source(data_dict)
+    env = StreamingMicrogridEnv(readings, capacity=16, episode_length=episode_length)
+    reference = MicrogridEnv(data_dict, episode_length=episode_length, start_mode="strided")
+
+    np.testing.assert_array_equal(env.reset(), reference.reset())
+    rng = np.random.default_rng(0)
+    n_episodes = 0
+    for _ in range(n_steps):
+        action = rng.integers(env.action_space.nvec)
+        observation, reward, done, info = env.step(action)
+        reference_observation, reference_reward, reference_done, reference_info = reference.step(action)
+        np.testing.assert_array_equal(observation, reference_observation)
+        assert (reward, done, info) == (reference_reward, reference_done, reference_info)
+        if done:
+            n_episodes += 1
+            np.testing.assert_array_equal(env.reset(), reference.reset())
+    assert n_episodes == 3
+    if source == "tail":
+        writer.join()
+
+
+def test_feed_does_not_overwrite_unconsumed_readings(data_dict):
+    env = StreamingMicrogridEnv(capacity=4)
+    readings = list(replay_source(data_dict, n_hours=6))
+    for reading in readings[:4]:
+        env.feed(reading)
+    with pytest.raises(Exception):
+        env.feed(readings[4])
+
+    env.reset()
+    env.step(env.action_space.sample())
+    np.testing.assert_array_equal(env.get_history()["wind_speed"], data_dict["wind_speed"][:1])
+    # The consumed reading of hour 0 is overwritten, the unconsumed ones are not
+    env.feed(readings[4])
+    with pytest.raises(Exception):
+        env.feed(readings[5])
+    assert len(env.get_history()["wind_speed"]) == 0
+
+
+def test_source_exhaustion(data_dict):
+    env = StreamingMicrogridEnv(replay_source(data_dict, n_hours=5), capacity=8)
+    env.reset()
+    for _ in range(5):
+        env.step(env.action_space.sample())
+    with pytest.raises(Exception, match="ended"):
+        env.step(env.action_space.sample())
+
+    env = StreamingMicrogridEnv(capacity=8)
+    env.reset()
+    with pytest.raises(Exception, match="feed"):
+        env.step(env.action_space.sample())
+
+
+def test_history_after_the_ring_wraps(data_dict):
+    env = StreamingMicrogridEnv(replay_source(data_dict), capacity=8)
+    env.reset()
+    for _ in range(20):
+        env.step(env.action_space.sample())
+    history = env.get_history()
+    for key in data_keys:
+        np.testing.assert_array_equal(history[key], data_dict[key][12:20])
+    np.testing.assert_array_equal(env.get_history(3)["energy_demand"], data_dict["energy_demand"][17:20])
@@ -0,0 +1,89 @@
+import glob
+import json
+import os
+
+import pytest
+
+from src.get_data import atomic_file
+from src.sweep import expand_grid, run_sweep, save_model, is_trained, get_model_file, get_evaluation_file, \
+    get_run_name
+
+
+def stub_train(config_file):
+    # Records the training and writes a model like train_run, in the worker process
+    run_name = get_run_name(config_file)
+    with open(os.path.join("output", "trained.txt"), "a") as file:
+        file.write(run_name + "\n")
+    os.makedirs("output/models", exist_ok=True)
+    with atomic_file(get_model_file(run_name)) as tmp_file:
+        with open(tmp_file, "w") as file:
+            file.write(run_name)
+
+
+def stub_evaluate(run_name, seeds=(123,)):
+    summary = {"total_cost": float(len(run_name)), "seeds": list(seeds)}
+    os.makedirs(os.path.dirname(get_evaluation_file(run_name)), exist_ok=True)
+    with open(get_evaluation_file(run_name), "w") as file:
+        json.dump(summary, file)
+    return summary
+
+
+def get_trained():
+    with open(os.path.join("output", "trained.txt"), "r") as file:
+        return sorted(file.read().split())
+
+
+@pytest.fixture
+def output_dir(monkeypatch, tmp_path):
+    # The paths of src.sweep are relative, the spawned workers inherit the working directory
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("output/configs")
+    with open("output/configs/config_ppo_q2.json", "w") as file:
+        json.dump({"save_name": "ppo_q2", "ent_coef": 0, "total_timesteps": 100}, file)
+    return tmp_path
+
+
+def test_expand_grid(output_dir):
+    config_files = expand_grid("output/configs/config_ppo_q2.json", {"ent_coef": [0.01, 0.1], "seed": [1]})
+    assert [os.path.basename(file) for file in config_files] == ["config_ppo_q2_ent_coef=0.01_seed=1.json",
+                                                               "config_ppo_q2_ent_coef=0.1_seed=1.json"]
+    with open(config_files[1], "r") as file:
+        config = json.load(file)
+    assert config == {"save_name": "ppo_q2_ent_coef=0.1_seed=1", "ent_coef": 0.1, "total_timesteps": 100,
+                      "seed": 1}
+    assert len(glob.glob("output/configs/config_*.json")) == 3
+
+
+def test_run_sweep_resumes(output_dir):
+    expand_grid("output/configs/config_ppo_q2.json", {"ent_coef": [0.01, 0.1]})
+    # ppo_q2 is complete, ppo_q2_ent_coef=0.01 is trained but not evaluated
+    stub_train("output/configs/config_ppo_q2.json")
+    stub_evaluate("ppo_q2")
+    stub_train("output/configs/config_ppo_q2_ent_coef=0.01.json")
+    os.remove("output/trained.txt")
+
+    kwargs = dict(n_jobs=2, pin_cpus=False, seeds=(1, 2), train_function=stub_train, evaluate_function=stub_evaluate)
+    summaries = run_sweep(**kwargs)
+    assert sorted(summaries) == ["ppo_q2_ent_coef=0.01", "ppo_q2_ent_coef=0.1"]
+    assert summaries["ppo_q2_ent_coef=0.1"] == {"total_cost": 19.0, "seeds": [1, 2]}
+    assert get_trained() == ["ppo_q2_ent_coef=0.1"]
+
+    assert run_sweep(**kwargs) == {}
+    assert get_trained() == ["ppo_q2_ent_coef=0.1"]
+
+    summaries = run_sweep(["output/configs/config_ppo_q2.json"], resume=False, evaluate=False, **kwargs)
+    assert summaries == {"ppo_q2": None}
+    assert get_trained() == ["ppo_q2", "ppo_q2_ent_coef=0.1"]
+
+
+def test_interrupted_save_is_not_trained(output_dir):
+    class CrashingModel(object):
+        def save(self, path):
+            with open(path, "w") as file:
+                file.write("partial")
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        save_model(CrashingModel(), "ppo_q2")
+    assert not is_trained("ppo_q2")
+    assert os.listdir("output/models") == []
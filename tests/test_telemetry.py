@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from src.microgrid_env import MicrogridEnv
+from src.telemetry import TelemetryRecorder, telemetry_columns
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_telemetry_matches_render(data_dict, batched):
+    recorder = TelemetryRecorder(sample_interval=1, capacity=100)
+    env = MicrogridEnv(data_dict, batched=batched, telemetry=recorder)
+    env.reset()
+    rng = np.random.default_rng(0)
+    rendered = []
+    for _ in range(24):
+        env.step(rng.integers(env.action_space.nvec))
+        rendered.append(env.render())
+
+    columns = recorder.get_columns()
+    assert list(columns) == telemetry_columns
+    # Columns recorded from the values of the step equal the ones render computes afterwards
+    for key in ["reward", "operational_cost", "purchased_energy_cost", "sell_back_revenue", "energy_demand", "soc"]:
+        np.testing.assert_allclose(columns[key], [info[key] for info in rendered])
+    np.testing.assert_array_equal(columns["purchase_energy_load"],
+                                  [info["purchase_energy"]["load"] for info in rendered])
@@ -0,0 +1,112 @@
+import json
+
+import numpy as np
+import pytest
+
+from src.utils import RunningMeanStd, VecNormalizeObservation, get_obs_rms_path
+from src.microgrid_vec_env import MicrogridVecEnv
+
+
+@pytest.fixture
+def batch():
+    return np.random.default_rng(0).normal(loc=[1, 20, 0.5, 100, 200], scale=[1, 5, 0.1, 30, 50], size=(1000, 5))
+
+
+def test_merged_statistics_match_concatenated_batch(batch):
+    workers = [RunningMeanStd(epsilon=0, shape=(5,)) for _ in range(3)]
+    for rms, part in zip(workers, np.array_split(batch, [100, 101])):
+        rms.update(part)
+    merged = workers[0].merge(workers[1]).merge(workers[2])
+    np.testing.assert_allclose(merged.mean, batch.mean(axis=0), rtol=1e-12)
+    np.testing.assert_allclose(merged.var, batch.var(axis=0), rtol=1e-12)
+    assert merged.count == len(batch)
+
+
+def test_single_updates_match_batch_update(batch):
+    single, batched = RunningMeanStd(shape=(5,)), RunningMeanStd(shape=(5,))
+    for x in batch:
+        single.update_single(x)
+    batched.update(batch)
+    np.testing.assert_allclose(single.mean, batched.mean, rtol=1e-10)
+    np.testing.assert_allclose(single.var, batched.var, rtol=1e-10)
+    assert single.count == pytest.approx(batched.count)
+
+
+def test_frozen_statistics_do_not_change(batch):
+    rms = RunningMeanStd(shape=(5,))
+    rms.update(batch[:10])
+    rms.freeze()
+    mean, var, count = rms.mean.copy(), rms.var.copy(), rms.count
+    rms.update(batch)
+    rms.update(batch[:1])
+    rms.update_single(batch[0])
+    rms.merge(RunningMeanStd(shape=(5,)))
+    np.testing.assert_array_equal(rms.mean, mean)
+    np.testing.assert_array_equal(rms.var, var)
+    assert rms.count == count
+    rms.unfreeze()
+    rms.update(batch)
+    assert rms.count > count
+
+
+def test_save_load_round_trip(tmp_path, batch):
+    rms = RunningMeanStd(shape=(5,))
+    rms.update(batch)
+    rms.save(tmp_path / "obs_rms.npz")
+    loaded = RunningMeanStd.load(tmp_path / "obs_rms.npz")
+    np.testing.assert_array_equal(loaded.mean, rms.mean)
+    np.testing.assert_array_equal(loaded.var, rms.var)
+    assert loaded.count == rms.count
+    assert loaded.frozen and not RunningMeanStd.load(tmp_path / "obs_rms.npz", frozen=False).frozen
+
+
+def test_evaluate_config_uses_saved_statistics(monkeypatch, tmp_path, make_data, batch):
+    import src.evaluate
+
+    config_dir, model_dir = tmp_path / "configs", tmp_path / "models"
+    config_dir.mkdir()
+    model_dir.mkdir()
+    with open(config_dir / "config_run.json", "w") as file:
+        json.dump({"nr_households": 10, "region": "CA", "wind": False, "wind_generator": True,
+                   "alternative_cost": False}, file)
+    rms = RunningMeanStd(shape=(5,))
+    rms.update(batch)
+    rms.save(get_obs_rms_path("run", str(model_dir)))
+
+    calls = []
+    monkeypatch.setattr(src.evaluate, "config_path", str(config_dir))
+    monkeypatch.setattr(src.evaluate, "model_path", str(model_dir))
+    monkeypatch.setattr(src.evaluate.PPO, "load", staticmethod(lambda path: path))
+    monkeypatch.setattr(src.evaluate, "get_test_dict", lambda *args, **kwargs: make_data())
+    monkeypatch.setattr(src.evaluate, "evaluate_policy", lambda model, test_dicts, **kwargs: calls.append(kwargs))
+    src.evaluate.evaluate_config("run")
+    np.testing.assert_array_equal(calls[0]["obs_rms"].mean, rms.mean)
+    assert calls[0]["obs_rms"].frozen
+
+    (model_dir / "model_run_obs_rms.npz").unlink()
+    src.evaluate.evaluate_config("run")
+    assert calls[1]["obs_rms"] is None
+
+
+def test_vec_normalize_observation(data_dict):
+    raw = MicrogridVecEnv(data_dict, n_envs=3, episode_length=4)
+    normalized = VecNormalizeObservation(MicrogridVecEnv(data_dict, n_envs=3, episode_length=4))
+    rms = RunningMeanStd(shape=(5,))
+
+    raw_obs = raw.reset()
+    rms.update(raw_obs)
+    np.testing.assert_allclose(normalized.reset(), rms.normalize(raw_obs, 1e-8), rtol=1e-12)
+    rng = np.random.default_rng(0)
+    n_terminal = 0
+    for _ in range(6):
+        actions = rng.integers(raw.action_space.nvec, size=(3, len(raw.action_space.nvec)))
+        raw_obs, _, dones, raw_infos = raw.step(actions)
+        obs, _, _, infos = normalized.step(actions)
+        rms.update(raw_obs)
+        np.testing.assert_allclose(obs, rms.normalize(raw_obs, 1e-8), rtol=1e-12)
+        for info, raw_info in zip(infos, raw_infos):
+            if "terminal_observation" in raw_info:
+                n_terminal += 1
+                np.testing.assert_allclose(info["terminal_observation"],
+                                           rms.normalize(raw_info["terminal_observation"], 1e-8), rtol=1e-12)
+    assert n_terminal == 3 and normalized.obs_rms.count == rms.count